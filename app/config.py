@@ -36,3 +36,145 @@ JWT_SECRET_KEY = os.getenv(
 )
 JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_DAYS = int(os.getenv("ACCESS_TOKEN_EXPIRE_DAYS", "7"))
+
+# Configurações do sistema de recomendação
+# Quantidade de vizinhos pré-calculados por filme na tabela movie_neighbors
+RECOMMENDATION_NEIGHBORS_K = int(os.getenv("RECOMMENDATION_NEIGHBORS_K", "50"))
+
+# Índice aproximado (LSH) usado para gerar candidatos em catálogos grandes.
+# Abaixo de RECOMMENDATION_ANN_MIN_ITEMS filmes a busca é exata (força bruta).
+RECOMMENDATION_ANN_MIN_ITEMS = int(os.getenv("RECOMMENDATION_ANN_MIN_ITEMS", "20000"))
+RECOMMENDATION_ANN_TABLES = int(os.getenv("RECOMMENDATION_ANN_TABLES", "8"))
+RECOMMENDATION_ANN_BITS = int(os.getenv("RECOMMENDATION_ANN_BITS", "12"))
+# Buckets vizinhos visitados por tabela: maior = mais recall, mais latência
+RECOMMENDATION_ANN_PROBES = int(os.getenv("RECOMMENDATION_ANN_PROBES", "2"))
+RECOMMENDATION_ANN_CANDIDATES = int(
+    os.getenv("RECOMMENDATION_ANN_CANDIDATES", "1000")
+)
+
+# Diretório do modelo de fatoração de matriz (filtragem colaborativa)
+RECOMMENDATION_MF_MODEL_DIR = os.getenv("RECOMMENDATION_MF_MODEL_DIR", "models/mf")
+
+# Artefatos mapeados em memória (matriz de features e tabela de vizinhos),
+# gravados pelo job build-artifacts e compartilhados entre os workers
+RECOMMENDATION_ARTIFACTS_DIR = os.getenv(
+    "RECOMMENDATION_ARTIFACTS_DIR", "models/artifacts"
+)
+
+# Tempo (segundos) que uma versão substituída de artefatos ou do modelo MF
+# fica em disco antes de ser removida: workers que ainda a mapeiam têm esse
+# prazo para recarregar a versão atual
+RECOMMENDATION_ARTIFACT_RETENTION_SECONDS = int(
+    os.getenv("RECOMMENDATION_ARTIFACT_RETENTION_SECONDS", "3600")
+)
+
+# Pipeline de candidatos das recomendações personalizadas: IDs gerados por
+# fonte (gênero, coocorrência, popularidade, ANN) e orçamento de tempo de
+# cada etapa, em milissegundos
+RECOMMENDATION_CANDIDATES_PER_SOURCE = int(
+    os.getenv("RECOMMENDATION_CANDIDATES_PER_SOURCE", "300")
+)
+RECOMMENDATION_STAGE_BUDGET_MS = int(os.getenv("RECOMMENDATION_STAGE_BUDGET_MS", "250"))
+
+# Vetorização dos filmes: "tfidf" (vocabulário ajustado sobre o catálogo) ou
+# "hashing" (espaço fixo de RECOMMENDATION_HASHING_FEATURES colunas, sem
+# ajuste; com RECOMMENDATION_HASHING_IDF o IDF é calculado uma vez e gravado)
+RECOMMENDATION_FEATURIZER = os.getenv("RECOMMENDATION_FEATURIZER", "tfidf")
+RECOMMENDATION_HASHING_FEATURES = int(
+    os.getenv("RECOMMENDATION_HASHING_FEATURES", str(2**16))
+)
+RECOMMENDATION_HASHING_IDF = (
+    os.getenv("RECOMMENDATION_HASHING_IDF", "false").lower() == "true"
+)
+
+# Pontuação das recomendações por conteúdo: "index" (matriz TF-IDF do
+# catálogo em memória) ou "stream" (cursor sobre `movies` em lotes de
+# RECOMMENDATION_STREAM_BATCH_SIZE com top-k acumulado; memória O(lote + k))
+RECOMMENDATION_SCORING_MODE = os.getenv("RECOMMENDATION_SCORING_MODE", "index")
+RECOMMENDATION_STREAM_BATCH_SIZE = int(
+    os.getenv("RECOMMENDATION_STREAM_BATCH_SIZE", "2000")
+)
+
+# Filmes similares sem tabela de vizinhos: "python" (candidatos pelo índice
+# ANN ou por uma consulta $or, pontuados no processo) ou "aggregate"
+# (sobreposição ponderada calculada no MongoDB sobre todo o catálogo)
+RECOMMENDATION_SIMILARITY_MODE = os.getenv("RECOMMENDATION_SIMILARITY_MODE", "python")
+
+# Executor do cálculo pesado das recomendações (fora do event loop):
+# modo "thread", "process" ou "inline"; workers (0 = automático), tarefas
+# aguardando na fila além dos workers e tempo limite por tarefa em segundos
+RECOMMENDATION_EXECUTOR_MODE = os.getenv("RECOMMENDATION_EXECUTOR_MODE", "thread")
+RECOMMENDATION_EXECUTOR_WORKERS = int(os.getenv("RECOMMENDATION_EXECUTOR_WORKERS", "0"))
+RECOMMENDATION_EXECUTOR_QUEUE = int(os.getenv("RECOMMENDATION_EXECUTOR_QUEUE", "64"))
+RECOMMENDATION_EXECUTOR_TIMEOUT = float(
+    os.getenv("RECOMMENDATION_EXECUTOR_TIMEOUT", "30")
+)
+
+# Origem das recomendações por usuário: "live" (cálculo na requisição) ou
+# "store" (lista pré-calculada em user_recommendations, com fallback live
+# quando ausente ou mais antiga que RECOMMENDATION_STORE_MAX_AGE_HOURS)
+RECOMMENDATION_SERVE_MODE = os.getenv("RECOMMENDATION_SERVE_MODE", "live")
+RECOMMENDATION_STORE_MAX_AGE_HOURS = float(
+    os.getenv("RECOMMENDATION_STORE_MAX_AGE_HOURS", "24")
+)
+
+# Segundos até a contagem de filmes por gênero em cache ser recalculada
+# (em segundo plano; a contagem anterior continua sendo servida)
+RECOMMENDATION_GENRE_CACHE_TTL = float(
+    os.getenv("RECOMMENDATION_GENRE_CACHE_TTL", "300")
+)
+
+# Segundos até as estatísticas de avaliações por filme serem reagregadas
+# (em segundo plano, como a contagem por gênero); 0 desativa a recarga
+RECOMMENDATION_RATING_STATS_TTL = float(
+    os.getenv("RECOMMENDATION_RATING_STATS_TTL", "300")
+)
+
+# Índice temporal dos feeds (/movies/new, /movies/reviews/recent): a cada
+# RECOMMENDATION_TIME_INDEX_SYNC_SECONDS, os documentos inseridos por outros
+# processos são incorporados com uma consulta por faixa de _id; a cada
+# RECOMMENDATION_TIME_INDEX_TTL segundos o índice é recarregado por inteiro
+# (em segundo plano), o que também descarta documentos removidos
+RECOMMENDATION_TIME_INDEX_SYNC_SECONDS = float(
+    os.getenv("RECOMMENDATION_TIME_INDEX_SYNC_SECONDS", "5")
+)
+RECOMMENDATION_TIME_INDEX_TTL = float(
+    os.getenv("RECOMMENDATION_TIME_INDEX_TTL", "300")
+)
+
+# Configuração de blend padrão das recomendações personalizadas (ver
+# app/utils/blending.py e a coleção blend_configs). Vazio mantém o fluxo
+# colaborativo -> pipeline de conteúdo; o parâmetro ?blend= tem precedência
+RECOMMENDATION_BLEND_CONFIG = os.getenv("RECOMMENDATION_BLEND_CONFIG", "")
+
+# Diversificação por MMR (parâmetro mmr_lambda das rotas de recomendação):
+# a lista reordenada tem limit * RECOMMENDATION_MMR_POOL_FACTOR candidatos,
+# até RECOMMENDATION_MMR_CANDIDATES
+RECOMMENDATION_MMR_POOL_FACTOR = int(os.getenv("RECOMMENDATION_MMR_POOL_FACTOR", "5"))
+RECOMMENDATION_MMR_CANDIDATES = int(os.getenv("RECOMMENDATION_MMR_CANDIDATES", "500"))
+
+# Leitura de reviews.user_id/movie_id nos dois formatos (string e ObjectId):
+# "auto" (até o job migrate-ids terminar), "true" (sempre) ou "false" (apenas
+# ObjectId). A marca de conclusão é relida a cada
+# REVIEW_ID_MIGRATION_CHECK_SECONDS segundos
+REVIEW_ID_DUAL_READ = os.getenv("REVIEW_ID_DUAL_READ", "auto").lower()
+REVIEW_ID_MIGRATION_CHECK_SECONDS = float(
+    os.getenv("REVIEW_ID_MIGRATION_CHECK_SECONDS", "60")
+)
+
+# Chamadas concorrentes idênticas de filmes populares e similares
+# compartilham uma única execução; com RECOMMENDATION_COALESCE_CACHE_TTL > 0
+# o resultado também fica em cache por esse número de segundos (até
+# RECOMMENDATION_COALESCE_CACHE_ENTRIES chaves)
+RECOMMENDATION_COALESCE_CACHE_TTL = float(
+    os.getenv("RECOMMENDATION_COALESCE_CACHE_TTL", "0")
+)
+RECOMMENDATION_COALESCE_CACHE_ENTRIES = int(
+    os.getenv("RECOMMENDATION_COALESCE_CACHE_ENTRIES", "1024")
+)
+
+# Máximo de usuários aceitos por chamada de /movies/recommendations/batch
+# (rota autenticada); listas maiores devem ser divididas em várias chamadas
+RECOMMENDATION_BATCH_MAX_USERS = int(
+    os.getenv("RECOMMENDATION_BATCH_MAX_USERS", "500")
+)
@@ -2,12 +2,13 @@ from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
-from typing import Dict, Any
+from typing import AsyncIterator, Dict, Any
 from datetime import datetime
 
 from app.config import MONGO_URL, DATABASE_NAME
 from app.config import JWT_SECRET_KEY, JWT_ALGORITHM
 from app.schemas.user import TokenPayload
+from app.utils.request_context import RequestContext
 
 # Cliente MongoDB assíncrono
 client = AsyncIOMotorClient(MONGO_URL)
@@ -26,6 +27,21 @@ async def get_database() -> AsyncIOMotorDatabase:
     return db
 
 
+# Dependência com o contexto da requisição (mapa de identidade)
+async def get_request_context(
+    db: AsyncIOMotorDatabase = Depends(get_database),
+) -> AsyncIterator[RequestContext]:
+    """
+    Cria o contexto compartilhado por todas as dependências e pela rota
+    durante uma requisição, somando seus contadores às métricas ao final.
+    """
+    context = RequestContext(db)
+    try:
+        yield context
+    finally:
+        context.close()
+
+
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
     db: AsyncIOMotorDatabase = Depends(get_database),
@@ -1,5 +1,6 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 
 from app.routers import users, auth, movies
 from app.config import API_TITLE, API_DESCRIPTION, API_VERSION
@@ -9,6 +10,9 @@ from app.config import (
     CORS_ALLOW_METHODS,
     CORS_ALLOW_HEADERS,
 )
+from app.dependencies import get_database
+from app.utils.executor import ScoringUnavailableError, get_scoring_executor
+from app.utils.rating_aggregates import create_popularity_index
 
 # Criação da aplicação FastAPI
 app = FastAPI(
@@ -45,6 +49,29 @@ async def set_secure_headers(request, call_next):
     return response
 
 
+# Cálculo de recomendações indisponível (fila cheia ou timeout)
+@app.exception_handler(ScoringUnavailableError)
+async def scoring_unavailable_handler(request, exc):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"detail": str(exc)}
+    )
+
+
+@app.on_event("startup")
+async def create_startup_indexes():
+    # Índice dos filmes populares (agregados de avaliações em cada filme)
+    get_db = app.dependency_overrides.get(get_database, get_database)
+    try:
+        await create_popularity_index(await get_db())
+    except Exception as e:
+        print(f"Error creating popularity index: {str(e)}")
+
+
+@app.on_event("shutdown")
+async def shutdown_scoring_executor():
+    get_scoring_executor().shutdown()
+
+
 # Configuração do CORS
 app.add_middleware(
     CORSMiddleware,
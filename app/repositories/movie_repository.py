@@ -1,9 +1,13 @@
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from bson import ObjectId
-from typing import List
+from typing import List, Optional, Tuple
 from app.models.movie import Movie
 from app.models.review import Review
 from app.repositories.base_repository import BaseRepository
+from app.utils.rating_aggregates import apply_review_aggregates, empty_aggregates
+from app.utils.recommendation import refresh_movie_indexes, refresh_review_indexes
+from app.utils.time_index import TimeCursor, get_time_index
+from app.utils.user_profile import update_user_profile
 
 
 class MovieRepository(BaseRepository[Movie]):
@@ -13,6 +17,7 @@ class MovieRepository(BaseRepository[Movie]):
 
     def __init__(self, db: AsyncIOMotorDatabase):
         super().__init__(db, "movies", Movie)
+        self.db = db
         self.reviews_collection = db.reviews
 
     async def find_all(
@@ -33,6 +38,66 @@ class MovieRepository(BaseRepository[Movie]):
         documents = await cursor.to_list(length=limit)
         return [self._process_document(doc) for doc in documents]
 
+    async def find_new(self, days: int = 7, limit: int = 100) -> List[Movie]:
+        """Retorna os filmes criados nos últimos `days` dias, mais recentes primeiro."""
+        time_index = await get_time_index(self.db, "movies").ensure_loaded(self.db)
+        movie_ids = [movie_id for _, movie_id in time_index.recent(days)[:limit]]
+        documents = await self._find_in_order(self.collection, movie_ids)
+        return [self._process_document(doc) for doc in documents]
+
+    async def find_recent_reviews(
+        self, limit: int = 20, before: Optional[TimeCursor] = None
+    ) -> Tuple[List[Review], Optional[TimeCursor]]:
+        """
+        Retorna uma página das avaliações mais recentes e o cursor da próxima.
+
+        A paginação usa o índice temporal em memória, então cada página custa
+        uma busca binária mais uma única consulta `$in`.
+        """
+        time_index = await get_time_index(self.db, "reviews").ensure_loaded(self.db)
+        items, next_cursor = time_index.page(limit, before=before)
+        documents = await self._find_in_order(
+            self.reviews_collection, [review_id for _, review_id in items]
+        )
+        return [self._review_from_document(doc) for doc in documents], next_cursor
+
+    @staticmethod
+    async def _find_in_order(collection, ids: List[str]) -> List[dict]:
+        """Busca documentos por ID em uma única consulta, na ordem de `ids`."""
+        object_ids = [ObjectId(i) for i in ids if ObjectId.is_valid(i)]
+        if not object_ids:
+            return []
+        documents = await collection.find({"_id": {"$in": object_ids}}).to_list(
+            length=len(object_ids)
+        )
+        by_id = {str(doc["_id"]): doc for doc in documents}
+        return [by_id[item_id] for item_id in ids if item_id in by_id]
+
+    @staticmethod
+    def _review_from_document(document: dict) -> Review:
+        """Converte um documento de avaliação (IDs como ObjectId) em Review."""
+        document = dict(document)
+        document["id"] = str(document["_id"])
+        for field in ("user_id", "movie_id"):
+            if isinstance(document.get(field), ObjectId):
+                document[field] = str(document[field])
+        return Review.from_dict(document)
+
+    async def create(self, model: Movie) -> Movie:
+        """
+        Cria um novo filme e o inclui nos índices de recomendação em memória.
+
+        Os agregados de avaliações já nascem zerados, para que o filme entre
+        no índice de `POPULARITY_SORT` antes da primeira avaliação.
+        """
+        document = {**model.to_dict(), **empty_aggregates()}
+        result = await self.collection.insert_one(document)
+        created = self._process_document(
+            await self.collection.find_one({"_id": result.inserted_id})
+        )
+        refresh_movie_indexes(self.db, created.to_dict())
+        return created
+
     async def create_review(self, review: Review) -> Review:
         """Creates a new review in the database."""
         print(f"Creating review: {review}")
@@ -64,6 +129,9 @@ class MovieRepository(BaseRepository[Movie]):
 
         created = await self.reviews_collection.find_one({"_id": result.inserted_id})
         print(f"Retrieved document from DB: {created}")
+        refresh_review_indexes(self.db, created)
+        await apply_review_aggregates(self.db, created)
+        await update_user_profile(self.db, created)
 
         # Convert ObjectIds back to strings before creating the Review object
         if "_id" in created:
@@ -1,15 +1,24 @@
-from bson import ObjectId
+import json
+
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from typing import List, Dict, Any
+from fastapi.responses import StreamingResponse
+from typing import List, Dict, Any, Optional
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
-from app.dependencies import get_database, get_current_user
+from app.config import RECOMMENDATION_BATCH_MAX_USERS
+from app.dependencies import get_current_user, get_database, get_request_context
 from app.models.movie import Movie
 from app.models.review import Review
 from app.repositories.movie_repository import MovieRepository
-from app.schemas.movie import MovieCreate, MovieResponse
-from app.schemas.review import ReviewCreate, ReviewResponse
+from app.schemas.movie import BatchRecommendationRequest, MovieCreate, MovieResponse
+from app.schemas.review import ReviewCreate, ReviewPageResponse, ReviewResponse
 from app.services.recommendation_service import RecommendationService
+from app.utils.blending import get_blending_engine
+from app.utils.coalescing import single_flight_stats
+from app.utils.executor import ScoringUnavailableError, get_scoring_executor
+from app.utils.request_context import RequestContext, get_request_context_stats
+from app.utils.time_index import decode_cursor, encode_cursor
+from app.utils.validation import to_object_id
 
 
 router = APIRouter(
@@ -28,9 +37,13 @@ async def get_movie_repository(
 
 async def get_recommendation_service(
     db: AsyncIOMotorDatabase = Depends(get_database),
+    context: RequestContext = Depends(get_request_context),
 ) -> RecommendationService:
-    """Dependência para injetar o serviço de recomendação."""
-    return RecommendationService(db)
+    """
+    Dependência para injetar o serviço de recomendação, com o contexto da
+    requisição compartilhado com a rota.
+    """
+    return RecommendationService(db, context)
 
 
 @router.get(
@@ -95,6 +108,67 @@ async def create_movie(
     return movie_to_response(created_movie)
 
 
+@router.get(
+    "/new",
+    response_model=List[MovieResponse],
+    summary="Obter filmes novos",
+    description="Retorna os filmes adicionados ao catálogo nos últimos dias.",
+    response_description="Lista de filmes novos",
+)
+async def get_new_movies(
+    days: int = Query(7, ge=1, description="Janela de dias considerada"),
+    limit: int = Query(20, ge=1, description="Número máximo de filmes"),
+    repo: MovieRepository = Depends(get_movie_repository),
+):
+    """
+    Retorna os filmes criados nos últimos `days` dias, mais recentes primeiro.
+
+    - **days**: janela em dias (padrão: 7)
+    - **limit**: número máximo de filmes a retornar
+
+    Esta rota não requer autenticação.
+    """
+    movies = await repo.find_new(days=days, limit=limit)
+    return [movie_to_response(movie) for movie in movies]
+
+
+@router.get(
+    "/reviews/recent",
+    response_model=ReviewPageResponse,
+    summary="Feed de avaliações recentes",
+    description="Retorna as avaliações mais recentes, paginadas por cursor.",
+    response_description="Página de avaliações recentes",
+)
+async def get_recent_reviews(
+    limit: int = Query(20, ge=1, le=100, description="Avaliações por página"),
+    cursor: Optional[str] = Query(
+        None, description="Cursor `next_cursor` retornado pela página anterior"
+    ),
+    repo: MovieRepository = Depends(get_movie_repository),
+):
+    """
+    Retorna uma página do feed de atividade recente.
+
+    - **limit**: número de avaliações por página
+    - **cursor**: cursor da página anterior (omitir na primeira página)
+
+    Esta rota não requer autenticação.
+
+    Possíveis erros:
+    - **400 Bad Request**: Cursor inválido
+    """
+    try:
+        before = decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    reviews, next_cursor = await repo.find_recent_reviews(limit=limit, before=before)
+    return {
+        "items": [review_to_response(review) for review in reviews],
+        "next_cursor": encode_cursor(next_cursor),
+    }
+
+
 @router.get(
     "/{movie_id}",
     response_model=MovieResponse,
@@ -137,6 +211,20 @@ async def get_movie(
 )
 async def get_recommendations_for_user(
     limit: int = Query(10, description="Número máximo de recomendações"),
+    mode: Optional[str] = Query(
+        None,
+        description="'live' (cálculo na hora) ou 'store' (lista pré-calculada)",
+    ),
+    mmr_lambda: Optional[float] = Query(
+        None,
+        ge=0.0,
+        le=1.0,
+        description="Diversificação MMR (1 mantém a ordem; menor diversifica)",
+    ),
+    blend: Optional[str] = Query(
+        None,
+        description="Configuração de blend dos sinais (ex.: default, content, fresh)",
+    ),
     current_user: Dict[str, Any] = Depends(get_current_user),
     recommendation_service: RecommendationService = Depends(get_recommendation_service),
 ):
@@ -144,6 +232,10 @@ async def get_recommendations_for_user(
     Retorna filmes recomendados para o usuário atual.
 
     - **limit**: número máximo de recomendações a retornar
+    - **mode**: `live` ou `store` (padrão: RECOMMENDATION_SERVE_MODE)
+    - **mmr_lambda**: se informado, reordena o resultado por MMR para evitar
+      filmes quase duplicados (mesmo diretor, mesmos gêneros)
+    - **blend**: configuração de pesos dos sinais de ranqueamento
 
     Esta rota requer autenticação.
 
@@ -155,13 +247,23 @@ async def get_recommendations_for_user(
     Possíveis erros:
     - **401 Unauthorized**: Token inválido, expirado ou ausente
     """
+    # O usuário autenticado já foi lido: o serviço não precisa buscá-lo
+    recommendation_service.context.remember_user(current_user)
     try:
         # Obter recomendações do serviço
         recommended_movies = await recommendation_service.get_recommendations_for_user(
-            user_id=str(current_user["_id"]), limit=limit
+            user_id=str(current_user["_id"]),
+            limit=limit,
+            mode=mode,
+            mmr_lambda=mmr_lambda,
+            blend=blend,
         )
 
         return [movie_to_response(movie) for movie in recommended_movies]
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except ScoringUnavailableError:
+        raise
     except Exception:
         # Em caso de erro no sistema de recomendação, retorna uma lista vazia
         # Poderia ser melhorado com log de erro e tratamento específico
@@ -178,14 +280,22 @@ async def get_recommendations_for_user(
 async def get_similar_movies(
     movie_id: str,
     limit: int = Query(5, description="Número máximo de filmes similares"),
+    mmr_lambda: Optional[float] = Query(
+        None,
+        ge=0.0,
+        le=1.0,
+        description="Diversificação MMR (1 mantém a ordem; menor diversifica)",
+    ),
     recommendation_service: RecommendationService = Depends(get_recommendation_service),
-    repo: MovieRepository = Depends(get_movie_repository),
+    context: RequestContext = Depends(get_request_context),
 ):
     """
     Retorna filmes similares a um filme específico.
 
     - **movie_id**: ID do filme de referência
     - **limit**: número máximo de filmes similares a retornar
+    - **mmr_lambda**: se informado, reordena o resultado por MMR para
+      diversificar os filmes retornados
 
     Esta rota não requer autenticação.
 
@@ -197,8 +307,9 @@ async def get_similar_movies(
     Possíveis erros:
     - **404 Not Found**: Filme de referência não encontrado
     """
-    # Verificar se o filme existe
-    movie = await repo.find_one(movie_id)
+    # Verificar se o filme existe (leitura compartilhada com o serviço)
+    object_id = to_object_id(movie_id)
+    movie = await context.get_movie(object_id) if object_id is not None else None
     if not movie:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -207,7 +318,7 @@ async def get_similar_movies(
 
     # Obter filmes similares
     similar_movies = await recommendation_service.get_similar_movies(
-        movie_id=movie_id, limit=limit
+        movie_id=movie_id, limit=limit, mmr_lambda=mmr_lambda
     )
 
     return [movie_to_response(movie) for movie in similar_movies]
@@ -222,23 +333,118 @@ async def get_similar_movies(
 )
 async def get_popular_movies(
     limit: int = Query(10, description="Número máximo de filmes populares"),
+    ranking: str = Query(
+        "popularity",
+        description="Critério de ordenação: 'popularity' ou 'weighted' (IMDB)",
+    ),
     recommendation_service: RecommendationService = Depends(get_recommendation_service),
 ):
     """
     Retorna os filmes mais populares no sistema.
 
     - **limit**: número máximo de filmes populares a retornar
+    - **ranking**: `popularity` (padrão) ou `weighted`
 
     Esta rota não requer autenticação.
 
     Retorna uma lista dos filmes mais populares com base em:
     - Número de avaliações
     - Média de avaliações
+    - Ou, com `ranking=weighted`, na classificação ponderada do IMDB
+
+    Possíveis erros:
+    - **400 Bad Request**: Critério de ordenação inválido
     """
-    popular_movies = await recommendation_service.get_popular_movies(limit=limit)
+    try:
+        popular_movies = await recommendation_service.get_popular_movies(
+            limit=limit, ranking=ranking
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     return [movie_to_response(movie) for movie in popular_movies]
 
 
+@router.get(
+    "/recommendations/metrics",
+    summary="Métricas do sistema de recomendação",
+    description="Retorna estatísticas de tempo das tarefas de cálculo de recomendações.",
+    response_description="Métricas do executor de recomendações",
+)
+async def get_recommendation_metrics(
+    db: AsyncIOMotorDatabase = Depends(get_database),
+):
+    """
+    Retorna as métricas do executor de cálculo das recomendações: modo,
+    tamanho do pool, tarefas em andamento e, por tipo de tarefa, contagem,
+    tempo médio/máximo, tempo médio na fila, erros, timeouts e rejeições.
+    Inclui também o tempo de cálculo de cada sinal do blending e as leituras
+    repetidas de usuários, avaliações e filmes absorvidas pelo contexto das
+    requisições e, para filmes populares e similares, as chamadas servidas
+    pelo cache (hits), que aguardaram uma execução idêntica (joins) ou que
+    executaram a consulta (misses).
+
+    Esta rota não requer autenticação.
+    """
+    return {
+        "executor": get_scoring_executor().stats(),
+        "signals": get_blending_engine().stats(),
+        "request_context": get_request_context_stats().to_dict(),
+        "coalescing": single_flight_stats(db),
+    }
+
+
+@router.post(
+    "/recommendations/batch",
+    summary="Recomendações em lote",
+    description=(
+        "Retorna recomendações para vários usuários em uma única chamada, "
+        "em NDJSON (uma linha JSON por usuário)."
+    ),
+    response_description="Stream NDJSON com as recomendações de cada usuário",
+)
+async def get_batch_recommendations(
+    request: BatchRecommendationRequest,
+    recommendation_service: RecommendationService = Depends(get_recommendation_service),
+    current_user: Dict[str, Any] = Depends(get_current_user),
+):
+    """
+    Retorna recomendações para vários usuários de uma vez (requer autenticação).
+
+    - **user_ids**: IDs dos usuários
+    - **limit**: número máximo de recomendações por usuário
+
+    Cada linha da resposta tem o formato
+    `{"user_id": ..., "recommendations": [...]}`; usuários inexistentes
+    trazem também `"error"`. As linhas são enviadas à medida que cada bloco
+    de usuários é calculado.
+
+    Possíveis erros:
+    - **400 Bad Request**: Mais usuários do que o permitido por chamada
+    - **401 Unauthorized**: Usuário não autenticado
+    """
+    if len(request.user_ids) > RECOMMENDATION_BATCH_MAX_USERS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Máximo de {RECOMMENDATION_BATCH_MAX_USERS} usuários por chamada",
+        )
+
+    results = recommendation_service.iter_recommendations_for_users(
+        request.user_ids, limit=request.limit
+    )
+
+    async def stream():
+        async for user_id, movies in results:
+            line = {
+                "user_id": user_id,
+                "recommendations": [movie_to_response(movie) for movie in movies or []],
+            }
+            if movies is None:
+                line["error"] = f"User with ID {user_id} not found"
+            yield json.dumps(line, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
 @router.post(
     "/reviews",
     response_model=ReviewResponse,
@@ -278,12 +484,24 @@ async def create_review(
 async def get_user_recommendations(
     user_id: str,
     limit: int = Query(10, description="Maximum number of recommendations"),
+    mode: Optional[str] = Query(
+        None, description="'live' (score now) or 'store' (precomputed list)"
+    ),
+    mmr_lambda: Optional[float] = Query(
+        None,
+        ge=0.0,
+        le=1.0,
+        description="MMR diversity: 1 keeps the order, lower values diversify",
+    ),
+    blend: Optional[str] = Query(
+        None, description="Signal blend config (e.g. default, content, fresh)"
+    ),
     recommendation_service: RecommendationService = Depends(get_recommendation_service),
-    db: AsyncIOMotorDatabase = Depends(get_database),
+    context: RequestContext = Depends(get_request_context),
 ):
     """Returns movie recommendations for a specific user."""
-    # First check if user exists
-    user = await db.users.find_one({"_id": ObjectId(user_id)})
+    # First check if user exists (memoized for the service in this request)
+    user = await context.get_user(user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -293,9 +511,17 @@ async def get_user_recommendations(
     # User exists, try to get recommendations
     try:
         recommended_movies = await recommendation_service.get_recommendations_for_user(
-            user_id=user_id, limit=limit
+            user_id=user_id,
+            limit=limit,
+            mode=mode,
+            mmr_lambda=mmr_lambda,
+            blend=blend,
         )
         return [movie_to_response(movie) for movie in recommended_movies]
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except ScoringUnavailableError:
+        raise
     except Exception as e:
         # Log the exception but don't raise it
         print(f"Error getting recommendations: {str(e)}")
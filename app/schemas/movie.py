@@ -42,3 +42,16 @@ class MovieResponse(MovieBase):
         """Configuração para o modelo Pydantic."""
 
         from_attributes = True
+
+
+class BatchRecommendationRequest(BaseModel):
+    """Esquema para recomendações em lote para vários usuários."""
+
+    user_ids: List[str] = Field(
+        ...,
+        example=["60d21b4967d0d8992e610c85", "60d21b4967d0d8992e610c84"],
+        description="IDs dos usuários",
+    )
+    limit: int = Field(
+        10, ge=1, le=100, example=10, description="Recomendações por usuário"
+    )
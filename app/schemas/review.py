@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 
@@ -55,3 +55,16 @@ class ReviewResponse(UserReviewBase):
 
         from_attributes = True
         json_encoders = {datetime: lambda dt: dt.isoformat()}
+
+
+class ReviewPageResponse(BaseModel):
+    """Esquema para uma página do feed de avaliações recentes."""
+
+    items: List[ReviewResponse] = Field(
+        ..., description="Avaliações da página, da mais recente à mais antiga"
+    )
+    next_cursor: Optional[str] = Field(
+        None,
+        example="1700000000.0_60d21b4967d0d8992e610c87",
+        description="Cursor para a próxima página (ausente na última página)",
+    )
@@ -1,9 +1,56 @@
-from typing import List
+import time
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import numpy as np
+import scipy.sparse as sp
 from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReplaceOne
 
+from app.config import (
+    RECOMMENDATION_ANN_CANDIDATES,
+    RECOMMENDATION_ARTIFACTS_DIR,
+    RECOMMENDATION_BLEND_CONFIG,
+    RECOMMENDATION_MF_MODEL_DIR,
+    RECOMMENDATION_MMR_CANDIDATES,
+    RECOMMENDATION_MMR_POOL_FACTOR,
+    RECOMMENDATION_NEIGHBORS_K,
+    RECOMMENDATION_SERVE_MODE,
+    RECOMMENDATION_SIMILARITY_MODE,
+    RECOMMENDATION_STORE_MAX_AGE_HOURS,
+)
 from app.models.movie import Movie
-from app.utils.recommendation import calculate_similarity
+from app.utils.artifacts import ArtifactWriter, load_artifacts
+from app.utils.blending import BlendConfig, get_blend_config
+from app.utils.candidates import CandidateContext, default_candidate_pipeline
+from app.utils.coalescing import get_single_flight
+from app.utils.diversity import mmr_rerank, rank_relevance
+from app.utils.executor import ScoringUnavailableError, get_scoring_executor
+from app.utils.feature_index import MovieFeatureIndex
+from app.utils.genre_index import get_popular_genres
+from app.utils.id_migration import review_id_filter
+from app.utils.matrix_factorization import (
+    MatrixFactorizationModel,
+    build_ratings_matrix,
+    get_mf_model,
+    train_als,
+)
+from app.utils.neighbors import BLOCK_CELLS, NeighborTable, top_k_neighbors
+from app.utils.rating_aggregates import POPULARITY_SORT
+from app.utils.rating_stats import get_rating_stats
+from app.utils.request_context import RequestContext
+from app.utils.recommendation import (
+    MovieRecommender,
+    batch_calculate_similarity,
+    calculate_similarity,
+    create_feature_index,
+    get_feature_index,
+    score_like_matrix,
+    similarity_pipeline,
+    to_object_id,
+    top_k_indices,
+)
+from app.utils.user_profile import PROFILE_MIN_RATING, load_user_profile
 
 
 class RecommendationService:
@@ -12,12 +59,22 @@ class RecommendationService:
     e similaridade entre filmes.
     """
 
-    def __init__(self, db: AsyncIOMotorDatabase):
+    # Modos aceitos por `get_recommendations_for_user`
+    SERVE_MODES = ("live", "store")
+    # Modos aceitos por `get_similar_movies`
+    SIMILARITY_MODES = ("python", "aggregate")
+
+    def __init__(
+        self, db: AsyncIOMotorDatabase, context: Optional[RequestContext] = None
+    ):
         self.db = db
+        # Leituras de usuários, avaliações e filmes compartilhadas com o
+        # router durante a requisição; sem requisição (jobs), nada é memorizado
+        self.context = context or RequestContext(db, memoize=False)
 
     async def _validate_user(self, user_id: str) -> dict:
         """Validates if user exists and returns user data."""
-        user = await self.db.users.find_one({"_id": ObjectId(user_id)})
+        user = await self.context.get_user(user_id)
         if not user:
             print(f"User not found with ID: {user_id}")
             return None
@@ -25,50 +82,126 @@ class RecommendationService:
         return user
 
     async def _get_user_reviews(self, user_id: str) -> List[dict]:
-        """Retrieves user reviews trying both ObjectId and string formats."""
-        # Try with ObjectId first
-        user_reviews = await self.db.reviews.find(
-            {"user_id": ObjectId(user_id)}
-        ).to_list(length=100)
-
-        # Try with string if no results
-        if not user_reviews:
-            print("No reviews found with user_id as ObjectId, trying as string")
-            user_reviews = await self.db.reviews.find({"user_id": user_id}).to_list(
-                length=100
-            )
+        """
+        Retrieves user reviews in a single indexed query (string user_ids
+        are matched too while the id migration is pending), memoized for
+        the rest of the request.
+        """
+        user_reviews = await self.context.get_user_reviews(user_id, limit=100)
 
         print(f"Found {len(user_reviews)} reviews for user")
         return user_reviews
 
     async def _get_recommended_movies(
-        self, rated_movie_ids: List[str], preferred_genres: List[str], limit: int
+        self,
+        user_id: str,
+        rated_movie_ids: List[str],
+        preferred_genres: List[str],
+        limit: int,
+        blend_config: Optional[BlendConfig] = None,
     ) -> List[Movie]:
-        """Gets recommended movies based on user preferences."""
-        genre_filter = {"genres": {"$in": preferred_genres}}
-        if rated_movie_ids:
-            genre_filter["_id"] = {"$nin": [ObjectId(mid) for mid in rated_movie_ids]}
-
-        print(f"Applying filter: {genre_filter}")
-        recommended_movies = (
-            await self.db.movies.find(genre_filter)
-            .sort("rating_avg", -1)
-            .limit(limit)
-            .to_list(length=limit)
+        """
+        Gets recommended movies based on user preferences.
+
+        Runs the two-stage candidate pipeline: cheap generators (genre index,
+        co-occurrence, popularity, ANN) each propose a bounded number of
+        unrated movies within their own time budget, and a vectorized ranker
+        scores only their union with the blending engine (signal weights
+        from `blend_config`, "default" when omitted). The final page is
+        fetched in one query.
+        """
+        index = await get_feature_index(self.db).ensure_built(self.db)
+        profile = await MovieRecommender.get_user_profile(self.db, user_id, index)
+        context = CandidateContext(
+            user_id, rated_movie_ids, preferred_genres, profile, blend_config
         )
 
-        print(f"Found {len(recommended_movies)} potential recommendations")
-        return [
-            Movie.from_dict({**movie_data, "id": str(movie_data["_id"])})
-            for movie_data in recommended_movies
-            if "_id" in movie_data
-        ]
+        movie_ids, stages = await default_candidate_pipeline().run(
+            self.db, context, limit
+        )
+        print(f"Candidate pipeline stages: {stages}")
+
+        return await self._fetch_movies_in_order(
+            [oid for oid in map(to_object_id, movie_ids) if oid is not None]
+        )
 
     async def get_recommendations_for_user(
-        self, user_id: str, limit: int = 10
+        self,
+        user_id: str,
+        limit: int = 10,
+        mode: Optional[str] = None,
+        mmr_lambda: Optional[float] = None,
+        blend: Optional[str] = None,
     ) -> List[Movie]:
         """
         Retorna filmes recomendados para um usuário específico.
+
+        Com `mode="store"` (ou RECOMMENDATION_SERVE_MODE), a lista
+        pré-calculada em `user_recommendations` é servida com uma leitura pelo
+        `_id`; o cálculo completo só acontece se ela estiver ausente ou
+        defasada.
+
+        Com `mmr_lambda`, uma lista maior é gerada e reordenada por MMR (ver
+        `_diversify`).
+
+        Com `blend` (ou RECOMMENDATION_BLEND_CONFIG), todos os sinais
+        (conteúdo, colaborativo, nota, recência) são combinados em um único
+        ranqueamento com os pesos da configuração nomeada, em vez de escolher
+        entre a filtragem colaborativa e o pipeline de conteúdo. Um `blend`
+        explícito sempre calcula na hora (a lista gravada usa o padrão).
+        """
+        mode = mode or RECOMMENDATION_SERVE_MODE
+        if mode not in self.SERVE_MODES:
+            raise ValueError(
+                f"Modo inválido: {mode}. Use um de {', '.join(self.SERVE_MODES)}"
+            )
+        blend_config = None
+        if blend or RECOMMENDATION_BLEND_CONFIG:
+            blend_config = await get_blend_config(
+                self.db, blend or RECOMMENDATION_BLEND_CONFIG
+            )
+
+        if mmr_lambda is not None:
+            return await self._get_diversified_recommendations(
+                user_id, limit, mode, mmr_lambda, blend
+            )
+
+        if mode == "store" and not blend:
+            stored = await self._get_stored_recommendations(user_id, limit)
+            if stored is not None:
+                return stored
+            print(f"No fresh stored recommendations for {user_id}, scoring live")
+
+        return await self._score_recommendations(user_id, limit, blend_config)
+
+    async def _get_diversified_recommendations(
+        self,
+        user_id: str,
+        limit: int,
+        mode: str,
+        mmr_lambda: float,
+        blend: Optional[str],
+    ) -> List[Movie]:
+        """Gera um pool maior de recomendações e o reordena por MMR."""
+        self._validate_mmr_lambda(mmr_lambda)
+        pool = self._mmr_pool_size(limit)
+        movies = None
+        if mode == "store" and not blend:
+            # A lista gravada (mesmo menor que o pool) serve de candidatos
+            movies = await self._get_stored_recommendations(user_id, limit, pool)
+        if movies is None:
+            movies = await self.get_recommendations_for_user(
+                user_id, pool, mode, blend=blend
+            )
+        return await self._diversify(movies, limit, mmr_lambda)
+
+    async def _score_recommendations(
+        self, user_id: str, limit: int, blend_config: Optional[BlendConfig]
+    ) -> List[Movie]:
+        """
+        Calcula as recomendações na hora: populares para usuários sem
+        avaliações, filtragem colaborativa quando há modelo para o usuário
+        (exceto com blend) e, por fim, o pipeline de conteúdo ou o blend.
         """
         print(f"Starting recommendation process for user_id: {user_id}")
 
@@ -94,63 +227,556 @@ class RecommendationService:
 
         print(f"User has rated {len(rated_movie_ids)} movies")
 
+        # Filtragem colaborativa quando há um modelo treinado para o usuário
+        # (com blend, ela é um dos sinais do ranqueamento único)
+        if blend_config is None:
+            movies = await self._get_collaborative_recommendations(
+                user_id, rated_movie_ids, limit
+            )
+            if movies:
+                print(f"Returning {len(movies)} collaborative recommendations")
+                return movies
+
+        return await self._get_content_recommendations(
+            user_id, user_reviews, rated_movie_ids, limit, blend_config
+        )
+
+    async def _get_content_recommendations(
+        self,
+        user_id: str,
+        user_reviews: List[Dict],
+        rated_movie_ids: List[str],
+        limit: int,
+        blend_config: Optional[BlendConfig],
+    ) -> List[Movie]:
+        """Recomendações do pipeline de conteúdo (ou do blend) pelos gêneros preferidos."""
         # Get preferred genres and recommendations
-        preferred_genres = await self._get_user_preferred_genres(user_id)
+        preferred_genres = await self._get_user_preferred_genres(
+            user_id, reviews=user_reviews
+        )
         print(f"Preferred genres: {preferred_genres}")
 
         try:
             movies = await self._get_recommended_movies(
-                rated_movie_ids, preferred_genres, limit
+                user_id, rated_movie_ids, preferred_genres, limit, blend_config
             )
             print(f"Returning {len(movies)} recommendations for user {user_id}")
             return movies
+        except ScoringUnavailableError:
+            # Sem capacidade de cálculo: o handler da aplicação responde 503
+            raise
         except Exception as e:
             print(f"Error getting recommendations: {str(e)}")
             return []
 
-    async def get_similar_movies(self, movie_id: str, limit: int = 5) -> List[Movie]:
+    async def _get_collaborative_recommendations(
+        self, user_id: str, rated_movie_ids: List[str], limit: int
+    ) -> List[Movie]:
+        """
+        Recomenda pelo modelo de fatoração de matriz, se houver um modelo
+        treinado que conheça o usuário. Retorna lista vazia caso contrário.
+        """
+        model = get_mf_model(RECOMMENDATION_MF_MODEL_DIR)
+        if model is None or not model.has_user(user_id):
+            return []
+
+        movie_ids = model.recommend(user_id, limit, exclude=rated_movie_ids)
+        return await self._fetch_movies_in_order(
+            [oid for oid in map(to_object_id, movie_ids) if oid is not None]
+        )
+
+    async def iter_recommendations_for_users(
+        self,
+        user_ids: List[str],
+        limit: int = 10,
+        block_cells: int = BLOCK_CELLS,
+    ) -> AsyncIterator[Tuple[str, Optional[List[Movie]]]]:
+        """
+        Gera recomendações para vários usuários em uma única passada.
+
+        As avaliações de todos os usuários vêm de uma única agregação. Usuários
+        conhecidos pelo modelo de fatoração de matriz são pontuados com
+        `fatores dos usuários @ fatores dos filmes`; os demais, pelo centróide
+        TF-IDF dos filmes curtidos contra a matriz do catálogo. Cada bloco de
+        usuários (limitado a ~`block_cells` pontuações) é uma multiplicação de
+        matrizes seguida de uma única consulta `$in` aos filmes recomendados.
+
+        Usuários sem filmes curtidos recebem os filmes populares.
+
+        Yields:
+            Tuplas (user_id, filmes) na ordem de `user_ids`; filmes é None
+            para usuários inexistentes
+        """
+        user_ids = list(dict.fromkeys(str(user_id) for user_id in user_ids))
+        object_ids = [ObjectId(u) for u in user_ids if ObjectId.is_valid(u)]
+        existing = {
+            str(user["_id"])
+            for user in await self.db.users.find(
+                {"_id": {"$in": object_ids}}, {"_id": 1}
+            ).to_list(length=None)
+        }
+        reviews_by_user = await self._get_reviews_for_users(user_ids)
+
+        index = await get_feature_index(self.db).ensure_built(self.db)
+        await self._index_rated_movies(index, reviews_by_user)
+        model = get_mf_model(RECOMMENDATION_MF_MODEL_DIR)
+
+        chunk_size = max(1, block_cells // max(1, len(index)))
+        popular = None
+        for start in range(0, len(user_ids), chunk_size):
+            chunk = [u for u in user_ids[start : start + chunk_size] if u in existing]
+            executor = get_scoring_executor()
+            content_users = [
+                u for u in chunk if model is None or not model.has_user(u)
+            ]
+            recommended = {}
+            if content_users:
+                likes, rated_rows, rated_cols = self._content_batch_inputs(
+                    index, content_users, reviews_by_user
+                )
+                top = await executor.run(
+                    "batch_content_scoring",
+                    score_like_matrix,
+                    likes,
+                    index.matrix,
+                    rated_rows,
+                    rated_cols,
+                    limit,
+                )
+                recommended = {
+                    user_id: [index.movie_ids[i] for i in positions]
+                    for user_id, positions in zip(content_users, top)
+                    if len(positions)
+                }
+            if model is not None:
+                recommended.update(
+                    await executor.run(
+                        "batch_collaborative_scoring",
+                        self._score_collaborative_batch,
+                        model,
+                        [u for u in chunk if model.has_user(u)],
+                        reviews_by_user,
+                        limit,
+                    )
+                )
+
+            movie_ids = list(
+                dict.fromkeys(mid for ids in recommended.values() for mid in ids)
+            )
+            movies = await self._fetch_movies_in_order(
+                [ObjectId(mid) for mid in movie_ids if ObjectId.is_valid(mid)]
+            )
+            by_id = {movie.id: movie for movie in movies}
+
+            for user_id in user_ids[start : start + chunk_size]:
+                if user_id not in existing:
+                    yield user_id, None
+                elif recommended.get(user_id):
+                    yield user_id, [
+                        by_id[mid] for mid in recommended[user_id] if mid in by_id
+                    ]
+                else:
+                    if popular is None:
+                        popular = await self.get_popular_movies(limit)
+                    yield user_id, popular
+
+    async def _get_reviews_for_users(
+        self, user_ids: List[str]
+    ) -> Dict[str, List[Tuple[str, float]]]:
+        """
+        Carrega as avaliações de vários usuários em uma única agregação
+        (user_id como string também é aceito enquanto a migração de IDs
+        não terminar).
+
+        Returns:
+            Dicionário user_id -> lista de (movie_id, rating)
+        """
+        keys = await review_id_filter(self.db, user_ids)
+        groups = await self.db.reviews.aggregate(
+            [
+                {"$match": {"user_id": keys}},
+                {
+                    "$group": {
+                        "_id": "$user_id",
+                        "reviews": {
+                            "$push": {"movie_id": "$movie_id", "rating": "$rating"}
+                        },
+                    }
+                },
+            ]
+        ).to_list(length=None)
+
+        reviews_by_user: Dict[str, List[Tuple[str, float]]] = {}
+        for group in groups:
+            reviews_by_user.setdefault(str(group["_id"]), []).extend(
+                (str(review["movie_id"]), review.get("rating") or 0.0)
+                for review in group["reviews"]
+            )
+        return reviews_by_user
+
+    async def _index_rated_movies(
+        self,
+        index: MovieFeatureIndex,
+        reviews_by_user: Dict[str, List[Tuple[str, float]]],
+    ) -> None:
+        """Inclui no índice TF-IDF filmes avaliados que ainda não estão nele."""
+        missing = {
+            movie_id
+            for reviews in reviews_by_user.values()
+            for movie_id, _ in reviews
+            if movie_id not in index
+        }
+        object_ids = [to_object_id(mid) for mid in missing]
+        object_ids = [oid for oid in object_ids if oid is not None]
+        if object_ids:
+            movies = await self.db.movies.find(
+                {"_id": {"$in": object_ids}}, MovieFeatureIndex.PROJECTION
+            ).to_list(length=len(object_ids))
+            index.add_movies(movies)
+
+    @staticmethod
+    def _content_batch_inputs(
+        index: MovieFeatureIndex,
+        user_ids: List[str],
+        reviews_by_user: Dict[str, List[Tuple[str, float]]],
+    ) -> Tuple[sp.csr_matrix, List[int], List[int]]:
+        """
+        Monta a matriz usuários x filmes curtidos (peso 1/n por usuário) e
+        as coordenadas dos filmes já avaliados, para `score_like_matrix`.
+        """
+        rows, cols, values = [], [], []
+        rated_rows, rated_cols = [], []
+        for row, user_id in enumerate(user_ids):
+            reviews = reviews_by_user.get(user_id, [])
+            liked = np.unique(
+                index.positions_of(
+                    mid for mid, rating in reviews if rating >= PROFILE_MIN_RATING
+                )
+            )
+            if len(liked):
+                rows.extend([row] * len(liked))
+                cols.extend(liked.tolist())
+                values.extend([1.0 / len(liked)] * len(liked))
+
+            rated = index.positions_of(mid for mid, _ in reviews)
+            rated_rows.extend([row] * len(rated))
+            rated_cols.extend(rated.tolist())
+
+        likes = sp.csr_matrix(
+            (values, (rows, cols)), shape=(len(user_ids), len(index))
+        )
+        return likes, rated_rows, rated_cols
+
+    @staticmethod
+    def _score_collaborative_batch(
+        model: MatrixFactorizationModel,
+        user_ids: List[str],
+        reviews_by_user: Dict[str, List[Tuple[str, float]]],
+        limit: int,
+    ) -> Dict[str, List[str]]:
+        """Pontua um bloco de usuários pelo modelo de fatoração de matriz."""
+        if not user_ids:
+            return {}
+
+        scores = model.score_users(user_ids)
+        for row, user_id in enumerate(user_ids):
+            rated = model.item_rows(mid for mid, _ in reviews_by_user.get(user_id, []))
+            scores[row, rated[rated >= 0]] = -np.inf
+
+        return {
+            user_id: [model.item_id(i) for i in top_k_indices(scores[row], limit)]
+            for row, user_id in enumerate(user_ids)
+        }
+
+    async def _get_stored_recommendations(
+        self, user_id: str, limit: int, pool: Optional[int] = None
+    ) -> Optional[List[Movie]]:
+        """
+        Lê a lista pré-calculada do usuário. Retorna None se não houver
+        entrada, se ela for mais antiga que RECOMMENDATION_STORE_MAX_AGE_HOURS
+        ou se tiver menos itens do que o pedido (com itens suficientes no
+        catálogo).
+
+        Com `pool`, retorna até `pool` itens da lista (candidatos para a
+        diversificação), exigindo apenas `limit`.
+        """
+        entry = await self.db.user_recommendations.find_one({"_id": str(user_id)})
+        if entry is None:
+            return None
+
+        max_age = timedelta(hours=RECOMMENDATION_STORE_MAX_AGE_HOURS)
+        if entry["generated_at"] < datetime.utcnow() - max_age:
+            return None
+        if len(entry["movie_ids"]) < limit and entry.get("limit", 0) < limit:
+            return None
+
+        return await self._fetch_movies_in_order(
+            entry["movie_ids"][: max(limit, pool or 0)]
+        )
+
+    def _model_version(self) -> str:
+        """Identifica os modelos usados nas recomendações pré-calculadas."""
+        index = get_feature_index(self.db)
+        version = f"content:{index.version}"
+        model = get_mf_model(RECOMMENDATION_MF_MODEL_DIR)
+        if model is not None:
+            version += f"+mf:{model.trained_at}"
+        return version
+
+    async def precompute_user_recommendations(
+        self,
+        limit: int = 20,
+        shard: int = 0,
+        shards: int = 1,
+        batch_size: int = 1000,
+        resume: bool = True,
+    ) -> int:
+        """
+        Calcula o top-N de cada usuário e grava em `user_recommendations`
+        (`movie_ids`, `generated_at`, `model_version`).
+
+        Os usuários são divididos em `shards` faixas contíguas de `_id`, de
+        modo que vários processos podem rodar em paralelo, um por `shard`.
+        O progresso de cada shard é gravado em `recommendation_jobs` após
+        cada lote; com `resume=True`, uma execução interrompida continua do
+        último usuário gravado.
+
+        Returns:
+            Quantidade de usuários processados nesta execução
+        """
+        if not 0 <= shard < shards:
+            raise ValueError(f"Shard inválido: {shard} (de {shards})")
+
+        job_id = f"precompute-recommendations:{shard}/{shards}"
+        checkpoint = await self.db.recommendation_jobs.find_one({"_id": job_id})
+        if resume and checkpoint and checkpoint.get("finished_at") is None:
+            last_user_id = checkpoint.get("last_user_id")
+            print(f"Resuming {job_id} after user {last_user_id}")
+        else:
+            last_user_id = None
+            await self.db.recommendation_jobs.replace_one(
+                {"_id": job_id},
+                {
+                    "started_at": datetime.utcnow(),
+                    "finished_at": None,
+                    "last_user_id": None,
+                    "processed": 0,
+                },
+                upsert=True,
+            )
+
+        bounds = await self._shard_bounds(shard, shards)
+        await get_feature_index(self.db).ensure_built(self.db)
+        model_version = self._model_version()
+
+        processed = 0
+        while bounds is not None:
+            start_id, end_id = bounds
+            id_filter = {}
+            if last_user_id is not None:
+                id_filter["$gt"] = last_user_id
+            elif start_id is not None:
+                id_filter["$gte"] = start_id
+            if end_id is not None:
+                id_filter["$lt"] = end_id
+
+            users = (
+                await self.db.users.find(
+                    {"_id": id_filter} if id_filter else {}, {"_id": 1}
+                )
+                .sort("_id", 1)
+                .limit(batch_size)
+                .to_list(length=batch_size)
+            )
+            if not users:
+                break
+
+            generated_at = datetime.utcnow()
+            operations = []
+            async for user_id, movies in self.iter_recommendations_for_users(
+                [str(user["_id"]) for user in users], limit=limit
+            ):
+                operations.append(
+                    ReplaceOne(
+                        {"_id": user_id},
+                        {
+                            "movie_ids": [ObjectId(m.id) for m in movies or []],
+                            "limit": limit,
+                            "generated_at": generated_at,
+                            "model_version": model_version,
+                        },
+                        upsert=True,
+                    )
+                )
+            await self.db.user_recommendations.bulk_write(operations, ordered=False)
+
+            last_user_id = users[-1]["_id"]
+            processed += len(users)
+            await self.db.recommendation_jobs.update_one(
+                {"_id": job_id},
+                {
+                    "$set": {"last_user_id": last_user_id},
+                    "$inc": {"processed": len(users)},
+                },
+            )
+            print(f"{job_id}: {processed} users written")
+
+        await self.db.recommendation_jobs.update_one(
+            {"_id": job_id}, {"$set": {"finished_at": datetime.utcnow()}}
+        )
+        return processed
+
+    async def _shard_bounds(
+        self, shard: int, shards: int
+    ) -> Optional[Tuple[Optional[ObjectId], Optional[ObjectId]]]:
+        """
+        Limites [início, fim) de `_id` do shard, dividindo os usuários em
+        faixas contíguas de tamanho aproximadamente igual. Um limite None
+        indica faixa aberta daquele lado; retorna None se o shard for vazio.
+        """
+        if shards == 1:
+            return None, None
+
+        total = await self.db.users.count_documents({})
+        first = total * shard // shards
+        last = total * (shard + 1) // shards
+        if first == last:
+            return None
+
+        async def boundary(position: int) -> Optional[ObjectId]:
+            if position <= 0 or position >= total:
+                return None
+            users = (
+                await self.db.users.find({}, {"_id": 1})
+                .sort("_id", 1)
+                .skip(position)
+                .limit(1)
+                .to_list(length=1)
+            )
+            return users[0]["_id"] if users else None
+
+        return await boundary(first), await boundary(last)
+
+    async def train_matrix_factorization(
+        self,
+        output_dir: str = RECOMMENDATION_MF_MODEL_DIR,
+        n_factors: int = 32,
+        regularization: float = 0.1,
+        iterations: int = 10,
+        n_jobs: Optional[int] = None,
+        batch_size: int = 10000,
+    ) -> MatrixFactorizationModel:
+        """
+        Treina o modelo de fatoração de matriz com todas as avaliações da
+        coleção `reviews` e grava os fatores em `output_dir`.
+
+        As avaliações são lidas em lotes de `batch_size` documentos, apenas
+        com os campos necessários.
+        """
+        ratings = []
+        skipped = 0
+        cursor = self.db.reviews.find(
+            {},
+            {"_id": 0, "user_id": 1, "movie_id": 1, "rating": 1},
+            batch_size=batch_size,
+        )
+        async for review in cursor:
+            if review.get("rating") is None:
+                continue
+            user_id, movie_id = str(review["user_id"]), str(review["movie_id"])
+            # IDs que não são ObjectId (dados legados) não podem ser servidos
+            if not (ObjectId.is_valid(user_id) and ObjectId.is_valid(movie_id)):
+                skipped += 1
+                continue
+            ratings.append((user_id, movie_id, review["rating"]))
+        print(f"Loaded {len(ratings)} ratings ({skipped} with invalid IDs skipped)")
+
+        matrix, user_ids, item_ids = build_ratings_matrix(ratings)
+        user_factors, item_factors, global_mean = await get_scoring_executor().run(
+            "als_training",
+            train_als,
+            matrix,
+            timeout=0,
+            n_factors=n_factors,
+            regularization=regularization,
+            iterations=iterations,
+            n_jobs=n_jobs,
+            verbose=True,
+        )
+
+        model = MatrixFactorizationModel(
+            user_ids, item_ids, user_factors, item_factors, global_mean
+        )
+        model.save(output_dir)
+        print(
+            f"Matrix factorization model saved to {output_dir} "
+            f"({len(user_ids)} users, {len(item_ids)} movies)"
+        )
+        return model
+
+    async def get_similar_movies(
+        self,
+        movie_id: str,
+        limit: int = 5,
+        mmr_lambda: Optional[float] = None,
+        similarity_mode: Optional[str] = None,
+    ) -> List[Movie]:
         """
         Encontra filmes similares a um filme específico.
 
         Args:
             movie_id: ID do filme de referência
             limit: Número máximo de filmes similares a retornar
+            mmr_lambda: Se informado, reordena uma lista maior por MMR para
+                diversificar o resultado (ver `_diversify`)
+            similarity_mode: Pontuação sem tabela de vizinhos, "python" ou
+                "aggregate" (padrão: RECOMMENDATION_SIMILARITY_MODE)
+
+        Chamadas concorrentes com os mesmos argumentos compartilham uma
+        única execução (ver `app.utils.coalescing`).
 
         Returns:
             Lista de filmes similares
         """
-        # Buscar o filme de referência
-        movie = await self.db.movies.find_one({"_id": ObjectId(movie_id)})
-        if not movie:
-            return []
+        similarity_mode = similarity_mode or RECOMMENDATION_SIMILARITY_MODE
+        if similarity_mode not in self.SIMILARITY_MODES:
+            raise ValueError(
+                f"Modo de similaridade inválido: {similarity_mode}. "
+                f"Use um de {', '.join(self.SIMILARITY_MODES)}"
+            )
 
-        # Buscar por filmes com gêneros semelhantes
-        similar_movies = (
-            await self.db.movies.find(
-                {
-                    "_id": {"$ne": movie_id},
-                    "$or": [
-                        {"genres": {"$in": movie["genres"]}},
-                        {"director": movie["director"]},
-                        {"actors": {"$in": movie["actors"]}},
-                    ],
-                }
+        if mmr_lambda is not None:
+            # Apenas o pool de candidatos é coalescido; o MMR roda por chamada
+            self._validate_mmr_lambda(mmr_lambda)
+            movies = await self.get_similar_movies(
+                movie_id, self._mmr_pool_size(limit), similarity_mode=similarity_mode
             )
-            .limit(limit * 2)
-            .to_list(length=limit * 2)
+            return await self._diversify(movies, limit, mmr_lambda)
+
+        # Chamadas concorrentes idênticas compartilham uma única execução
+        return await get_single_flight(self.db, "similar").do(
+            (str(movie_id), limit, similarity_mode),
+            lambda: self._load_similar_movies(movie_id, limit, similarity_mode),
         )
 
-        # Calcular similaridade e ordenar
-        scored_movies = []
-        for similar in similar_movies:
-            similarity = calculate_similarity(movie, similar)
-            scored_movies.append((similar, similarity))
+    async def _load_similar_movies(
+        self, movie_id: str, limit: int, similarity_mode: str
+    ) -> List[Movie]:
+        """Calcula os filmes similares (ver `get_similar_movies`)."""
+        # Consultar a tabela de vizinhos pré-calculada
+        neighbors = await self._get_precomputed_neighbors(movie_id, limit)
+        if neighbors is not None:
+            return await self._fetch_movies_in_order(neighbors)
 
-        # Ordenar por similaridade
-        scored_movies.sort(key=lambda x: x[1], reverse=True)
+        # Buscar o filme de referência
+        movie = await self.context.get_movie(ObjectId(movie_id))
+        if not movie:
+            return []
 
-        # Limitar resultados
-        top_movies = [m[0] for m in scored_movies[:limit]]
+        if similarity_mode == "aggregate":
+            top_movies = await self._score_similar_aggregate(movie, limit)
+        else:
+            top_movies = await self._score_similar_python(movie, limit)
 
         # Converter para objetos Movie
         movies = []
@@ -167,37 +793,346 @@ class RecommendationService:
 
         return movies
 
-    async def get_popular_movies(self, limit: int = 10) -> List[Movie]:
+    async def _score_similar_python(self, movie: dict, limit: int) -> List[dict]:
+        """
+        Pontua no processo uma lista curta de candidatos: a do índice ANN em
+        catálogos grandes ou os `limit * 2` primeiros filmes com gênero,
+        diretor ou ator em comum.
+        """
+        # Em catálogos grandes, gerar a lista curta pelo índice ANN
+        similar_movies = await self._get_ann_similar_candidates(
+            str(movie["_id"]), limit
+        )
+
+        # Caso contrário, buscar por filmes com gêneros semelhantes
+        if similar_movies is None:
+            similar_movies = (
+                await self.db.movies.find(
+                    {
+                        "_id": {"$ne": movie["_id"]},
+                        "$or": [
+                            {"genres": {"$in": movie["genres"]}},
+                            {"director": movie["director"]},
+                            {"actors": {"$in": movie["actors"]}},
+                        ],
+                    }
+                )
+                .limit(limit * 2)
+                .to_list(length=limit * 2)
+            )
+
+        # Calcular similaridade de todos os candidatos de uma vez e ordenar
+        # (ordenação estável, como a versão escalar)
+        scores = await get_scoring_executor().run(
+            "similarity_scoring", batch_calculate_similarity, movie, similar_movies
+        )
+        order = np.argsort(-scores, kind="stable")
+        return [similar_movies[i] for i in order[:limit]]
+
+    async def _score_similar_aggregate(self, movie: dict, limit: int) -> List[dict]:
+        """
+        Pontua todo o catálogo no MongoDB (`similarity_pipeline`): apenas os
+        `limit` mais similares são transferidos.
+        """
+        pipeline = similarity_pipeline(movie, limit)
+        if not pipeline:
+            return []
+        return await self.db.movies.aggregate(pipeline).to_list(length=limit)
+
+    async def benchmark_similarity(
+        self, samples: int = 20, limit: int = 10
+    ) -> Dict[str, Dict[str, float]]:
+        """
+        Compara os modos de similaridade "python" e "aggregate" em `samples`
+        filmes aleatórios: tempo médio, p95 e máximo por modo, em ms, e a
+        fração do top-`limit` exato (aggregate) encontrada pelo modo python
+        ("recall").
+        """
+        sample = await self.db.movies.aggregate(
+            [{"$sample": {"size": samples}}]
+        ).to_list(length=samples)
+        scorers = {
+            "python": self._score_similar_python,
+            "aggregate": self._score_similar_aggregate,
+        }
+        timings: Dict[str, List[float]] = {mode: [] for mode in scorers}
+        recalls = []
+        for movie in sample:
+            results = {}
+            for mode, scorer in scorers.items():
+                started = time.perf_counter()
+                results[mode] = await scorer(movie, limit)
+                timings[mode].append((time.perf_counter() - started) * 1000)
+
+            # Empates no limite do top-k contam como acerto
+            exact = [calculate_similarity(movie, m) for m in results["aggregate"]]
+            if exact:
+                found = [calculate_similarity(movie, m) for m in results["python"]]
+                hits = sum(score >= min(exact) for score in found)
+                recalls.append(min(hits, len(exact)) / len(exact))
+
+        report: Dict[str, Dict[str, float]] = {}
+        for mode, values in timings.items():
+            values = np.asarray(values) if values else np.zeros(1)
+            report[mode] = {
+                "avg_ms": round(float(values.mean()), 3),
+                "p95_ms": round(float(np.percentile(values, 95)), 3),
+                "max_ms": round(float(values.max()), 3),
+            }
+        report["python"]["recall"] = (
+            round(float(np.mean(recalls)), 3) if recalls else 1.0
+        )
+        return report
+
+    async def _get_ann_similar_candidates(
+        self, movie_id: str, limit: int
+    ) -> Optional[List[dict]]:
+        """
+        Busca candidatos similares ao filme pelo índice ANN do catálogo.
+
+        Retorna None quando o catálogo é pequeno demais para ter índice ANN
+        (ou o filme ainda não está nele); a pontuação exata dos candidatos
+        é feita por `calculate_similarity`.
+        """
+        index = await get_feature_index(self.db).ensure_built(self.db)
+        shortlist = index.shortlist(
+            index.rows([movie_id]),
+            min_size=limit + 1,
+            max_candidates=RECOMMENDATION_ANN_CANDIDATES,
+        )
+        if shortlist is None:
+            return None
+
+        candidate_ids = [
+            ObjectId(index.movie_ids[position])
+            for position in shortlist
+            if index.movie_ids[position] != movie_id
+        ]
+        return await self.db.movies.find({"_id": {"$in": candidate_ids}}).to_list(
+            length=len(candidate_ids)
+        )
+
+    @staticmethod
+    def _validate_mmr_lambda(mmr_lambda: float) -> None:
+        if not 0.0 <= mmr_lambda <= 1.0:
+            raise ValueError("mmr_lambda deve estar entre 0 e 1")
+
+    @staticmethod
+    def _mmr_pool_size(limit: int) -> int:
+        """Tamanho da lista gerada antes da diversificação."""
+        pool = limit * RECOMMENDATION_MMR_POOL_FACTOR
+        return max(limit, min(pool, RECOMMENDATION_MMR_CANDIDATES))
+
+    async def _diversify(
+        self, movies: List[Movie], limit: int, mmr_lambda: float
+    ) -> List[Movie]:
+        """
+        Reordena `movies` (já ordenados por relevância) por Maximal Marginal
+        Relevance e retorna os `limit` primeiros.
+
+        A relevância vem da posição na lista e a similaridade entre os
+        candidatos das linhas TF-IDF do índice de features (título, gêneros,
+        diretor e atores), então filmes do mesmo diretor ou com os mesmos
+        gêneros são penalizados após o primeiro escolhido. Filmes fora do
+        índice vão para o final, na ordem original.
+        """
+        if len(movies) <= 1:
+            return movies[:limit]
+
+        index = await get_feature_index(self.db).ensure_built(self.db)
+        indexed = [movie for movie in movies if movie.id in index]
+        others = [movie for movie in movies if movie.id not in index]
+
+        started = time.perf_counter()
+        order = mmr_rerank(
+            rank_relevance(len(indexed)),
+            index.rows([movie.id for movie in indexed]),
+            limit,
+            mmr_lambda,
+        )
+        elapsed = (time.perf_counter() - started) * 1000
+        print(
+            f"MMR re-ranking: {len(indexed)} candidates -> {len(order)} "
+            f"in {elapsed:.2f}ms"
+        )
+
+        return ([indexed[i] for i in order] + others)[:limit]
+
+    async def _get_precomputed_neighbors(
+        self, movie_id: str, limit: int
+    ) -> Optional[List[ObjectId]]:
+        """
+        Retorna os vizinhos do filme nos artefatos mapeados em memória ou,
+        na falta deles, na tabela `movie_neighbors`.
+
+        Retorna None se o filme não estiver na tabela ou se a tabela tiver
+        sido gerada com menos vizinhos do que o solicitado.
+        """
+        table = NeighborTable.from_artifacts(
+            load_artifacts(RECOMMENDATION_ARTIFACTS_DIR)
+        )
+        if table is not None:
+            neighbors = table.lookup(movie_id)
+            if neighbors is not None and (len(neighbors) >= limit or table.k < limit):
+                return [ObjectId(neighbor) for neighbor in neighbors[:limit]]
+
+        entry = await self.db.movie_neighbors.find_one({"_id": ObjectId(movie_id)})
+        if not entry:
+            return None
+
+        neighbors = entry.get("neighbors", [])
+        if len(neighbors) < limit and len(neighbors) >= entry.get("k", 0):
+            return None
+        return neighbors[:limit]
+
+    async def _fetch_movies_in_order(self, movie_ids: List[ObjectId]) -> List[Movie]:
+        """
+        Busca vários filmes em uma única consulta preservando a ordem dos IDs
+        (filmes já lidos nesta requisição vêm do contexto).
+        """
+        if not movie_ids:
+            return []
+
+        movies = []
+        for movie_data in await self.context.get_movies(movie_ids):
+            movie_data["id"] = str(movie_data["_id"])
+            try:
+                movies.append(Movie.from_dict(movie_data))
+            except Exception as e:
+                print(f"Error creating Movie object: {str(e)}")
+        return movies
+
+    async def build_neighbor_table(self, k: int = RECOMMENDATION_NEIGHBORS_K) -> int:
+        """
+        Calcula os `k` filmes mais similares de cada filme do catálogo e
+        grava o resultado na coleção `movie_neighbors`.
+
+        A similaridade é a mesma de `calculate_similarity`, calculada de
+        forma vetorizada sobre o catálogo completo. Entradas de filmes que
+        não existem mais são removidas ao final.
+
+        Args:
+            k: Número de vizinhos armazenados por filme
+
+        Returns:
+            Quantidade de filmes gravados na tabela
+        """
+        movies = await self.db.movies.find(
+            {}, {"_id": 1, "genres": 1, "director": 1, "actors": 1}
+        ).to_list(length=None)
+
+        neighbors, scores = await get_scoring_executor().run(
+            "neighbor_table", top_k_neighbors, movies, k, timeout=0
+        )
+        built_at = datetime.utcnow()
+
+        operations = []
+        for i, movie in enumerate(movies):
+            valid = neighbors[i] >= 0
+            operations.append(
+                ReplaceOne(
+                    {"_id": movie["_id"]},
+                    {
+                        "neighbors": [movies[j]["_id"] for j in neighbors[i][valid]],
+                        "scores": scores[i][valid].tolist(),
+                        "k": k,
+                        "built_at": built_at,
+                    },
+                    upsert=True,
+                )
+            )
+
+        for start in range(0, len(operations), 1000):
+            await self.db.movie_neighbors.bulk_write(
+                operations[start : start + 1000], ordered=False
+            )
+
+        await self.db.movie_neighbors.delete_many({"built_at": {"$lt": built_at}})
+        print(f"Neighbor table built for {len(operations)} movies (k={k})")
+        return len(operations)
+
+    async def build_model_artifacts(
+        self,
+        output_dir: str = RECOMMENDATION_ARTIFACTS_DIR,
+        k: int = RECOMMENDATION_NEIGHBORS_K,
+    ) -> str:
+        """
+        Ajusta o índice de features e calcula a tabela de vizinhos de todo o
+        catálogo, gravando-os como artefatos mapeáveis em memória (ver
+        `app.utils.artifacts`). Os workers carregam esses arquivos na
+        partida, sem reajustar nada.
+
+        Args:
+            output_dir: Diretório dos artefatos (substituído por inteiro)
+            k: Número de vizinhos armazenados por filme
+
+        Returns:
+            Diretório gravado
+        """
+        index = create_feature_index(artifacts_dir=None)
+        await index.build(self.db)
+
+        # IDs ordenados: a consulta da tabela é uma busca binária
+        movies = await self.db.movies.find(
+            {}, {"_id": 1, "genres": 1, "director": 1, "actors": 1}
+        ).to_list(length=None)
+        movies.sort(key=lambda movie: str(movie["_id"]))
+        neighbors, scores = await get_scoring_executor().run(
+            "neighbor_table", top_k_neighbors, movies, k, timeout=0
+        )
+
+        writer = ArtifactWriter(output_dir)
+        index.write_artifacts(writer)
+        writer.add_array(
+            "neighbor_movie_ids",
+            np.asarray([str(movie["_id"]) for movie in movies], dtype=str),
+        )
+        writer.add_array("neighbors", neighbors.astype(np.int32))
+        writer.add_array("neighbor_scores", scores.astype(np.float32))
+        writer.add_metadata("neighbors", {"k": k})
+        path = writer.commit()
+        print(f"Model artifacts written to {path} ({len(index)} movies, k={k})")
+        return path
+
+    async def get_popular_movies(
+        self, limit: int = 10, ranking: str = "popularity"
+    ) -> List[Movie]:
         """
         Retorna os filmes mais populares baseado em avaliações.
 
         Args:
             limit: Número máximo de filmes a retornar
+            ranking: "popularity" (número de avaliações e média) ou
+                "weighted" (classificação ponderada do IMDB com a média
+                global real)
+
+        Chamadas concorrentes com os mesmos argumentos compartilham uma
+        única consulta (ver `app.utils.coalescing`).
 
         Returns:
             Lista dos filmes mais populares
         """
-        # Buscar filmes com melhor média de avaliações e mais avaliações
-        popular_movies = await self.db.movies.aggregate(
-            [
-                {
-                    "$lookup": {
-                        "from": "reviews",
-                        "localField": "_id",
-                        "foreignField": "movie_id",
-                        "as": "reviews",
-                    }
-                },
-                {
-                    "$addFields": {
-                        "review_count": {"$size": "$reviews"},
-                        "avg_rating": {"$avg": "$reviews.rating"},
-                    }
-                },
-                {"$sort": {"review_count": -1, "avg_rating": -1}},
-                {"$limit": limit},
-            ]
-        ).to_list(length=limit)
+        if ranking not in ("popularity", "weighted"):
+            raise ValueError(f"Critério de ranking inválido: {ranking}")
+
+        # Chamadas concorrentes idênticas compartilham uma única execução
+        return await get_single_flight(self.db, "popular").do(
+            (limit, ranking), lambda: self._load_popular_movies(limit, ranking)
+        )
+
+    async def _load_popular_movies(self, limit: int, ranking: str) -> List[Movie]:
+        """Consulta os filmes populares (ver `get_popular_movies`)."""
+        if ranking == "weighted":
+            return await self.get_top_rated_movies(limit)
+
+        # Agregados mantidos em cada filme (ver app/utils/rating_aggregates):
+        # top-k lido diretamente do índice review_count/rating_avg
+        popular_movies = (
+            await self.db.movies.find({})
+            .sort(POPULARITY_SORT)
+            .limit(limit)
+            .to_list(length=limit)
+        )
 
         # Verificar e processar cada filme para garantir que o ID está presente
         movies = []
@@ -214,50 +1149,65 @@ class RecommendationService:
 
         return movies
 
-    async def _get_user_preferred_genres(self, user_id: str) -> List[str]:
+    async def get_top_rated_movies(
+        self, limit: int = 10, min_reviews: int = 5
+    ) -> List[Movie]:
+        """
+        Retorna os filmes com maior classificação ponderada (IMDB).
+
+        As contagens e somas de notas de todo o catálogo vêm de uma única
+        agregação mantida em memória e atualizada a cada nova avaliação.
+
+        Args:
+            limit: Número máximo de filmes a retornar
+            min_reviews: Número mínimo de avaliações para peso total
+
+        Returns:
+            Lista dos filmes mais bem classificados
+        """
+        stats = await get_rating_stats(self.db).ensure_loaded(self.db)
+        movie_ids = [
+            to_object_id(movie_id) for movie_id in stats.top_rated(limit, min_reviews)
+        ]
+        return await self._fetch_movies_in_order(
+            [movie_id for movie_id in movie_ids if movie_id is not None]
+        )
+
+    async def _get_user_preferred_genres(
+        self, user_id: str, reviews: Optional[List[dict]] = None
+    ) -> List[str]:
         """
         Identifica os gêneros de filmes preferidos por um usuário
         baseado em suas avaliações anteriores.
 
         Args:
             user_id: ID do usuário
+            reviews: Avaliações do usuário já carregadas; quando ausente,
+                são buscadas na coleção `reviews`
 
         Returns:
             Lista de gêneros preferidos
         """
-        # Buscar avaliações do usuário - tentando tanto ObjectId quanto string
-        reviews = await self.db.reviews.find({"user_id": ObjectId(user_id)}).to_list(
-            length=100
-        )
-
-        # Se não encontrar, tenta com user_id como string
-        if not reviews:
-            reviews = await self.db.reviews.find({"user_id": user_id}).to_list(
-                length=100
-            )
+        if reviews is None:
+            reviews = await self._get_user_reviews(user_id)
 
         if not reviews:
             # Se não houver avaliações, retornar gêneros populares
             return await self._get_popular_genres()
 
-        # Buscar filmes avaliados positivamente e normalizar para ObjectId
-        movie_ids = []
-        for review in reviews:
-            if review.get("rating", 0) >= 4.0:
-                movie_id = review["movie_id"]
-                if isinstance(movie_id, ObjectId):
-                    movie_ids.append(movie_id)
-                else:
-                    movie_ids.append(ObjectId(movie_id))
+        # Perfil de gosto persistido: contagem de gêneros já agregada
+        profile = await load_user_profile(self.db, user_id)
+        if profile is not None and profile.genre_counts:
+            return profile.preferred_genres(5)
 
-        if not movie_ids:
-            return await self._get_popular_genres()
-
-        # Buscar gêneros dos filmes bem avaliados
-        movies = await self.db.movies.find({"_id": {"$in": movie_ids}}).to_list(
-            length=100
+        # Buscar os gêneros dos filmes bem avaliados em uma única consulta
+        movies = await MovieRecommender.get_user_preferences(
+            self.db, user_id, reviews=reviews, projection={"genres": 1}
         )
 
+        if not movies:
+            return await self._get_popular_genres()
+
         # Contar frequência dos gêneros
         genre_counts = {}
         for movie in movies:
@@ -274,20 +1224,10 @@ class RecommendationService:
         """
         Retorna os gêneros de filmes mais populares no sistema.
 
+        As contagens vêm de uma agregação `$unwind`/`$group` mantida em
+        cache no processo (ver `get_popular_genres`).
+
         Returns:
             Lista dos gêneros mais populares
         """
-        # Buscar todos os filmes
-        movies = await self.db.movies.find().to_list(length=1000)
-
-        # Contar frequência dos gêneros
-        genre_counts = {}
-        for movie in movies:
-            for genre in movie.get("genres", []):
-                genre_counts[genre] = genre_counts.get(genre, 0) + 1
-
-        # Ordenar por frequência
-        sorted_genres = sorted(genre_counts.items(), key=lambda x: x[1], reverse=True)
-
-        # Retornar os gêneros mais frequentes
-        return [genre for genre, _ in sorted_genres[:5]]
+        return await get_popular_genres(self.db, limit=5)
@@ -0,0 +1,121 @@
+from typing import Dict, List, Optional
+
+import numpy as np
+import scipy.sparse as sp
+
+
+class RandomProjectionLSH:
+    """
+    Índice aproximado de vizinhos mais próximos (ANN) para similaridade de
+    cosseno, usando LSH com hiperplanos aleatórios.
+
+    Cada tabela associa um código de `n_bits` bits (o lado de cada hiperplano
+    em que o vetor cai) à lista de posições com aquele código. A consulta
+    visita o bucket exato de cada tabela e mais `n_probes` buckets vizinhos
+    (trocando os bits cuja projeção ficou mais próxima de zero).
+
+    Ajuste de recall/latência:
+    - mais `n_tables` ou `n_probes` aumentam o recall e o custo da consulta
+    - mais `n_bits` deixam os buckets menores (consultas mais rápidas,
+      recall menor)
+
+    O índice retorna apenas posições candidatas; a pontuação exata da lista
+    curta fica a cargo do chamador.
+    """
+
+    def __init__(
+        self,
+        n_features: int,
+        n_tables: int = 8,
+        n_bits: int = 12,
+        n_probes: int = 2,
+        seed: int = 42,
+    ):
+        if n_bits > 62:
+            raise ValueError("n_bits deve ser no máximo 62")
+
+        rng = np.random.default_rng(seed)
+        self.n_features = n_features
+        self.n_tables = n_tables
+        self.n_bits = n_bits
+        self.n_probes = n_probes
+        self.hyperplanes = rng.standard_normal(
+            (n_features, n_tables * n_bits)
+        ).astype(np.float32)
+        self._powers = (1 << np.arange(n_bits, dtype=np.int64)).astype(np.int64)
+        self._tables: List[Dict[int, List[int]]] = [{} for _ in range(n_tables)]
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _project(self, vectors) -> np.ndarray:
+        projections = vectors @ self.hyperplanes
+        if sp.issparse(projections):
+            projections = projections.toarray()
+        projections = np.asarray(projections, dtype=np.float32)
+        return projections.reshape(-1, self.n_tables, self.n_bits)
+
+    def _codes(self, projections: np.ndarray) -> np.ndarray:
+        return (projections > 0).astype(np.int64) @ self._powers
+
+    def add(self, vectors) -> np.ndarray:
+        """
+        Insere vetores no índice. As posições atribuídas são sequenciais,
+        continuando a partir do tamanho atual.
+
+        Returns:
+            Posições atribuídas aos vetores inseridos
+        """
+        return self.add_codes(self.encode(vectors))
+
+    def encode(self, vectors) -> np.ndarray:
+        """Códigos (vetores x tabelas) dos vetores, sem inseri-los."""
+        return self._codes(self._project(vectors))
+
+    def add_codes(self, codes: np.ndarray) -> np.ndarray:
+        """
+        Insere posições a partir de códigos já calculados por `encode` (por
+        exemplo, lidos de um artefato), sem projetar os vetores novamente.
+        """
+        codes = np.asarray(codes, dtype=np.int64)
+        positions = np.arange(self.size, self.size + codes.shape[0])
+
+        for table, table_codes in zip(self._tables, codes.T):
+            for position, code in zip(positions.tolist(), table_codes.tolist()):
+                table.setdefault(code, []).append(position)
+
+        self.size += codes.shape[0]
+        return positions
+
+    def candidates(
+        self,
+        vector,
+        max_candidates: Optional[int] = None,
+        n_probes: Optional[int] = None,
+    ) -> np.ndarray:
+        """
+        Retorna as posições candidatas para um vetor de consulta.
+
+        Candidatos dos buckets exatos vêm antes dos encontrados nas sondagens
+        vizinhas; `max_candidates` corta a lista nessa ordem.
+        """
+        n_probes = self.n_probes if n_probes is None else n_probes
+        projections = self._project(vector)[0]
+        codes = self._codes(projections[None, :, :])[0]
+
+        found: Dict[int, None] = {}
+        for table, code in zip(self._tables, codes.tolist()):
+            found.update(dict.fromkeys(table.get(code, ())))
+
+        if n_probes > 0:
+            # Bits com projeção mais próxima de zero são os mais incertos
+            uncertain = np.argsort(np.abs(projections), axis=1)[:, :n_probes]
+            for t, (table, code) in enumerate(zip(self._tables, codes.tolist())):
+                for bit in uncertain[t].tolist():
+                    found.update(dict.fromkeys(table.get(code ^ (1 << bit), ())))
+
+        result = np.fromiter(found, dtype=np.int64, count=len(found))
+        if max_candidates is not None:
+            result = result[:max_candidates]
+        return result
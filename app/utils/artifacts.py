@@ -0,0 +1,205 @@
+import json
+import os
+import shutil
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+
+from app.config import RECOMMENDATION_ARTIFACT_RETENTION_SECONDS
+
+MANIFEST = "manifest.json"
+CURRENT = "current"
+VERSIONS = "versions"
+FORMAT_VERSION = 1
+
+
+class ArtifactWriter:
+    """
+    Grava artefatos de modelo (arrays `.npy` e matrizes CSR em trigêmeos
+    `data`/`indices`/`indptr`) e um `manifest.json` descrevendo-os.
+
+    Cada build é gravado em um diretório próprio em `path/versions/` e
+    publicado em `commit` trocando o link simbólico `path/current` de uma
+    vez (`os.replace`), então `path` sempre aponta para uma versão completa.
+    Processos que já mapearam a versão anterior continuam lendo os arquivos
+    antigos; versões substituídas só são removidas depois de
+    `retention_seconds`.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        retention_seconds: int = RECOMMENDATION_ARTIFACT_RETENTION_SECONDS,
+    ):
+        self.path = path
+        self.retention_seconds = retention_seconds
+        self.version = f"{datetime.utcnow():%Y%m%dT%H%M%S%f}-{os.getpid()}"
+        self._staging = os.path.join(path, VERSIONS, self.version)
+        self._manifest: Dict[str, Any] = {
+            "format": FORMAT_VERSION,
+            "arrays": {},
+            "matrices": {},
+            "metadata": {},
+        }
+        os.makedirs(self._staging)
+
+    def add_array(self, name: str, array: np.ndarray) -> None:
+        array = np.ascontiguousarray(array)
+        np.save(os.path.join(self._staging, f"{name}.npy"), array, allow_pickle=False)
+        self._manifest["arrays"][name] = {
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+        }
+
+    def add_csr(self, name: str, matrix: sp.csr_matrix) -> None:
+        matrix = sp.csr_matrix(matrix)
+        for part in ("data", "indices", "indptr"):
+            np.save(
+                os.path.join(self._staging, f"{name}.{part}.npy"),
+                np.ascontiguousarray(getattr(matrix, part)),
+                allow_pickle=False,
+            )
+        self._manifest["matrices"][name] = {
+            "dtype": matrix.dtype.str,
+            "shape": list(matrix.shape),
+            "nnz": int(matrix.nnz),
+        }
+
+    def add_metadata(self, name: str, metadata: Dict[str, Any]) -> None:
+        self._manifest["metadata"][name] = metadata
+
+    def commit(self) -> str:
+        """
+        Grava o manifesto e publica a versão em `path/current`.
+
+        Returns:
+            Diretório da versão publicada
+        """
+        self._manifest["built_at"] = datetime.utcnow().isoformat()
+        with open(os.path.join(self._staging, MANIFEST), "w", encoding="utf-8") as f:
+            json.dump(self._manifest, f)
+
+        current = os.path.join(self.path, CURRENT)
+        previous = os.path.realpath(current) if os.path.islink(current) else None
+
+        # Link relativo criado com nome temporário e trocado atomicamente
+        link = f"{current}.tmp-{os.getpid()}"
+        if os.path.lexists(link):
+            os.remove(link)
+        os.symlink(os.path.join(VERSIONS, self.version), link)
+        os.replace(link, current)
+
+        # A data de modificação da versão substituída marca o início da retenção
+        if previous and os.path.isdir(previous):
+            os.utime(previous)
+        self._remove_expired_versions()
+        return self._staging
+
+    def _remove_expired_versions(self) -> None:
+        """Remove versões que não são a atual e já passaram da retenção."""
+        versions_dir = os.path.join(self.path, VERSIONS)
+        current = os.path.realpath(os.path.join(self.path, CURRENT))
+        now = time.time()
+        for name in os.listdir(versions_dir):
+            version = os.path.join(versions_dir, name)
+            if os.path.realpath(version) == current:
+                continue
+            try:
+                expired = now - os.stat(version).st_mtime >= self.retention_seconds
+            except OSError:
+                continue
+            if expired:
+                shutil.rmtree(version, ignore_errors=True)
+
+
+def resolve_version(path: str) -> str:
+    """
+    Diretório da versão publicada em `path`. Diretórios gravados antes do
+    link `current` (arquivos direto em `path`) são lidos como estão.
+    """
+    current = os.path.join(path, CURRENT)
+    if os.path.islink(current):
+        return os.path.realpath(current)
+    return path
+
+
+class ModelArtifacts:
+    """
+    Artefatos gravados por `ArtifactWriter`, abertos com `numpy.memmap`.
+
+    Os arrays não são copiados para a memória do processo: todos os workers
+    do mesmo host compartilham as páginas do arquivo no cache do sistema
+    operacional. Os arrays são somente leitura.
+    """
+
+    def __init__(self, path: str, manifest: Dict[str, Any]):
+        self.path = path
+        self.manifest = manifest
+
+    @property
+    def built_at(self) -> Optional[str]:
+        return self.manifest.get("built_at")
+
+    def has(self, name: str) -> bool:
+        return name in self.manifest["arrays"] or name in self.manifest["matrices"]
+
+    def array(self, name: str) -> np.ndarray:
+        return np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r")
+
+    def csr(self, name: str) -> sp.csr_matrix:
+        shape = tuple(self.manifest["matrices"][name]["shape"])
+        parts = [
+            np.load(os.path.join(self.path, f"{name}.{part}.npy"), mmap_mode="r")
+            for part in ("data", "indices", "indptr")
+        ]
+        matrix = sp.csr_matrix(shape, dtype=parts[0].dtype)
+        # Atribuição direta: o construtor do scipy copiaria os arrays mapeados
+        matrix.data, matrix.indices, matrix.indptr = parts
+        return matrix
+
+    def metadata(self, name: str) -> Dict[str, Any]:
+        return self.manifest["metadata"].get(name, {})
+
+    @classmethod
+    def open(cls, path: str) -> "ModelArtifacts":
+        """Abre a versão publicada em `path` (arrays lidos sempre dela)."""
+        path = resolve_version(path)
+        with open(os.path.join(path, MANIFEST), encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("format") != FORMAT_VERSION:
+            raise ValueError(
+                f"Formato de artefato não suportado: {manifest.get('format')}"
+            )
+        return cls(path, manifest)
+
+
+_opened: Dict[str, Tuple[Tuple[str, int, int], ModelArtifacts]] = {}
+
+
+def load_artifacts(path: Optional[str]) -> Optional[ModelArtifacts]:
+    """
+    Retorna os artefatos publicados em `path`, reabrindo-os quando a versão
+    é trocada (novo build: outro diretório, arquivo ou data de modificação).
+    Retorna None se não houver artefatos.
+    """
+    if not path:
+        return None
+    resolved = resolve_version(path)
+    try:
+        stat = os.stat(os.path.join(resolved, MANIFEST))
+    except OSError:
+        return None
+    version = (resolved, stat.st_ino, stat.st_mtime_ns)
+
+    cached = _opened.get(path)
+    if cached is None or cached[0] != version:
+        try:
+            cached = (version, ModelArtifacts.open(resolved))
+        except Exception as e:
+            print(f"Error loading model artifacts: {str(e)}")
+            return None
+        _opened[path] = cached
+    return cached[1]
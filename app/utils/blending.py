@@ -0,0 +1,269 @@
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.config import RECOMMENDATION_MF_MODEL_DIR
+from app.utils.executor import TaskStats
+from app.utils.matrix_factorization import get_mf_model
+from app.utils.rating_stats import get_rating_stats
+from app.utils.recommendation import get_feature_index
+from app.utils.time_index import document_timestamp, recency_weights
+
+NORMALIZATIONS = ("minmax", "rank", "zscore", "none")
+
+
+class Signal(ABC):
+    """
+    Sinal de ranqueamento: uma pontuação densa por candidato, alinhada à
+    ordem de `movie_ids`. Candidatos sem informação recebem 0.0.
+    """
+
+    name = "signal"
+
+    @abstractmethod
+    async def compute(self, db, context, movie_ids: List[str]) -> np.ndarray:
+        """Pontuação de cada candidato, na ordem de `movie_ids`."""
+
+
+class ContentSignal(Signal):
+    """Similaridade de cosseno entre o filme e o centróide do perfil."""
+
+    name = "content"
+
+    async def compute(self, db, context, movie_ids: List[str]) -> np.ndarray:
+        scores = np.zeros(len(movie_ids))
+        profile = context.profile
+        if profile is None or not profile.weight:
+            return scores
+
+        index = await get_feature_index(db).ensure_built(db)
+        known = [i for i, movie_id in enumerate(movie_ids) if movie_id in index]
+        rows = index.rows(movie_ids[i] for i in known)
+        scores[known] = (rows @ profile.centroid.T).toarray().ravel()
+        return scores
+
+
+class CollaborativeSignal(Signal):
+    """Nota prevista pela fatoração de matriz (zero sem modelo ou usuário)."""
+
+    name = "collaborative"
+
+    async def compute(self, db, context, movie_ids: List[str]) -> np.ndarray:
+        model = get_mf_model(RECOMMENDATION_MF_MODEL_DIR)
+        if model is None or not model.has_user(context.user_id):
+            return np.zeros(len(movie_ids))
+        return model.score_items_for(context.user_id, movie_ids)
+
+
+class RatingSignal(Signal):
+    """Classificação ponderada (estilo IMDB) das avaliações, em [0, 1]."""
+
+    name = "rating"
+
+    async def compute(self, db, context, movie_ids: List[str]) -> np.ndarray:
+        stats = await get_rating_stats(db).ensure_loaded(db)
+        return stats.weighted_ratings_for(movie_ids) / 5.0
+
+
+class RecencySignal(Signal):
+    """
+    Decaimento exponencial pela idade do filme no catálogo (horário do
+    ObjectId), com meia-vida de `half_life_days`.
+    """
+
+    name = "recency"
+
+    def __init__(self, half_life_days: float = 30.0):
+        self.half_life_days = half_life_days
+
+    async def compute(self, db, context, movie_ids: List[str]) -> np.ndarray:
+        timestamps = [document_timestamp({"_id": movie_id}) for movie_id in movie_ids]
+        known = [i for i, ts in enumerate(timestamps) if ts is not None]
+        scores = np.zeros(len(movie_ids))
+        scores[known] = recency_weights(
+            [timestamps[i] for i in known], self.half_life_days
+        )
+        return scores
+
+
+class BlendConfig:
+    """
+    Pesos por sinal e normalização aplicada a cada sinal antes da soma.
+    Sinais com peso zero não são calculados.
+    """
+
+    def __init__(
+        self, name: str, weights: Dict[str, float], normalization: str = "minmax"
+    ):
+        if normalization not in NORMALIZATIONS:
+            raise ValueError(f"Normalização inválida: {normalization}")
+        self.name = name
+        self.weights = {signal: float(w) for signal, w in weights.items() if w}
+        self.normalization = normalization
+
+    @classmethod
+    def from_document(cls, document: Dict[str, Any]) -> "BlendConfig":
+        return cls(
+            str(document["_id"]),
+            document.get("weights", {}),
+            document.get("normalization", "minmax"),
+        )
+
+
+BLEND_CONFIGS: Dict[str, BlendConfig] = {
+    config.name: config
+    for config in (
+        BlendConfig(
+            "default",
+            {
+                "content": 1.0,
+                "collaborative": 0.5,
+                "rating": 0.3,
+                "recency": 0.1,
+                "sources": 0.1,
+            },
+        ),
+        BlendConfig("content", {"content": 1.0, "sources": 0.1}),
+        BlendConfig("collaborative", {"collaborative": 1.0, "rating": 0.2}),
+        BlendConfig("popular", {"rating": 1.0, "sources": 0.2}),
+        BlendConfig("fresh", {"content": 0.6, "recency": 0.6, "rating": 0.2}),
+    )
+}
+
+
+async def get_blend_config(db, name: Optional[str]) -> BlendConfig:
+    """
+    Retorna a configuração `name`: primeiro a coleção `blend_configs` (para
+    experimentos sem novo deploy), depois as configurações embutidas.
+    Sem nome, retorna a configuração "default".
+
+    Raises:
+        ValueError: Se a configuração não existir
+    """
+    name = name or "default"
+    document = await db.blend_configs.find_one({"_id": name})
+    if document is not None:
+        return BlendConfig.from_document(document)
+    if name in BLEND_CONFIGS:
+        return BLEND_CONFIGS[name]
+    raise ValueError(f"Configuração de blend desconhecida: {name}")
+
+
+def normalize_scores(scores: np.ndarray, method: str) -> np.ndarray:
+    """
+    Normaliza uma coluna de pontuações (ou uma matriz sinais x candidatos,
+    linha a linha) para que sinais de escalas diferentes sejam somáveis.
+
+    - minmax: [0, 1] pelo mínimo e máximo (constante vira 0)
+    - rank: posição relativa em [0, 1]
+    - zscore: média 0 e desvio 1 (constante vira 0)
+    - none: sem alteração
+    """
+    scores = np.atleast_2d(np.asarray(scores, dtype=np.float64))
+    if method == "none" or scores.shape[1] == 0:
+        return scores
+    if method == "rank":
+        ranks = np.argsort(np.argsort(scores, axis=1, kind="stable"), axis=1)
+        return ranks / max(scores.shape[1] - 1, 1)
+
+    if method == "zscore":
+        center = scores.mean(axis=1, keepdims=True)
+        scale = scores.std(axis=1, keepdims=True)
+    else:
+        center = scores.min(axis=1, keepdims=True)
+        scale = scores.max(axis=1, keepdims=True) - center
+    scale[scale == 0] = np.inf
+    return (scores - center) / scale
+
+
+class BlendingEngine:
+    """
+    Combina vários sinais de ranqueamento em uma única pontuação.
+
+    Os sinais com peso na configuração rodam em paralelo, cada um gerando
+    um array denso alinhado aos candidatos; a normalização e a soma
+    ponderada são feitas em uma única operação sobre a matriz
+    sinais x candidatos. O tempo de cada sinal é reportado.
+    """
+
+    def __init__(self, signals: Sequence[Signal]):
+        self.signals = {signal.name: signal for signal in signals}
+        self._stats: Dict[str, TaskStats] = {}
+
+    async def blend(
+        self,
+        db,
+        context,
+        movie_ids: List[str],
+        config: BlendConfig,
+        provided: Optional[Dict[str, np.ndarray]] = None,
+    ) -> Tuple[np.ndarray, Dict[str, Dict[str, float]]]:
+        """
+        Args:
+            provided: Sinais já calculados pelo chamador (ex.: "sources")
+
+        Returns:
+            Tupla (pontuação final por candidato, relatório por sinal com
+            peso e duração em ms)
+        """
+        provided = provided or {}
+        names = [
+            name
+            for name in config.weights
+            if name in self.signals or name in provided
+        ]
+        results = await asyncio.gather(
+            *(self._compute(name, db, context, movie_ids, provided) for name in names)
+        )
+
+        report = {
+            name: {"weight": config.weights[name], "ms": ms}
+            for name, (_, ms) in zip(names, results)
+        }
+        for name, (_, ms) in zip(names, results):
+            self._stats.setdefault(name, TaskStats()).record(ms, 0.0)
+        if not names:
+            return np.zeros(len(movie_ids)), report
+
+        matrix = normalize_scores(
+            np.vstack([scores for scores, _ in results]), config.normalization
+        )
+        weights = np.asarray([config.weights[name] for name in names])
+        return weights @ matrix, report
+
+    async def _compute(
+        self, name: str, db, context, movie_ids: List[str], provided
+    ) -> Tuple[np.ndarray, float]:
+        started = time.perf_counter()
+        if name in provided:
+            scores = np.asarray(provided[name], dtype=np.float64)
+        else:
+            scores = await self.signals[name].compute(db, context, movie_ids)
+        return scores, round((time.perf_counter() - started) * 1000, 3)
+
+    def stats(self) -> Dict[str, Any]:
+        """Tempo acumulado de cálculo por sinal."""
+        return {
+            name: {
+                key: value
+                for key, value in stats.to_dict().items()
+                if key in ("count", "avg_ms", "max_ms")
+            }
+            for name, stats in sorted(self._stats.items())
+        }
+
+
+_engine: Optional[BlendingEngine] = None
+
+
+def get_blending_engine() -> BlendingEngine:
+    """Retorna o motor do processo, com todos os sinais disponíveis."""
+    global _engine
+    if _engine is None:
+        _engine = BlendingEngine(
+            [ContentSignal(), CollaborativeSignal(), RatingSignal(), RecencySignal()]
+        )
+    return _engine
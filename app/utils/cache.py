@@ -0,0 +1,209 @@
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional
+
+Loader = Callable[[], Awaitable[Any]]
+
+
+class _Entry:
+    __slots__ = ("value", "expires_at")
+
+    def __init__(self, value: Any, expires_at: float):
+        self.value = value
+        self.expires_at = expires_at
+
+
+class TTLCache:
+    """
+    Cache em memória do processo, por chave, com expiração (TTL).
+
+    Entradas vencidas continuam sendo servidas enquanto uma única tarefa em
+    segundo plano as recarrega (stale-while-revalidate): apenas a primeira
+    leitura de uma chave espera o carregamento. Com `max_entries`, as
+    entradas menos usadas recentemente são descartadas.
+
+    `update` aplica uma alteração incremental ao valor em cache (ex.: um
+    filme novo), sem recarregar nem renovar a expiração.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float,
+        max_entries: Optional[int] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._refreshing: Dict[Hashable, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.refresh_errors = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    async def get_or_load(self, key: Hashable, loader: Loader) -> Any:
+        """Retorna o valor de `key`, carregando-o com `loader` se ausente."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            value = await loader()
+            self.set(key, value)
+            return value
+
+        self._entries.move_to_end(key)
+        if self._clock() >= entry.expires_at:
+            self.stale_hits += 1
+            self._refresh_in_background(key, loader)
+        else:
+            self.hits += 1
+        return entry.value
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Valor em cache (mesmo vencido), sem carregar."""
+        entry = self._entries.get(key)
+        return default if entry is None else entry.value
+
+    def get_fresh(self, key: Hashable, default: Any = None) -> Any:
+        """Valor em cache apenas se ainda dentro do prazo, sem carregar."""
+        entry = self._entries.get(key)
+        if entry is None or self._clock() >= entry.expires_at:
+            return default
+        self._entries.move_to_end(key)
+        return entry.value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._entries[key] = _Entry(value, self._clock() + self.ttl_seconds)
+        self._entries.move_to_end(key)
+        if self.max_entries is not None:
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def update(self, key: Hashable, apply: Callable[[Any], Any]) -> bool:
+        """
+        Substitui o valor de `key` por `apply(valor)`, se ele estiver em
+        cache. Retorna False quando não há valor (nada a atualizar).
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return False
+        entry.value = apply(entry.value)
+        return True
+
+    def invalidate(self, key: Optional[Hashable] = None) -> None:
+        """Remove uma chave ou, sem argumento, todas as entradas."""
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    async def refresh(self, key: Hashable, loader: Loader) -> Any:
+        """Recarrega `key` imediatamente."""
+        value = await loader()
+        self.set(key, value)
+        return value
+
+    def _refresh_in_background(self, key: Hashable, loader: Loader) -> None:
+        task = self._refreshing.get(key)
+        if task is not None and not task.done():
+            return
+
+        async def run():
+            try:
+                await self.refresh(key, loader)
+            except Exception as e:
+                # Mantém o valor vencido; a próxima leitura tenta de novo
+                self.refresh_errors += 1
+                print(f"Error refreshing cache entry {key!r}: {str(e)}")
+            finally:
+                self._refreshing.pop(key, None)
+
+        self._refreshing[key] = asyncio.get_running_loop().create_task(run())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refresh_errors": self.refresh_errors,
+        }
+
+
+class ReloadingIndex(ABC):
+    """
+    Estrutura em memória carregada de uma coleção (índices por gênero, por
+    data, estatísticas de avaliações) e mantida por atualizações
+    incrementais do próprio processo.
+
+    A primeira chamada de `ensure_loaded` espera a carga. Vencido
+    `ttl_seconds`, a carga é refeita em segundo plano enquanto o conteúdo
+    atual continua sendo servido (como no `TTLCache`), o que incorpora
+    escritas de outros processos e remoções. `ttl_seconds=0` desativa a
+    recarga.
+
+    Subclasses implementam `fetch` (leitura no banco) e `load` (que
+    reconstrói a estrutura e chama `_mark_loaded`).
+    """
+
+    def __init__(
+        self, ttl_seconds: float, clock: Callable[[], float] = time.monotonic
+    ):
+        self.is_loaded = False
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._expires_at = 0.0
+        self._refreshing: Optional[asyncio.Task] = None
+        self.refresh_errors = 0
+        self._lock = asyncio.Lock()
+
+    @abstractmethod
+    async def fetch(self, db) -> Iterable[Dict[str, Any]]:
+        """Lê do banco os documentos passados a `load`."""
+
+    @abstractmethod
+    def load(self, rows: Iterable[Dict[str, Any]]) -> None:
+        """Reconstrói a estrutura a partir de `rows`."""
+
+    def _mark_loaded(self) -> None:
+        self.is_loaded = True
+        self._expires_at = self._clock() + self.ttl_seconds
+
+    async def ensure_loaded(self, db):
+        """
+        Carrega a estrutura na primeira chamada; vencido o TTL, dispara a
+        recarga em segundo plano e retorna o conteúdo atual.
+        """
+        if not self.is_loaded:
+            async with self._lock:
+                if not self.is_loaded:
+                    await self.refresh(db)
+        elif self.ttl_seconds and self._clock() >= self._expires_at:
+            self._refresh_in_background(db)
+        return self
+
+    async def refresh(self, db) -> None:
+        """Recarrega a estrutura imediatamente."""
+        self.load(await self.fetch(db))
+
+    def _refresh_in_background(self, db) -> None:
+        if self._refreshing is not None and not self._refreshing.done():
+            return
+
+        async def run():
+            try:
+                await self.refresh(db)
+            except Exception as e:
+                # Mantém o conteúdo atual; a próxima leitura tenta de novo
+                self.refresh_errors += 1
+                print(f"Error refreshing {type(self).__name__}: {str(e)}")
+
+        self._refreshing = asyncio.get_running_loop().create_task(run())
@@ -0,0 +1,318 @@
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.config import (
+    RECOMMENDATION_CANDIDATES_PER_SOURCE,
+    RECOMMENDATION_MF_MODEL_DIR,
+    RECOMMENDATION_STAGE_BUDGET_MS,
+)
+from app.utils.blending import (
+    BLEND_CONFIGS,
+    BlendConfig,
+    BlendingEngine,
+    get_blending_engine,
+)
+from app.utils.genre_index import get_genre_index
+from app.utils.id_migration import review_id_filter, review_id_values
+from app.utils.matrix_factorization import get_mf_model
+from app.utils.rating_stats import get_rating_stats
+from app.utils.recommendation import get_feature_index, top_k_indices
+from app.utils.user_profile import PROFILE_MIN_RATING, UserProfile
+
+
+class CandidateContext:
+    """Dados do usuário compartilhados pelas etapas do pipeline."""
+
+    def __init__(
+        self,
+        user_id: str,
+        rated_movie_ids: Iterable[str],
+        preferred_genres: Optional[List[str]] = None,
+        profile: Optional[UserProfile] = None,
+        blend: Optional[BlendConfig] = None,
+    ):
+        self.user_id = str(user_id)
+        self.excluded = {str(movie_id) for movie_id in rated_movie_ids}
+        self.preferred_genres = preferred_genres or []
+        self.profile = profile
+        self.blend = blend or BLEND_CONFIGS["default"]
+
+    @property
+    def liked_movie_ids(self) -> List[str]:
+        return self.profile.movie_ids if self.profile is not None else []
+
+
+class CandidateGenerator(ABC):
+    """
+    Etapa barata de geração de candidatos: retorna até `size` IDs de filmes
+    ainda não avaliados pelo usuário. Cada gerador roda com seu próprio
+    orçamento de tempo (`budget_ms`); se estourar, contribui com nada.
+    """
+
+    name = "base"
+
+    def __init__(
+        self,
+        size: int = RECOMMENDATION_CANDIDATES_PER_SOURCE,
+        budget_ms: int = RECOMMENDATION_STAGE_BUDGET_MS,
+    ):
+        self.size = size
+        self.budget_ms = budget_ms
+
+    async def prepare(self, db) -> None:
+        """
+        Carrega as estruturas do catálogo usadas por `generate`. Roda antes
+        e fora do orçamento de tempo: uma carga completa cancelada pelo
+        orçamento recomeçaria a cada requisição.
+        """
+
+    @abstractmethod
+    async def generate(self, db, context: CandidateContext) -> List[str]:
+        """IDs dos candidatos, sem os filmes já avaliados pelo usuário."""
+
+
+class GenreCandidates(CandidateGenerator):
+    """Filmes dos gêneros preferidos (índice invertido), pela nota ponderada."""
+
+    name = "genre"
+
+    async def prepare(self, db) -> None:
+        await get_genre_index(db).ensure_loaded(db)
+        await get_rating_stats(db).ensure_loaded(db)
+
+    async def generate(self, db, context: CandidateContext) -> List[str]:
+        index = await get_genre_index(db).ensure_loaded(db)
+        movie_ids = [
+            movie_id
+            for movie_id in index.movie_ids_for(context.preferred_genres)
+            if movie_id not in context.excluded
+        ]
+        stats = await get_rating_stats(db).ensure_loaded(db)
+        scores = stats.weighted_ratings_for(movie_ids)
+        return [movie_ids[i] for i in top_k_indices(scores, self.size)]
+
+
+class PopularityCandidates(CandidateGenerator):
+    """Filmes com maior classificação ponderada do catálogo."""
+
+    name = "popularity"
+
+    async def prepare(self, db) -> None:
+        await get_rating_stats(db).ensure_loaded(db)
+
+    async def generate(self, db, context: CandidateContext) -> List[str]:
+        stats = await get_rating_stats(db).ensure_loaded(db)
+        return stats.top_rated(self.size, exclude=context.excluded)
+
+
+class CoOccurrenceCandidates(CandidateGenerator):
+    """
+    Filmes curtidos por usuários que curtiram os mesmos filmes ("quem gostou
+    deste também gostou de"), contados em uma agregação sobre `reviews`.
+    """
+
+    name = "cooccurrence"
+
+    def __init__(self, *args, max_users: int = 500, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_users = max_users
+
+    async def generate(self, db, context: CandidateContext) -> List[str]:
+        if not context.liked_movie_ids:
+            return []
+
+        own_ids = await review_id_values(db, [context.user_id])
+        user_ids = await db.reviews.distinct(
+            "user_id",
+            {
+                "movie_id": await review_id_filter(db, context.liked_movie_ids),
+                "rating": {"$gte": PROFILE_MIN_RATING},
+            },
+        )
+        user_ids = [u for u in user_ids if u not in own_ids][: self.max_users]
+        if not user_ids:
+            return []
+
+        rows = await db.reviews.aggregate(
+            [
+                {
+                    "$match": {
+                        "user_id": {"$in": user_ids},
+                        "rating": {"$gte": PROFILE_MIN_RATING},
+                    }
+                },
+                {"$group": {"_id": "$movie_id", "count": {"$sum": 1}}},
+                {"$sort": {"count": -1}},
+                {"$limit": self.size + len(context.excluded)},
+            ]
+        ).to_list(length=None)
+
+        movie_ids = [str(row["_id"]) for row in rows]
+        return [m for m in dict.fromkeys(movie_ids) if m not in context.excluded][
+            : self.size
+        ]
+
+
+class AnnCandidates(CandidateGenerator):
+    """
+    Vizinhos do centróide do perfil no espaço TF-IDF: lista curta do índice
+    ANN em catálogos grandes ou top-k exato nos pequenos.
+    """
+
+    name = "ann"
+
+    async def prepare(self, db) -> None:
+        await get_feature_index(db).ensure_built(db)
+
+    async def generate(self, db, context: CandidateContext) -> List[str]:
+        profile = context.profile
+        if profile is None or not profile.weight:
+            return []
+
+        index = await get_feature_index(db).ensure_built(db)
+        centroid = profile.centroid
+        positions = index.shortlist(
+            centroid.toarray(), min_size=self.size, max_candidates=self.size * 4
+        )
+        if positions is None:
+            positions = np.arange(len(index))
+
+        scores = (index.matrix[positions] @ centroid.T).toarray().ravel()
+        movie_ids = [index.movie_ids[p] for p in positions]
+        scores[[m in context.excluded for m in movie_ids]] = -np.inf
+        return [movie_ids[i] for i in top_k_indices(scores, self.size)]
+
+
+class CollaborativeCandidates(CandidateGenerator):
+    """Top-N da fatoração de matriz, quando há um modelo para o usuário."""
+
+    name = "collaborative"
+
+    async def generate(self, db, context: CandidateContext) -> List[str]:
+        model = get_mf_model(RECOMMENDATION_MF_MODEL_DIR)
+        if model is None:
+            return []
+        return model.recommend(context.user_id, self.size, exclude=context.excluded)
+
+
+class CandidateRanker:
+    """
+    Pontua a união dos candidatos com o motor de blending: conteúdo,
+    colaborativo, nota ponderada, recência e a fração dos geradores que
+    propuseram o filme ("sources"), com os pesos da configuração de blend
+    do contexto (ver `app.utils.blending`).
+    """
+
+    def __init__(
+        self,
+        engine: Optional[BlendingEngine] = None,
+        budget_ms: int = RECOMMENDATION_STAGE_BUDGET_MS,
+    ):
+        self.engine = engine or get_blending_engine()
+        self.budget_ms = budget_ms
+
+    async def score(
+        self, db, context: CandidateContext, movie_ids: List[str], sources: np.ndarray
+    ) -> Tuple[np.ndarray, Dict[str, Dict[str, float]]]:
+        """
+        Returns:
+            Tupla (pontuações alinhadas a `movie_ids`, tempo e peso por sinal)
+        """
+        return await self.engine.blend(
+            db, context, movie_ids, context.blend, provided={"sources": sources}
+        )
+
+
+class CandidatePipeline:
+    """
+    Recomendação em duas etapas: geradores baratos rodam em paralelo, cada
+    um limitado ao próprio orçamento de tempo, e o ranqueador pontua apenas
+    a união dos candidatos. O custo por requisição fica limitado por
+    (geradores x `size`), independente do tamanho do catálogo.
+    """
+
+    def __init__(
+        self,
+        generators: Sequence[CandidateGenerator],
+        ranker: Optional[CandidateRanker] = None,
+    ):
+        self.generators = list(generators)
+        self.ranker = ranker or CandidateRanker()
+
+    async def run(
+        self, db, context: CandidateContext, limit: int
+    ) -> Tuple[List[str], Dict[str, Dict[str, Any]]]:
+        """
+        Returns:
+            Tupla (IDs recomendados em ordem, estatísticas por etapa com
+            quantidade de candidatos, duração e se estourou o orçamento)
+        """
+        # Índices do catálogo carregados fora do orçamento das etapas
+        await asyncio.gather(*(g.prepare(db) for g in self.generators))
+
+        results = await asyncio.gather(
+            *(
+                _run_stage(g.name, g.budget_ms, g.generate(db, context))
+                for g in self.generators
+            )
+        )
+        stages = {name: stats for name, _, stats in results}
+
+        counts: Dict[str, int] = {}
+        for _, movie_ids, _ in results:
+            for movie_id in movie_ids or []:
+                counts[movie_id] = counts.get(movie_id, 0) + 1
+        movie_ids = list(counts)
+        if not movie_ids:
+            return [], stages
+
+        sources = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+        sources /= max(1, len(self.generators))
+        _, ranked, stages["rank"] = await _run_stage(
+            "rank",
+            self.ranker.budget_ms,
+            self.ranker.score(db, context, movie_ids, sources),
+        )
+        stages["rank"]["count"] = len(movie_ids)
+        if ranked is None:
+            # Ranqueador fora do orçamento: ordenar pela quantidade de fontes
+            scores = sources
+        else:
+            scores, stages["rank"]["signals"] = ranked
+
+        return [movie_ids[i] for i in top_k_indices(scores, limit)], stages
+
+
+async def _run_stage(name: str, budget_ms: int, coroutine) -> Tuple[str, Any, Dict]:
+    """Executa uma etapa com orçamento de tempo; resultado None se estourar."""
+    started = time.perf_counter()
+    try:
+        result = await asyncio.wait_for(coroutine, timeout=budget_ms / 1000.0)
+        timed_out = False
+    except asyncio.TimeoutError:
+        print(f"Candidate stage '{name}' exceeded its {budget_ms}ms budget")
+        result, timed_out = None, True
+
+    stats = {
+        "count": len(result) if result is not None else 0,
+        "ms": round((time.perf_counter() - started) * 1000, 3),
+        "timed_out": timed_out,
+    }
+    return name, result, stats
+
+
+def default_candidate_pipeline() -> CandidatePipeline:
+    """Pipeline padrão das recomendações personalizadas."""
+    return CandidatePipeline(
+        [
+            GenreCandidates(),
+            CollaborativeCandidates(),
+            CoOccurrenceCandidates(),
+            PopularityCandidates(),
+            AnnCandidates(),
+        ]
+    )
@@ -0,0 +1,106 @@
+import asyncio
+import copy
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from app.config import (
+    RECOMMENDATION_COALESCE_CACHE_ENTRIES,
+    RECOMMENDATION_COALESCE_CACHE_TTL,
+)
+from app.utils.cache import TTLCache
+from app.utils.registry import get_db_scoped, peek_db_scoped
+
+# Chamadas do RecommendationService com execução compartilhada
+COALESCED_CALLS = ("popular", "similar")
+
+_MISSING = object()
+
+
+class SingleFlight:
+    """
+    Coalescência de chamadas concorrentes: enquanto uma chamada com a mesma
+    chave está em andamento, as demais aguardam o mesmo resultado (ou a
+    mesma exceção) em vez de repetir a consulta.
+
+    A execução roda em uma tarefa própria, então o cancelamento de quem a
+    iniciou (ex.: cliente desconectado) não cancela quem está aguardando.
+    Com `cache`, resultados de sucesso também são servidos até vencerem.
+
+    Cada chamador recebe uma cópia profunda do resultado: objetos mutáveis
+    (ex.: `Movie`) não são compartilhados entre requisições nem com o cache.
+
+    Contadores: `hits` (cache), `joins` (aguardaram uma execução em
+    andamento) e `misses` (executaram a chamada).
+    """
+
+    def __init__(self, cache: Optional[TTLCache] = None):
+        self.cache = cache
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.hits = 0
+        self.joins = 0
+        self.misses = 0
+        self.errors = 0
+
+    async def do(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        if self.cache is not None:
+            value = self.cache.get_fresh(key, _MISSING)
+            if value is not _MISSING:
+                self.hits += 1
+                return copy.deepcopy(value)
+
+        task = self._inflight.get(key)
+        if task is not None and not task.done():
+            self.joins += 1
+        else:
+            self.misses += 1
+            task = asyncio.get_running_loop().create_task(self._run(key, loader))
+            # Consome a exceção mesmo se todos os chamadores forem cancelados
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._inflight[key] = task
+        return copy.deepcopy(await asyncio.shield(task))
+
+    async def _run(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            value = await loader()
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self._inflight.pop(key, None)
+        if self.cache is not None:
+            self.cache.set(key, value)
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "joins": self.joins,
+            "misses": self.misses,
+            "errors": self.errors,
+            "in_flight": len(self._inflight),
+            "cached": len(self.cache) if self.cache is not None else 0,
+        }
+
+
+def get_single_flight(db, name: str) -> SingleFlight:
+    """Coalescência da chamada `name` no banco `db`, compartilhada no processo."""
+
+    def create() -> SingleFlight:
+        cache = None
+        if RECOMMENDATION_COALESCE_CACHE_TTL > 0:
+            cache = TTLCache(
+                RECOMMENDATION_COALESCE_CACHE_TTL,
+                max_entries=RECOMMENDATION_COALESCE_CACHE_ENTRIES,
+            )
+        return SingleFlight(cache)
+
+    return get_db_scoped(db, f"single_flight:{name}", create)
+
+
+def single_flight_stats(db) -> Dict[str, Dict[str, Any]]:
+    """Contadores de cada chamada coalescida já usada no banco `db`."""
+    stats = {}
+    for name in COALESCED_CALLS:
+        flight = peek_db_scoped(db, f"single_flight:{name}")
+        if flight is not None:
+            stats[name] = flight.stats()
+    return stats
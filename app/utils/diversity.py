@@ -0,0 +1,61 @@
+from typing import Optional
+
+import numpy as np
+import scipy.sparse as sp
+
+
+def rank_relevance(n: int) -> np.ndarray:
+    """
+    Relevância derivada da posição em uma lista já ordenada: 1.0 para o
+    primeiro item, decrescendo linearmente até 1/n para o último.
+    """
+    return 1.0 - np.arange(n, dtype=np.float64) / max(n, 1)
+
+
+def mmr_rerank(
+    relevance: np.ndarray,
+    vectors,
+    k: int,
+    lambda_: float,
+    similarity: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Reordena candidatos por Maximal Marginal Relevance.
+
+    A cada passo escolhe o candidato que maximiza
+    `lambda_ * relevância - (1 - lambda_) * maior similaridade com os já
+    escolhidos`. Com `lambda_ = 1` a ordem original (por relevância) é
+    mantida; valores menores favorecem itens diferentes dos já escolhidos.
+
+    A similaridade entre todos os pares de candidatos é calculada uma única
+    vez (`vectors` com linhas normalizadas em L2, densas ou esparsas) e a
+    maior similaridade de cada candidato é atualizada de forma vetorizada,
+    então o custo é O(n²) para a matriz mais O(k·n) para a seleção.
+
+    Returns:
+        Posições (em `relevance`) dos `k` itens escolhidos, na ordem final
+    """
+    relevance = np.asarray(relevance, dtype=np.float64)
+    n = len(relevance)
+    k = max(0, min(k, n))
+    if k == 0:
+        return np.empty(0, dtype=np.int64)
+
+    if similarity is None:
+        similarity = vectors @ vectors.T
+        if sp.issparse(similarity):
+            similarity = similarity.toarray()
+    similarity = np.asarray(similarity, dtype=np.float64)
+
+    gain = lambda_ * relevance
+    penalty = np.zeros(n)
+    available = np.ones(n, dtype=bool)
+    selected = np.empty(k, dtype=np.int64)
+
+    for step in range(k):
+        scores = np.where(available, gain - (1.0 - lambda_) * penalty, -np.inf)
+        best = int(np.argmax(scores))
+        selected[step] = best
+        available[best] = False
+        np.maximum(penalty, similarity[best], out=penalty)
+    return selected
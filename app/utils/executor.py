@@ -0,0 +1,205 @@
+import asyncio
+import functools
+import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from app.config import (
+    RECOMMENDATION_EXECUTOR_MODE,
+    RECOMMENDATION_EXECUTOR_QUEUE,
+    RECOMMENDATION_EXECUTOR_TIMEOUT,
+    RECOMMENDATION_EXECUTOR_WORKERS,
+)
+
+
+class ScoringUnavailableError(RuntimeError):
+    """O cálculo não pôde ser executado a tempo (fila cheia ou timeout)."""
+
+
+class ExecutorSaturatedError(ScoringUnavailableError):
+    """Fila do executor cheia: a tarefa foi rejeitada sem ser enfileirada."""
+
+
+class ScoringTimeoutError(ScoringUnavailableError):
+    """A tarefa excedeu o tempo limite."""
+
+
+def _timed_call(fn: Callable, args: tuple, kwargs: dict):
+    """Executa `fn` no worker e retorna (resultado, início, fim) em epoch."""
+    started = time.time()
+    result = fn(*args, **kwargs)
+    return result, started, time.time()
+
+
+class TaskStats:
+    """Contadores e tempos acumulados de um tipo de tarefa."""
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.queue_ms = 0.0
+
+    def record(self, run_ms: float, queue_ms: float) -> None:
+        self.count += 1
+        self.total_ms += run_ms
+        self.max_ms = max(self.max_ms, run_ms)
+        self.queue_ms += queue_ms
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "avg_queue_ms": round(self.queue_ms / self.count, 3) if self.count else 0.0,
+        }
+
+
+class ScoringExecutor:
+    """
+    Executa o cálculo pesado das recomendações fora do event loop.
+
+    Modos:
+    - `thread`: pool de threads (NumPy/SciPy liberam o GIL nas operações
+      de álgebra linear)
+    - `process`: pool de processos, para cálculo que segura o GIL; funções
+      e argumentos precisam ser serializáveis (pickle)
+    - `inline`: executa no próprio event loop (testes e depuração)
+
+    No máximo `max_workers + max_queue` tarefas ficam em andamento; as
+    seguintes são rejeitadas com `ExecutorSaturatedError` em vez de
+    acumular latência. Cada tarefa tem um tempo limite (`timeout`, em
+    segundos); nos modos thread e processo a tarefa continua rodando no
+    worker após o timeout, apenas o resultado é descartado — ela só deixa
+    de contar como em andamento quando o worker termina.
+    """
+
+    MODES = ("thread", "process", "inline")
+
+    def __init__(
+        self,
+        mode: str = "thread",
+        max_workers: Optional[int] = None,
+        max_queue: int = 64,
+        timeout: Optional[float] = None,
+    ):
+        if mode not in self.MODES:
+            raise ValueError(f"Modo de executor inválido: {mode}")
+
+        self.mode = mode
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) + 4)
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._pool: Optional[Executor] = None
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._stats: Dict[str, TaskStats] = {}
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def _release(self, _future=None) -> None:
+        # Chamado na thread do worker (done-callback) ou no event loop
+        with self._lock:
+            self._in_flight -= 1
+
+    def _get_pool(self) -> Optional[Executor]:
+        if self._pool is None and self.mode != "inline":
+            if self.mode == "process":
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        return self._pool
+
+    async def run(
+        self,
+        name: str,
+        fn: Callable,
+        *args,
+        timeout: Optional[float] = None,
+        **kwargs,
+    ) -> Any:
+        """
+        Executa `fn(*args, **kwargs)` no pool e aguarda o resultado.
+
+        Args:
+            name: Nome da tarefa nas estatísticas (ex.: "tfidf_fit")
+            timeout: Tempo limite em segundos (padrão: o do executor;
+                0 desativa, para jobs offline)
+        """
+        stats = self._stats.setdefault(name, TaskStats())
+        with self._lock:
+            if self._in_flight >= self.max_workers + self.max_queue:
+                stats.rejected += 1
+                raise ExecutorSaturatedError(
+                    f"Executor saturado ({self._in_flight} tarefas em andamento)"
+                )
+            self._in_flight += 1
+
+        timeout = self.timeout if timeout is None else timeout
+        submitted = time.time()
+        pool_future = None
+        try:
+            if self.mode == "inline":
+                result, started, finished = _timed_call(fn, args, kwargs)
+            else:
+                pool_future = self._get_pool().submit(
+                    functools.partial(_timed_call, fn, args, kwargs)
+                )
+                # A vaga só é liberada quando o worker termina, mesmo após timeout
+                pool_future.add_done_callback(self._release)
+                result, started, finished = await asyncio.wait_for(
+                    asyncio.wrap_future(pool_future), timeout or None
+                )
+        except asyncio.TimeoutError:
+            stats.timeouts += 1
+            raise ScoringTimeoutError(f"Tarefa '{name}' excedeu {timeout}s")
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            if pool_future is None:
+                self._release()
+
+        stats.record((finished - started) * 1000, max(0.0, started - submitted) * 1000)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """Estatísticas de tempo por tarefa, para dimensionar o pool."""
+        return {
+            "mode": self.mode,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self._in_flight,
+            "tasks": {name: s.to_dict() for name, s in sorted(self._stats.items())},
+        }
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+
+_executor: Optional[ScoringExecutor] = None
+
+
+def get_scoring_executor() -> ScoringExecutor:
+    """Retorna o executor do processo, criado a partir da configuração."""
+    global _executor
+    if _executor is None:
+        _executor = ScoringExecutor(
+            mode=RECOMMENDATION_EXECUTOR_MODE,
+            max_workers=RECOMMENDATION_EXECUTOR_WORKERS or None,
+            max_queue=RECOMMENDATION_EXECUTOR_QUEUE,
+            timeout=RECOMMENDATION_EXECUTOR_TIMEOUT or None,
+        )
+    return _executor
@@ -0,0 +1,419 @@
+import asyncio
+import hashlib
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from app.utils.ann import RandomProjectionLSH
+from app.utils.artifacts import ArtifactWriter, ModelArtifacts, load_artifacts
+from app.utils.executor import get_scoring_executor
+from app.utils.hashing import HashedTfidfVectorizer
+
+
+class MovieFeatureIndex:
+    """
+    Índice em memória com a matriz TF-IDF de todo o catálogo de filmes.
+
+    A matriz é ajustada uma única vez sobre a coleção `movies` e mantida
+    entre requisições. Filmes novos são vetorizados com o vocabulário já
+    ajustado e anexados ao final da matriz; quando a proporção de filmes
+    adicionados desde o último ajuste passa de `refit_ratio`, o índice é
+    reconstruído na próxima consulta para incorporar termos novos.
+
+    Catálogos com pelo menos `ann_min_items` filmes também recebem um índice
+    aproximado (LSH) para gerar listas curtas de candidatos sem varrer a
+    matriz inteira.
+
+    Com `featurizer="hashing"` os filmes são vetorizados em um espaço de
+    `hashing_features` colunas sem vocabulário (opcionalmente com IDF
+    armazenado em `feature_models`): não há reajuste e os vetores são
+    comparáveis entre processos.
+
+    Com `artifacts_dir`, a primeira construção carrega a matriz gravada pelo
+    job `build-artifacts` (mapeada em memória, compartilhada entre workers)
+    em vez de ajustar o catálogo; apenas filmes inseridos depois do build são
+    vetorizados.
+    """
+
+    PROJECTION = {"_id": 1, "title": 1, "genres": 1, "director": 1, "actors": 1}
+
+    # "tfidf": vocabulário ajustado sobre o catálogo; "hashing": espaço de
+    # largura fixa, sem ajuste (ver HashedTfidfVectorizer)
+    FEATURIZERS = ("tfidf", "hashing")
+
+    # Documento da coleção `feature_models` com o IDF do modo hashing
+    HASHING_IDF_ID = "hashing_idf"
+
+    def __init__(
+        self,
+        featurize: Callable[[Dict[str, Any]], str],
+        refit_ratio: float = 0.2,
+        ann_min_items: Optional[int] = None,
+        ann_params: Optional[Dict[str, int]] = None,
+        featurizer: str = "tfidf",
+        hashing_features: int = 2**16,
+        hashing_idf: bool = False,
+        artifacts_dir: Optional[str] = None,
+    ):
+        if featurizer not in self.FEATURIZERS:
+            raise ValueError(f"Featurizer inválido: {featurizer}")
+
+        self.featurize = featurize
+        self.featurizer = featurizer
+        self.hashing_features = hashing_features
+        self.hashing_idf = hashing_idf
+        self.artifacts_dir = artifacts_dir
+        self.refit_ratio = refit_ratio
+        self.ann_min_items = ann_min_items
+        self.ann_params = ann_params or {}
+        self.ann: Optional[RandomProjectionLSH] = None
+        self.vectorizer = None
+        self.movie_ids: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self._matrix: Optional[sp.csr_matrix] = None
+        self._pending: List[sp.csr_matrix] = []
+        self._fitted_size = 0
+        self._added_since_fit = 0
+        self._built = False
+        self.version: Optional[str] = None
+        self._lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self.movie_ids)
+
+    def __contains__(self, movie_id: str) -> bool:
+        return str(movie_id) in self._positions
+
+    @property
+    def is_built(self) -> bool:
+        return self._built
+
+    @property
+    def needs_refit(self) -> bool:
+        if not self.is_built:
+            return True
+        if self.featurizer == "hashing":
+            # Sem vocabulário: filmes novos nunca exigem reajuste
+            return False
+        return self._added_since_fit > max(1, self._fitted_size) * self.refit_ratio
+
+    @property
+    def matrix(self) -> sp.csr_matrix:
+        """Matriz TF-IDF (linhas normalizadas em L2) alinhada a `movie_ids`."""
+        if self._pending:
+            self._matrix = sp.vstack([self._matrix, *self._pending], format="csr")
+            self._pending = []
+        return self._matrix
+
+    async def ensure_built(self, db) -> "MovieFeatureIndex":
+        """Constrói o índice se ainda não existir ou se estiver defasado."""
+        if self.needs_refit:
+            async with self._lock:
+                if self.needs_refit:
+                    await self.build(db)
+        return self
+
+    async def build(self, db) -> None:
+        """
+        Carrega o catálogo completo e ajusta o TF-IDF. O ajuste (e o índice
+        ANN) é calculado no executor de recomendação, fora do event loop.
+        """
+        if not self._built and self.load_artifacts(load_artifacts(self.artifacts_dir)):
+            await self._add_missing(db)
+            return
+
+        movies = await db.movies.find({}, self.PROJECTION).to_list(length=None)
+        features = [self.featurize(movie) for movie in movies]
+        vectorizer = await self._load_vectorizer(db)
+        stored = getattr(vectorizer, "is_fitted", True)
+        fitted = await get_scoring_executor().run(
+            "tfidf_fit",
+            fit_features,
+            features,
+            self.ann_min_items,
+            self.ann_params,
+            vectorizer,
+        )
+        self._apply_fit(movies, *fitted)
+        if not stored:
+            await self._store_vectorizer(db)
+
+    def fit(self, movies: List[Dict[str, Any]]) -> None:
+        """Ajusta o vocabulário e a matriz sobre a lista de filmes."""
+        features = [self.featurize(movie) for movie in movies]
+        self._apply_fit(
+            movies,
+            *fit_features(
+                features, self.ann_min_items, self.ann_params, self._new_vectorizer()
+            ),
+        )
+
+    def _new_vectorizer(self):
+        if self.featurizer == "hashing":
+            return HashedTfidfVectorizer(self.hashing_features, self.hashing_idf)
+        return TfidfVectorizer(stop_words="english")
+
+    async def _load_vectorizer(self, db):
+        """
+        Vetorizador para o próximo ajuste. No modo hashing com IDF, reutiliza
+        os pesos já gravados em `feature_models` (compartilhados entre
+        processos) quando a largura do espaço confere.
+        """
+        vectorizer = self._new_vectorizer()
+        if self.featurizer == "hashing" and self.hashing_idf:
+            document = await db.feature_models.find_one({"_id": self.HASHING_IDF_ID})
+            if document and document.get("n_features") == self.hashing_features:
+                vectorizer = HashedTfidfVectorizer.from_document(document)
+        return vectorizer
+
+    async def _store_vectorizer(self, db) -> None:
+        """Grava o IDF calculado neste ajuste para os demais processos."""
+        if isinstance(self.vectorizer, HashedTfidfVectorizer):
+            await db.feature_models.replace_one(
+                {"_id": self.HASHING_IDF_ID},
+                self.vectorizer.to_document(),
+                upsert=True,
+            )
+
+    async def _add_missing(self, db) -> None:
+        """Anexa os filmes do banco que não estão nos artefatos carregados."""
+        ids = await db.movies.find({}, {"_id": 1}).to_list(length=None)
+        missing = [doc["_id"] for doc in ids if str(doc["_id"]) not in self._positions]
+        if missing:
+            movies = await db.movies.find(
+                {"_id": {"$in": missing}}, self.PROJECTION
+            ).to_list(length=len(missing))
+            self.add_movies(movies)
+            print(f"Feature index: {len(movies)} movies added after artifact build")
+
+    def write_artifacts(self, writer: ArtifactWriter) -> None:
+        """Grava matriz, IDs, vetorizador e códigos ANN do índice atual."""
+        writer.add_csr("feature_matrix", self.matrix)
+        writer.add_array("feature_movie_ids", np.asarray(self.movie_ids, dtype=str))
+
+        metadata: Dict[str, Any] = {
+            "featurizer": self.featurizer,
+            "version": self.version,
+        }
+        if isinstance(self.vectorizer, HashedTfidfVectorizer):
+            metadata["hashing"] = {
+                "n_features": self.vectorizer.n_features,
+                "use_idf": self.vectorizer.use_idf,
+            }
+            if self.vectorizer.idf is not None:
+                metadata["hashing"]["idf"] = self.vectorizer.to_document()
+        elif self.vectorizer is not None:
+            vocabulary = self.vectorizer.vocabulary_
+            terms = sorted(vocabulary, key=vocabulary.get)
+            writer.add_array("feature_vocabulary", np.asarray(terms, dtype=str))
+            writer.add_array("feature_idf", self.vectorizer.idf_)
+
+        if self.ann is not None:
+            writer.add_array("feature_ann_codes", self.ann.encode(self.matrix))
+            metadata["ann_params"] = self.ann_params
+        writer.add_metadata("feature_index", metadata)
+
+    def load_artifacts(self, artifacts: Optional[ModelArtifacts]) -> bool:
+        """
+        Restaura o índice a partir de artefatos, sem reajustar. Retorna False
+        se não houver artefatos ou se eles foram gerados com outro
+        featurizer (nesse caso o índice é ajustado normalmente).
+        """
+        if artifacts is None or not artifacts.has("feature_matrix"):
+            return False
+        metadata = artifacts.metadata("feature_index")
+        if metadata.get("featurizer") != self.featurizer:
+            return False
+
+        if self.featurizer == "hashing":
+            hashing = metadata.get("hashing", {})
+            if (
+                hashing.get("n_features") != self.hashing_features
+                or hashing.get("use_idf") != self.hashing_idf
+            ):
+                return False
+            vectorizer = (
+                HashedTfidfVectorizer.from_document(hashing["idf"])
+                if "idf" in hashing
+                else HashedTfidfVectorizer(self.hashing_features, self.hashing_idf)
+            )
+        elif artifacts.has("feature_vocabulary"):
+            terms = artifacts.array("feature_vocabulary").tolist()
+            vectorizer = TfidfVectorizer(
+                stop_words="english",
+                vocabulary={term: i for i, term in enumerate(terms)},
+            )
+            vectorizer.idf_ = np.asarray(artifacts.array("feature_idf"))
+        else:
+            vectorizer = None
+
+        matrix = artifacts.csr("feature_matrix")
+        ann = None
+        if (
+            self.ann_min_items is not None
+            and matrix.shape[0] >= self.ann_min_items
+            and matrix.shape[1] > 0
+        ):
+            ann = RandomProjectionLSH(matrix.shape[1], **self.ann_params)
+            if metadata.get("ann_params") == self.ann_params:
+                ann.add_codes(artifacts.array("feature_ann_codes"))
+            else:
+                # Parâmetros do LSH mudaram desde o build: recalcula os códigos
+                ann.add(matrix)
+
+        movie_ids = artifacts.array("feature_movie_ids").tolist()
+        movies = [{"_id": movie_id} for movie_id in movie_ids]
+        self._apply_fit(movies, vectorizer, matrix, ann)
+        print(f"Feature index loaded from artifacts built at {artifacts.built_at}")
+        return True
+
+    def _apply_fit(
+        self,
+        movies: List[Dict[str, Any]],
+        vectorizer,
+        matrix: sp.csr_matrix,
+        ann: Optional[RandomProjectionLSH],
+    ) -> None:
+        self.vectorizer = vectorizer
+        self.movie_ids = [self._movie_id(movie) for movie in movies]
+        self._positions = {movie_id: i for i, movie_id in enumerate(self.movie_ids)}
+        self._matrix = matrix
+        self._pending = []
+        self._fitted_size = len(movies)
+        self._added_since_fit = 0
+        self._built = True
+        self.version = self._fingerprint(vectorizer)
+        self.ann = ann
+
+    def transform(self, movies: List[Dict[str, Any]]) -> sp.csr_matrix:
+        """Vetoriza filmes com o vocabulário atual, sem reajustar o índice."""
+        if self.vectorizer is None:
+            return sp.csr_matrix((len(movies), 0))
+        return self.vectorizer.transform(
+            [self.featurize(movie) for movie in movies]
+        ).tocsr()
+
+    def add_movies(self, movies: Iterable[Dict[str, Any]]) -> int:
+        """
+        Anexa ao índice os filmes que ainda não estão nele.
+
+        Não faz nada se o índice ainda não foi construído; nesse caso os
+        filmes entram no primeiro ajuste completo.
+
+        Returns:
+            Quantidade de filmes adicionados
+        """
+        if not self.is_built:
+            return 0
+
+        new_movies = []
+        for movie in movies:
+            movie_id = self._movie_id(movie)
+            if movie_id not in self._positions:
+                self._positions[movie_id] = len(self.movie_ids)
+                self.movie_ids.append(movie_id)
+                new_movies.append(movie)
+
+        if new_movies:
+            rows = self.transform(new_movies)
+            self._pending.append(rows)
+            self._added_since_fit += len(new_movies)
+            if self.ann is not None:
+                self.ann.add(rows)
+        return len(new_movies)
+
+    def add_movie(self, movie: Dict[str, Any]) -> bool:
+        """Anexa um único filme ao índice (ver `add_movies`)."""
+        return self.add_movies([movie]) > 0
+
+    def positions_of(self, movie_ids: Iterable[str]) -> np.ndarray:
+        """Retorna as linhas da matriz para os IDs conhecidos pelo índice."""
+        positions = [
+            self._positions[str(movie_id)]
+            for movie_id in movie_ids
+            if str(movie_id) in self._positions
+        ]
+        return np.asarray(positions, dtype=np.int64)
+
+    def rows(self, movie_ids: Iterable[str]) -> sp.csr_matrix:
+        """Retorna as linhas TF-IDF dos filmes informados."""
+        return self.matrix[self.positions_of(movie_ids)]
+
+    def shortlist(
+        self,
+        query,
+        min_size: int,
+        max_candidates: Optional[int] = None,
+    ) -> Optional[np.ndarray]:
+        """
+        Retorna posições candidatas para o vetor `query` usando o índice ANN.
+
+        Retorna None quando não há índice ANN ou quando ele encontra menos de
+        `min_size` candidatos; nesses casos o chamador deve pontuar o
+        catálogo inteiro.
+        """
+        if self.ann is None or query.shape[0] == 0:
+            return None
+
+        candidates = self.ann.candidates(query, max_candidates=max_candidates)
+        if len(candidates) < min_size:
+            return None
+        return candidates
+
+    @staticmethod
+    def _fingerprint(vectorizer) -> str:
+        """
+        Identifica o espaço vetorial (vocabulário e IDF) do ajuste atual.
+
+        Vetores calculados com o mesmo fingerprint são comparáveis, inclusive
+        entre processos; vetores persistidos com outro fingerprint precisam
+        ser recalculados.
+        """
+        if isinstance(vectorizer, HashedTfidfVectorizer):
+            return vectorizer.fingerprint()
+
+        digest = hashlib.sha1()
+        if vectorizer is not None:
+            for term, column in sorted(vectorizer.vocabulary_.items()):
+                digest.update(f"{term}:{column};".encode("utf-8"))
+            digest.update(np.asarray(vectorizer.idf_, dtype=np.float64).tobytes())
+        return digest.hexdigest()[:16]
+
+    @staticmethod
+    def _movie_id(movie: Dict[str, Any]) -> str:
+        return str(movie.get("_id", movie.get("id")))
+
+
+def fit_features(
+    features: List[str],
+    ann_min_items: Optional[int] = None,
+    ann_params: Optional[Dict[str, int]] = None,
+    vectorizer=None,
+) -> Tuple[Any, sp.csr_matrix, Optional[RandomProjectionLSH]]:
+    """
+    Ajusta o vetorizador (TF-IDF por padrão) sobre os textos dos filmes e,
+    em catálogos com pelo menos `ann_min_items` filmes, constrói o índice
+    ANN.
+
+    Função pura (sem estado do índice) para poder rodar em outro processo.
+    """
+    if vectorizer is None:
+        vectorizer = TfidfVectorizer(stop_words="english")
+    try:
+        matrix = vectorizer.fit_transform(features).tocsr()
+    except ValueError:
+        # Catálogo vazio ou sem nenhum termo útil: índice sem colunas
+        vectorizer = None
+        matrix = sp.csr_matrix((len(features), 0))
+
+    ann = None
+    if (
+        ann_min_items is not None
+        and len(features) >= ann_min_items
+        and matrix.shape[1] > 0
+    ):
+        ann = RandomProjectionLSH(matrix.shape[1], **(ann_params or {}))
+        ann.add(matrix)
+    return vectorizer, matrix, ann
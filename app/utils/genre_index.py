@@ -0,0 +1,155 @@
+import time
+from typing import Any, Callable, Dict, Iterable, List
+
+import numpy as np
+
+from app.config import RECOMMENDATION_GENRE_CACHE_TTL
+from app.utils.cache import ReloadingIndex, TTLCache
+from app.utils.registry import get_db_scoped, peek_db_scoped
+
+# Quantidade de filmes por gênero, calculada no servidor
+GENRE_COUNTS_PIPELINE = [
+    {"$unwind": "$genres"},
+    {"$group": {"_id": "$genres", "count": {"$sum": 1}}},
+    {"$sort": {"count": -1, "_id": 1}},
+]
+
+
+class GenreIndex(ReloadingIndex):
+    """
+    Índice invertido em memória de gênero -> posições dos filmes.
+
+    As listas de posições são mantidas ordenadas (os filmes recebem
+    posições crescentes na ordem de inserção), então as consultas preservam
+    a ordem do catálogo, como `filter_by_genres`.
+
+    Filmes criados pelo próprio processo entram com `add_movie`; a recarga
+    após `ttl_seconds` (o mesmo TTL das contagens por gênero) incorpora os
+    filmes gravados por outros processos e descarta os alterados ou
+    removidos.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = RECOMMENDATION_GENRE_CACHE_TTL,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        super().__init__(ttl_seconds, clock)
+        self.movie_ids: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self._postings: Dict[str, List[int]] = {}
+        self._arrays: Dict[str, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self.movie_ids)
+
+    async def fetch(self, db) -> List[Dict[str, Any]]:
+        return await db.movies.find({}, {"genres": 1}).to_list(length=None)
+
+    def load(self, movies: Iterable[Dict[str, Any]]) -> None:
+        """Reconstrói o índice a partir de uma lista de filmes."""
+        self.movie_ids = []
+        self._positions = {}
+        self._postings = {}
+        self._arrays = {}
+        for movie in movies:
+            self._add(movie)
+        self._mark_loaded()
+
+    def add_movie(self, movie: Dict[str, Any]) -> bool:
+        """Inclui um filme novo no índice (apenas se o índice já foi carregado)."""
+        if not self.is_loaded:
+            return False
+        return self._add(movie)
+
+    def _add(self, movie: Dict[str, Any]) -> bool:
+        movie_id = str(movie.get("_id", movie.get("id")))
+        if movie_id in self._positions:
+            return False
+
+        position = len(self.movie_ids)
+        self._positions[movie_id] = position
+        self.movie_ids.append(movie_id)
+        for genre in set(movie.get("genres") or []):
+            self._postings.setdefault(genre, []).append(position)
+            self._arrays.pop(genre, None)
+        return True
+
+    def _posting(self, genre: str) -> np.ndarray:
+        array = self._arrays.get(genre)
+        if array is None:
+            array = np.asarray(self._postings.get(genre, []), dtype=np.int64)
+            self._arrays[genre] = array
+        return array
+
+    def query(self, genres: Iterable[str], min_match: int = 1) -> np.ndarray:
+        """
+        Posições dos filmes com pelo menos `min_match` dos gêneros informados.
+
+        Mesma semântica de `filter_by_genres`: sem gêneros, todos os filmes
+        são retornados.
+        """
+        genres = set(genres or [])
+        if not genres or min_match <= 0:
+            return np.arange(len(self.movie_ids))
+
+        postings = [self._posting(genre) for genre in genres if genre in self._postings]
+        if len(postings) < min_match:
+            return np.empty(0, dtype=np.int64)
+        if min_match == 1:
+            return np.unique(np.concatenate(postings))
+
+        counts = np.bincount(np.concatenate(postings), minlength=len(self.movie_ids))
+        return np.flatnonzero(counts >= min_match)
+
+    def movie_ids_for(self, genres: Iterable[str], min_match: int = 1) -> List[str]:
+        """IDs dos filmes com pelo menos `min_match` dos gêneros informados."""
+        return [self.movie_ids[i] for i in self.query(genres, min_match)]
+
+
+def get_genre_index(db) -> GenreIndex:
+    """Retorna o índice de gêneros associado ao banco `db`."""
+    return get_db_scoped(db, "genre_index", GenreIndex)
+
+
+async def load_genre_counts(db) -> Dict[str, int]:
+    """Conta os filmes de cada gênero com uma agregação no MongoDB."""
+    rows = await db.movies.aggregate(GENRE_COUNTS_PIPELINE).to_list(length=None)
+    return {row["_id"]: row["count"] for row in rows}
+
+
+def get_genre_counts_cache(db) -> TTLCache:
+    """Cache (TTL com recarga em segundo plano) das contagens por gênero."""
+    return get_db_scoped(
+        db, "genre_counts", lambda: TTLCache(RECOMMENDATION_GENRE_CACHE_TTL)
+    )
+
+
+async def get_popular_genres(db, limit: int = 5) -> List[str]:
+    """
+    Gêneros com mais filmes no catálogo.
+
+    As contagens vêm do cache do processo: só a primeira chamada espera a
+    agregação; depois do TTL, a contagem vencida é servida enquanto uma
+    nova agregação roda em segundo plano.
+    """
+    counts = await get_genre_counts_cache(db).get_or_load(
+        "counts", lambda: load_genre_counts(db)
+    )
+    ranked = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+    return [genre for genre, _ in ranked[:limit]]
+
+
+def add_movie_genre_counts(db, movie: Dict[str, Any]) -> None:
+    """Incrementa as contagens em cache com os gêneros de um filme novo."""
+    cache = peek_db_scoped(db, "genre_counts")
+    if cache is None:
+        return
+
+    def apply(counts: Dict[str, int]) -> Dict[str, int]:
+        counts = dict(counts)
+        for genre in set(movie.get("genres") or []):
+            counts[genre] = counts.get(genre, 0) + 1
+        return counts
+
+    cache.update("counts", apply)
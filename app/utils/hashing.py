@@ -0,0 +1,105 @@
+import hashlib
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+
+
+class HashedTfidfVectorizer:
+    """
+    Vetorizador TF-IDF em um espaço de largura fixa (hashing trick), sem
+    vocabulário.
+
+    Cada filme é vetorizado de forma independente: não há ajuste sobre o
+    catálogo, então vetores de processos e momentos diferentes são
+    comparáveis e podem ser persistidos. Opcionalmente aplica pesos IDF
+    (calculados sobre o catálogo uma vez e armazenados); colunas nunca vistas
+    recebem o maior IDF possível (`default_idf`).
+
+    Mesma interface usada de `TfidfVectorizer` (`fit_transform`/`transform`),
+    com linhas normalizadas em L2.
+    """
+
+    def __init__(
+        self,
+        n_features: int = 2**16,
+        use_idf: bool = False,
+        idf: Optional[sp.csr_matrix] = None,
+        default_idf: float = 1.0,
+    ):
+        self.n_features = n_features
+        self.use_idf = use_idf
+        self.idf = idf
+        self.default_idf = default_idf
+        self._hasher = HashingVectorizer(
+            n_features=n_features,
+            stop_words="english",
+            alternate_sign=False,
+            norm=None,
+        )
+
+    @property
+    def is_fitted(self) -> bool:
+        return not self.use_idf or self.idf is not None
+
+    def fit(self, texts: List[str]) -> "HashedTfidfVectorizer":
+        """Calcula o IDF (suavizado, como o do scikit-learn) sobre `texts`."""
+        if self.use_idf:
+            counts = self._hasher.transform(texts).tocsc()
+            n_docs = counts.shape[0]
+            df = np.diff(counts.indptr)
+            columns = np.flatnonzero(df)
+            self.default_idf = float(np.log(1 + n_docs) + 1.0)
+            values = np.log((1 + n_docs) / (1 + df[columns])) + 1.0
+            self.idf = sp.csr_matrix(
+                (values, (np.zeros(len(columns), dtype=np.int64), columns)),
+                shape=(1, self.n_features),
+            )
+        return self
+
+    def transform(self, texts: List[str]) -> sp.csr_matrix:
+        counts = self._hasher.transform(texts).tocsr().astype(np.float64)
+        if self.use_idf and self.idf is not None:
+            weights = self.idf.toarray().ravel()
+            weights[weights == 0] = self.default_idf
+            counts = counts @ sp.diags(weights)
+        return normalize(counts.tocsr(), norm="l2")
+
+    def fit_transform(self, texts: List[str]) -> sp.csr_matrix:
+        """Ajusta o IDF apenas se ainda não houver um armazenado."""
+        if not self.is_fitted:
+            self.fit(texts)
+        return self.transform(texts)
+
+    def fingerprint(self) -> str:
+        """Identifica o espaço vetorial: largura e pesos IDF (se houver)."""
+        digest = hashlib.sha1(f"hashing:{self.n_features}".encode("utf-8"))
+        if self.use_idf and self.idf is not None:
+            digest.update(self.idf.indices.tobytes())
+            digest.update(self.idf.data.tobytes())
+            digest.update(np.float64(self.default_idf).tobytes())
+        return digest.hexdigest()[:16]
+
+    def to_document(self) -> Dict[str, Any]:
+        """Pesos IDF no formato gravado na coleção `feature_models`."""
+        return {
+            "n_features": self.n_features,
+            "columns": self.idf.indices.tolist(),
+            "values": self.idf.data.tolist(),
+            "default_idf": self.default_idf,
+        }
+
+    @classmethod
+    def from_document(cls, document: Dict[str, Any]) -> "HashedTfidfVectorizer":
+        n_features = document["n_features"]
+        columns = np.asarray(document["columns"], dtype=np.int64)
+        idf = sp.csr_matrix(
+            (
+                np.asarray(document["values"], dtype=np.float64),
+                (np.zeros(len(columns), dtype=np.int64), columns),
+            ),
+            shape=(1, n_features),
+        )
+        return cls(n_features, True, idf, document["default_idf"])
@@ -0,0 +1,227 @@
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import DeleteOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from app.config import REVIEW_ID_DUAL_READ, REVIEW_ID_MIGRATION_CHECK_SECONDS
+from app.utils.cache import TTLCache
+from app.utils.rating_aggregates import revert_review_aggregates
+from app.utils.registry import get_db_scoped, peek_db_scoped
+
+# Checkpoint e marca de conclusão em `recommendation_jobs`
+MIGRATION_JOB_ID = "migrate-ids"
+
+# Campos de `reviews` normalizados para ObjectId
+ID_FIELDS = ("user_id", "movie_id")
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+def _migration_status(db) -> TTLCache:
+    return get_db_scoped(
+        db, "id_migration", lambda: TTLCache(REVIEW_ID_MIGRATION_CHECK_SECONDS)
+    )
+
+
+async def is_migration_complete(db) -> bool:
+    """True se `migrate-ids` terminou sem deixar IDs gravados como string."""
+    job = await db.recommendation_jobs.find_one({"_id": MIGRATION_JOB_ID})
+    return bool(job and job.get("completed_at"))
+
+
+async def dual_read_enabled(db) -> bool:
+    """
+    Indica se as leituras de `reviews` ainda devem aceitar user_id/movie_id
+    gravados como string (ver REVIEW_ID_DUAL_READ). No modo "auto", a marca
+    de conclusão da migração fica em cache por
+    REVIEW_ID_MIGRATION_CHECK_SECONDS.
+    """
+    if REVIEW_ID_DUAL_READ == "true":
+        return True
+    if REVIEW_ID_DUAL_READ == "false":
+        return False
+    complete = await _migration_status(db).get_or_load(
+        "complete", lambda: is_migration_complete(db)
+    )
+    return not complete
+
+
+async def review_id_values(db, ids: Iterable[Any]) -> List[Any]:
+    """
+    Valores de user_id/movie_id a consultar em `reviews` com `$in`: os
+    ObjectIds e, enquanto a leitura dupla estiver ativa, também as strings.
+    Uma única consulta indexada atende os dois formatos.
+    """
+    ids = list(ids)
+    values: List[Any] = [ObjectId(str(v)) for v in ids if ObjectId.is_valid(str(v))]
+    if await dual_read_enabled(db):
+        values.extend(str(v) for v in ids)
+    return values
+
+
+async def review_id_filter(db, ids: Iterable[Any]) -> Dict[str, List[Any]]:
+    """Filtro `{"$in": [...]}` de `review_id_values`."""
+    return {"$in": await review_id_values(db, ids)}
+
+
+def _normalized_ids(review: Dict[str, Any]) -> Dict[str, ObjectId]:
+    """Campos da avaliação gravados como string que são ObjectIds válidos."""
+    return {
+        field: ObjectId(review[field])
+        for field in ID_FIELDS
+        if isinstance(review.get(field), str) and ObjectId.is_valid(review[field])
+    }
+
+
+async def migrate_review_ids(
+    db, batch_size: int = 1000, resume: bool = True
+) -> Dict[str, int]:
+    """
+    Converte `reviews.user_id` e `reviews.movie_id` gravados como string
+    para ObjectId, em lotes de `batch_size` avaliações na ordem de `_id`.
+
+    A migração roda com a API no ar: cada lote é um `bulk_write` e o último
+    `_id` processado é gravado em `recommendation_jobs`, de modo que uma
+    execução interrompida continua de onde parou (`resume=True`). Avaliações
+    inseridas durante a execução têm `_id` maior e entram nos lotes finais.
+
+    Se a conversão colidir com o índice único (user_id, movie_id) — o mesmo
+    par gravado nos dois formatos —, a cópia com IDs em string é removida e
+    retirada dos agregados do filme, das estatísticas em memória e do
+    perfil do usuário (marcado como defasado, recalculado na próxima leitura).
+
+    Ao final, se nenhuma avaliação ficou com ID em string, a migração é
+    marcada como concluída e a leitura dupla (modo "auto") é desligada.
+
+    Returns:
+        Contagens desta execução: scanned, converted, duplicates_removed e
+        remaining (avaliações ainda com ID em string)
+    """
+    checkpoint = await db.recommendation_jobs.find_one({"_id": MIGRATION_JOB_ID})
+    if resume and checkpoint and checkpoint.get("finished_at") is None:
+        last_review_id = checkpoint.get("last_review_id")
+        print(f"Resuming {MIGRATION_JOB_ID} after review {last_review_id}")
+    else:
+        last_review_id = None
+        await db.recommendation_jobs.replace_one(
+            {"_id": MIGRATION_JOB_ID},
+            {
+                "started_at": datetime.utcnow(),
+                "finished_at": None,
+                "completed_at": None,
+                "last_review_id": None,
+                "scanned": 0,
+                "converted": 0,
+                "duplicates_removed": 0,
+            },
+            upsert=True,
+        )
+
+    total = await db.reviews.count_documents(_after(last_review_id))
+    counts = {"scanned": 0, "converted": 0, "duplicates_removed": 0}
+    while True:
+        reviews = (
+            await db.reviews.find(
+                _after(last_review_id), {**{field: 1 for field in ID_FIELDS}, "rating": 1}
+            )
+            .sort("_id", 1)
+            .limit(batch_size)
+            .to_list(length=batch_size)
+        )
+        if not reviews:
+            break
+
+        converted, removed = await _convert_batch(db, reviews)
+        last_review_id = reviews[-1]["_id"]
+        batch = {
+            "scanned": len(reviews),
+            "converted": converted,
+            "duplicates_removed": removed,
+        }
+        for key, value in batch.items():
+            counts[key] += value
+        await db.recommendation_jobs.update_one(
+            {"_id": MIGRATION_JOB_ID},
+            {"$set": {"last_review_id": last_review_id}, "$inc": batch},
+        )
+        print(
+            f"{MIGRATION_JOB_ID}: {counts['scanned']}/{total} reviews scanned, "
+            f"{counts['converted']} converted"
+        )
+
+    counts["remaining"] = await db.reviews.count_documents(
+        {"$or": [{field: {"$type": "string"}} for field in ID_FIELDS]}
+    )
+    finished_at = datetime.utcnow()
+    await db.recommendation_jobs.update_one(
+        {"_id": MIGRATION_JOB_ID},
+        {
+            "$set": {
+                "finished_at": finished_at,
+                "completed_at": finished_at if not counts["remaining"] else None,
+                "remaining": counts["remaining"],
+            }
+        },
+    )
+    _migration_status(db).invalidate()
+    if counts["remaining"]:
+        print(
+            f"{MIGRATION_JOB_ID}: {counts['remaining']} reviews still have "
+            "string IDs (not valid ObjectIds); dual read stays enabled"
+        )
+    return counts
+
+
+def _after(review_id: Optional[ObjectId]) -> Dict[str, Any]:
+    return {"_id": {"$gt": review_id}} if review_id is not None else {}
+
+
+async def _convert_batch(db, reviews: List[Dict[str, Any]]) -> Tuple[int, int]:
+    """Converte um lote; retorna (avaliações convertidas, duplicatas removidas)."""
+    converting, operations = [], []
+    for review in reviews:
+        update = _normalized_ids(review)
+        if update:
+            converting.append(review)
+            operations.append(UpdateOne({"_id": review["_id"]}, {"$set": update}))
+    if not operations:
+        return 0, 0
+
+    try:
+        result = await db.reviews.bulk_write(operations, ordered=False)
+        return result.modified_count, 0
+    except BulkWriteError as e:
+        details = e.details
+        duplicates = [
+            converting[error["index"]]
+            for error in details.get("writeErrors", [])
+            if error.get("code") == DUPLICATE_KEY_ERROR
+        ]
+        if len(duplicates) != len(details.get("writeErrors", [])):
+            raise
+
+    await _remove_duplicates(db, duplicates)
+    print(f"{MIGRATION_JOB_ID}: removed {len(duplicates)} duplicated reviews")
+    return details.get("nModified", 0), len(duplicates)
+
+
+async def _remove_duplicates(db, duplicates: List[Dict[str, Any]]) -> None:
+    """
+    Remove as cópias em string e desfaz sua contribuição nos agregados do
+    filme, nas estatísticas em memória e nos perfis dos usuários.
+    """
+    await db.reviews.bulk_write(
+        [DeleteOne({"_id": review["_id"]}) for review in duplicates], ordered=False
+    )
+    stats = peek_db_scoped(db, "rating_stats")
+    for review in duplicates:
+        await revert_review_aggregates(db, review)
+        if stats is not None and stats.is_loaded and review.get("rating") is not None:
+            stats.remove_review(review["movie_id"], review["rating"])
+
+    await db.user_profiles.update_many(
+        {"_id": {"$in": list({str(review["user_id"]) for review in duplicates})}},
+        {"$set": {"feature_version": None}},
+    )
@@ -0,0 +1,363 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+
+from app.utils.artifacts import ArtifactWriter, ModelArtifacts, load_artifacts
+from app.utils.recommendation import top_k_indices
+
+# Memória total (bytes, somando todas as threads) dos produtos externos
+# usados na montagem dos sistemas do ALS. Cada avaliação de um bloco ocupa
+# n_factors² floats, então o tamanho dos blocos é derivado deste limite,
+# de `n_factors` e do número de threads (ver `als_block_ratings`).
+ALS_OUTER_BUDGET_BYTES = 256 * 1024 * 1024
+ALS_MIN_BLOCK_RATINGS = 256
+
+
+def als_block_ratings(
+    n_factors: int, n_jobs: int, budget_bytes: int = ALS_OUTER_BUDGET_BYTES
+) -> int:
+    """Avaliações por bloco que mantêm os blocos simultâneos dentro do limite."""
+    per_rating = n_factors * n_factors * np.dtype(np.float64).itemsize
+    return max(ALS_MIN_BLOCK_RATINGS, budget_bytes // (2 * n_jobs * per_rating))
+
+
+def build_ratings_matrix(
+    ratings: Iterable[Tuple[str, str, float]]
+) -> Tuple[sp.csr_matrix, List[str], List[str]]:
+    """
+    Monta a matriz esparsa usuário x filme a partir de triplas
+    (user_id, movie_id, rating).
+
+    Returns:
+        Tupla (matriz, IDs dos usuários por linha, IDs dos filmes por coluna)
+    """
+    user_positions: Dict[str, int] = {}
+    item_positions: Dict[str, int] = {}
+    rows: List[int] = []
+    cols: List[int] = []
+    values: List[float] = []
+
+    for user_id, movie_id, rating in ratings:
+        rows.append(user_positions.setdefault(user_id, len(user_positions)))
+        cols.append(item_positions.setdefault(movie_id, len(item_positions)))
+        values.append(float(rating))
+
+    matrix = sp.csr_matrix(
+        (np.asarray(values, dtype=np.float64), (rows, cols)),
+        shape=(len(user_positions), len(item_positions)),
+    )
+    # Avaliações duplicadas do mesmo par são somadas pelo scipy; usar a média
+    counts = sp.csr_matrix(
+        (np.ones(len(values)), (rows, cols)), shape=matrix.shape
+    )
+    matrix.sum_duplicates()
+    counts.sum_duplicates()
+    matrix.data /= counts.data
+
+    return matrix, list(user_positions), list(item_positions)
+
+
+def _solve_block(
+    ratings: sp.csr_matrix,
+    fixed: np.ndarray,
+    rows: np.ndarray,
+    reg: float,
+    block_ratings: int,
+) -> np.ndarray:
+    """
+    Resolve os mínimos quadrados regularizados de um bloco de linhas.
+
+    Blocos com até 2 × `block_ratings` avaliações montam os sistemas com um
+    produto externo por avaliação; acima disso (linhas com muitas
+    avaliações), cada sistema é acumulado com `F_uᵀ F_u`, sem o array 3D.
+    """
+    n_factors = fixed.shape[1]
+    block = ratings[rows]
+    result = np.zeros((len(rows), n_factors))
+
+    lengths = np.diff(block.indptr)
+    active = np.flatnonzero(lengths)
+    if active.size == 0:
+        return result
+
+    factors = fixed[block.indices]
+    starts = block.indptr[:-1][active]
+
+    # A_u = Σ v_i v_iᵀ + λ n_u I   e   b_u = Σ r_ui v_i
+    if block.nnz <= 2 * block_ratings:
+        outer = np.einsum("ni,nj->nij", factors, factors)
+        a = np.add.reduceat(outer, starts, axis=0)
+    else:
+        ends = block.indptr[1:][active]
+        a = np.stack(
+            [factors[start:end].T @ factors[start:end] for start, end in zip(starts, ends)]
+        )
+    a += (reg * lengths[active])[:, None, None] * np.eye(n_factors)
+    b = np.add.reduceat(factors * block.data[:, None], starts, axis=0)
+
+    result[active] = np.linalg.solve(a, b[..., None])[..., 0]
+    return result
+
+
+def _solve_all(
+    ratings: sp.csr_matrix,
+    fixed: np.ndarray,
+    reg: float,
+    pool: ThreadPoolExecutor,
+    block_ratings: int,
+) -> np.ndarray:
+    """Atualiza os fatores de todas as linhas de `ratings` em paralelo."""
+    n_rows = ratings.shape[0]
+    # Blocos de linhas com aproximadamente `block_ratings` avaliações cada
+    boundaries = np.searchsorted(
+        ratings.indptr, np.arange(0, ratings.nnz, block_ratings), side="right"
+    )
+    boundaries = np.unique(np.concatenate([[0], boundaries - 1, [n_rows]]))
+    blocks = [
+        np.arange(start, end)
+        for start, end in zip(boundaries[:-1], boundaries[1:])
+        if end > start
+    ]
+
+    results = pool.map(
+        lambda rows: _solve_block(ratings, fixed, rows, reg, block_ratings), blocks
+    )
+    return np.vstack(list(results)) if blocks else np.zeros((0, fixed.shape[1]))
+
+
+def train_als(
+    ratings: sp.csr_matrix,
+    n_factors: int = 32,
+    regularization: float = 0.1,
+    iterations: int = 10,
+    n_jobs: Optional[int] = None,
+    seed: int = 42,
+    block_ratings: Optional[int] = None,
+    verbose: bool = False,
+) -> Tuple[np.ndarray, np.ndarray, float]:
+    """
+    Fatoração de matriz por mínimos quadrados alternados (ALS) explícito.
+
+    As notas são centralizadas pela média global e cada usuário/filme é
+    regularizado proporcionalmente à sua quantidade de avaliações. Os blocos
+    de linhas são resolvidos em paralelo em `n_jobs` threads (o NumPy libera
+    o GIL nas operações de álgebra linear); sem `block_ratings`, o tamanho
+    dos blocos vem de `als_block_ratings`.
+
+    Returns:
+        Tupla (fatores dos usuários, fatores dos filmes, média global)
+    """
+    ratings = ratings.tocsr().astype(np.float64)
+    global_mean = float(ratings.data.mean()) if ratings.nnz else 0.0
+
+    centered = ratings.copy()
+    centered.data -= global_mean
+    centered_t = centered.T.tocsr()
+
+    rng = np.random.default_rng(seed)
+    user_factors = np.zeros((ratings.shape[0], n_factors))
+    item_factors = rng.normal(scale=0.1, size=(ratings.shape[1], n_factors))
+
+    n_jobs = n_jobs or os.cpu_count() or 1
+    block_ratings = block_ratings or als_block_ratings(n_factors, n_jobs)
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        for iteration in range(iterations):
+            user_factors = _solve_all(
+                centered, item_factors, regularization, pool, block_ratings
+            )
+            item_factors = _solve_all(
+                centered_t, user_factors, regularization, pool, block_ratings
+            )
+
+            if verbose:
+                coo = centered.tocoo()
+                predictions = np.einsum(
+                    "ij,ij->i", user_factors[coo.row], item_factors[coo.col]
+                )
+                rmse = np.sqrt(np.mean((predictions - coo.data) ** 2))
+                print(f"Iteração {iteration + 1}/{iterations}: RMSE de treino {rmse:.4f}")
+
+    return user_factors, item_factors, global_mean
+
+
+def sorted_id_index(ids: Iterable[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Índice de busca binária de uma lista de IDs: os IDs ordenados (array de
+    largura fixa) e a posição original de cada um.
+    """
+    ids = np.asarray([str(value) for value in ids], dtype=str)
+    order = np.argsort(ids, kind="stable")
+    return ids[order], order
+
+
+def lookup_rows(
+    keys: np.ndarray, rows: Optional[np.ndarray], ids: Iterable[str]
+) -> np.ndarray:
+    """
+    Posições dos `ids` em um índice de `sorted_id_index` (-1 para IDs fora
+    dele). Sem `rows`, a posição é a própria posição no array ordenado.
+    """
+    ids = np.asarray([str(value) for value in ids], dtype=str)
+    if len(keys) == 0 or ids.size == 0:
+        return np.full(ids.shape, -1, dtype=np.int64)
+    found = np.minimum(np.searchsorted(keys, ids), len(keys) - 1)
+    positions = rows[found] if rows is not None else found
+    return np.where(keys[found] == ids, positions, -1).astype(np.int64)
+
+
+class MatrixFactorizationModel:
+    """
+    Fatores de usuários e filmes treinados a partir da coleção `reviews`.
+
+    A recomendação de um usuário é um único produto denso entre o vetor do
+    usuário e a matriz de fatores dos filmes, seguido de um top-k. Os IDs
+    são consultados por busca binária em arrays ordenados; o modelo gravado
+    já guarda os IDs ordenados (e os fatores na mesma ordem), então a carga
+    não monta nenhum dicionário por worker.
+    """
+
+    def __init__(
+        self,
+        user_ids: Sequence[str],
+        item_ids: Sequence[str],
+        user_factors: np.ndarray,
+        item_factors: np.ndarray,
+        global_mean: float = 0.0,
+        trained_at: Optional[str] = None,
+        ids_sorted: bool = False,
+    ):
+        self.user_ids = user_ids
+        self.item_ids = item_ids
+        self.user_factors = user_factors
+        self.item_factors = item_factors
+        self.global_mean = global_mean
+        self.trained_at = trained_at
+        if ids_sorted:
+            # IDs lidos do artefato: já ordenados e alinhados com os fatores
+            self._user_keys, self._user_rows = np.asarray(user_ids), None
+            self._item_keys, self._item_rows = np.asarray(item_ids), None
+        else:
+            self._user_keys, self._user_rows = sorted_id_index(user_ids)
+            self._item_keys, self._item_rows = sorted_id_index(item_ids)
+
+    def user_rows(self, user_ids: Iterable[str]) -> np.ndarray:
+        """Linhas dos usuários em `user_factors` (-1 fora do modelo)."""
+        return lookup_rows(self._user_keys, self._user_rows, user_ids)
+
+    def item_rows(self, item_ids: Iterable[str]) -> np.ndarray:
+        """Linhas dos filmes em `item_factors` (-1 fora do modelo)."""
+        return lookup_rows(self._item_keys, self._item_rows, item_ids)
+
+    def item_id(self, row: int) -> str:
+        return str(self.item_ids[row])
+
+    def has_user(self, user_id: str) -> bool:
+        return bool(self.user_rows([user_id])[0] >= 0)
+
+    def score_items(self, user_id: str) -> np.ndarray:
+        """Pontuação prevista (sem a média global) de todos os filmes."""
+        return self.item_factors @ self.user_factors[self.user_rows([user_id])[0]]
+
+    def score_items_for(self, user_id: str, item_ids: Iterable[str]) -> np.ndarray:
+        """Pontuação prevista dos filmes informados (0.0 fora do modelo)."""
+        scores = self.score_items(user_id)
+        positions = self.item_rows(item_ids)
+        return np.where(positions >= 0, scores[positions], 0.0)
+
+    def score_users(self, user_ids: List[str]) -> np.ndarray:
+        """Pontuações previstas (usuários x filmes) de vários usuários de uma vez."""
+        return self.user_factors[self.user_rows(user_ids)] @ self.item_factors.T
+
+    def recommend(
+        self, user_id: str, k: int, exclude: Iterable[str] = ()
+    ) -> List[str]:
+        """Retorna os IDs dos `k` filmes com maior nota prevista para o usuário."""
+        if not self.has_user(user_id):
+            return []
+
+        scores = self.score_items(user_id)
+        excluded = self.item_rows(exclude)
+        scores[excluded[excluded >= 0]] = -np.inf
+        return [self.item_id(i) for i in top_k_indices(scores, k)]
+
+    def save(self, path: str) -> None:
+        """
+        Grava os fatores e os metadados em `path` com `ArtifactWriter`: cada
+        treino vira uma nova versão publicada pelo link `current`, então
+        processos que já mapearam o modelo anterior continuam lendo os
+        arquivos antigos e nunca veem fatores e IDs de treinos diferentes.
+
+        Os IDs vão ordenados para arrays `.npy` de largura fixa, com os
+        fatores reordenados para a mesma ordem.
+        """
+        user_keys, user_order = sorted_id_index(self.user_ids)
+        item_keys, item_order = sorted_id_index(self.item_ids)
+
+        writer = ArtifactWriter(path)
+        writer.add_array("user_ids", user_keys)
+        writer.add_array("item_ids", item_keys)
+        writer.add_array("user_factors", self.user_factors[user_order])
+        writer.add_array("item_factors", self.item_factors[item_order])
+        writer.add_metadata(
+            "model",
+            {
+                "global_mean": self.global_mean,
+                "n_factors": int(self.item_factors.shape[1]),
+                "trained_at": self.trained_at or datetime.utcnow().isoformat(),
+            },
+        )
+        writer.commit()
+
+    @classmethod
+    def load(cls, path: str) -> "MatrixFactorizationModel":
+        """
+        Carrega um modelo gravado por `save`. Os fatores e os IDs são
+        mapeados em memória (somente leitura), compartilhados entre os
+        workers do host.
+        """
+        return cls.from_artifacts(ModelArtifacts.open(path))
+
+    @classmethod
+    def from_artifacts(cls, artifacts: ModelArtifacts) -> "MatrixFactorizationModel":
+        metadata = artifacts.metadata("model")
+        if artifacts.has("user_ids"):
+            user_ids, item_ids = artifacts.array("user_ids"), artifacts.array("item_ids")
+        else:
+            # Modelos gravados antes dos arrays de IDs: listas no manifesto
+            user_ids, item_ids = metadata["user_ids"], metadata["item_ids"]
+        return cls(
+            user_ids=user_ids,
+            item_ids=item_ids,
+            user_factors=artifacts.array("user_factors"),
+            item_factors=artifacts.array("item_factors"),
+            global_mean=metadata.get("global_mean", 0.0),
+            trained_at=metadata.get("trained_at"),
+            ids_sorted=artifacts.has("user_ids"),
+        )
+
+
+_loaded_models: Dict[str, Tuple[ModelArtifacts, MatrixFactorizationModel]] = {}
+
+
+def get_mf_model(path: str) -> Optional[MatrixFactorizationModel]:
+    """
+    Retorna o modelo gravado em `path`, recarregando-o quando o diretório é
+    trocado por um novo treino. Retorna None se não houver modelo.
+    """
+    artifacts = load_artifacts(path)
+    if artifacts is None:
+        return None
+
+    cached = _loaded_models.get(path)
+    if cached is None or cached[0] is not artifacts:
+        try:
+            cached = (artifacts, MatrixFactorizationModel.from_artifacts(artifacts))
+        except Exception as e:
+            print(f"Error loading matrix factorization model: {str(e)}")
+            return None
+        _loaded_models[path] = cached
+    return cached[1]
@@ -0,0 +1,89 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.utils.recommendation import encode_similarity_features, similarity_to_rows
+
+# Limite aproximado de células da matriz densa de similaridade calculada
+# por bloco (bloco x catálogo), para manter a memória previsível
+BLOCK_CELLS = 4_000_000
+
+
+def top_k_neighbors(
+    movies: List[Dict[str, Any]], k: int, block_cells: int = BLOCK_CELLS
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Calcula os `k` vizinhos mais similares de cada filme do catálogo, com a
+    mesma pontuação de `calculate_similarity`.
+
+    O cálculo é feito em blocos de linhas para limitar a memória a
+    aproximadamente `block_cells` pontuações por vez.
+
+    Returns:
+        Tupla (índices, pontuações), ambos com formato (len(movies), k).
+        Posições sem vizinho (pontuação zero) têm índice -1.
+    """
+    n = len(movies)
+    k = max(0, min(k, n - 1))
+    neighbors = np.full((n, k), -1, dtype=np.int64)
+    scores = np.zeros((n, k), dtype=np.float64)
+    if n == 0 or k == 0:
+        return neighbors, scores
+
+    encoded = encode_similarity_features(movies)
+    block_size = max(1, block_cells // n)
+
+    for start in range(0, n, block_size):
+        rows = np.arange(start, min(start + block_size, n))
+        block = similarity_to_rows(encoded, rows)
+        block[np.arange(len(rows)), rows] = -np.inf
+
+        top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(block, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+        # Filmes sem nenhum atributo em comum não são considerados vizinhos
+        top[top_scores <= 0] = -1
+        neighbors[rows] = top
+        scores[rows] = np.where(top_scores > 0, top_scores, 0.0)
+
+    return neighbors, scores
+
+
+class NeighborTable:
+    """
+    Tabela de vizinhos lida de artefatos (`build-artifacts`), mapeada em
+    memória. Os IDs ficam ordenados, então a consulta é uma busca binária no
+    array mapeado, sem montar um dicionário por worker.
+    """
+
+    def __init__(
+        self, movie_ids: np.ndarray, neighbors: np.ndarray, scores: np.ndarray
+    ):
+        self.movie_ids = movie_ids
+        self.neighbors = neighbors
+        self.scores = scores
+
+    @property
+    def k(self) -> int:
+        return self.neighbors.shape[1]
+
+    def lookup(self, movie_id: str) -> Optional[List[str]]:
+        """IDs dos vizinhos do filme, ou None se ele não estiver na tabela."""
+        movie_id = str(movie_id)
+        row = int(np.searchsorted(self.movie_ids, movie_id))
+        if row >= len(self.movie_ids) or self.movie_ids[row] != movie_id:
+            return None
+        return [str(self.movie_ids[j]) for j in self.neighbors[row] if j >= 0]
+
+    @classmethod
+    def from_artifacts(cls, artifacts) -> Optional["NeighborTable"]:
+        if artifacts is None or not artifacts.has("neighbors"):
+            return None
+        return cls(
+            artifacts.array("neighbor_movie_ids"),
+            artifacts.array("neighbors"),
+            artifacts.array("neighbor_scores"),
+        )
@@ -0,0 +1,174 @@
+from typing import Any, Dict
+
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+
+from app.utils.validation import to_object_id
+
+# Índice da ordenação de filmes populares (`get_popular_movies`)
+POPULARITY_SORT = [("review_count", -1), ("rating_avg", -1)]
+
+
+async def create_popularity_index(db) -> None:
+    """Cria (se ainda não existir) o índice da ordenação `POPULARITY_SORT`."""
+    await db.movies.create_index(POPULARITY_SORT)
+
+
+def rating_bucket(rating: float) -> str:
+    """Faixa do histograma de uma nota: a parte inteira, de "0" a "5"."""
+    return str(min(max(int(rating), 0), 5))
+
+
+def empty_aggregates() -> Dict[str, Any]:
+    """Agregados de um filme sem avaliações."""
+    return {
+        "review_count": 0,
+        "rating_sum": 0.0,
+        "rating_avg": 0.0,
+        "rating_histogram": {},
+    }
+
+
+async def apply_review_aggregates(db, review: Dict[str, Any]) -> None:
+    """
+    Incorpora uma nova avaliação aos agregados do filme.
+
+    Contagem, soma e histograma são incrementados atomicamente com `$inc`.
+    A média é gravada em seguida apenas se a contagem ainda for a lida
+    (nenhuma avaliação concorrente no meio); caso contrário, a escrita da
+    avaliação mais recente grava a média final.
+    """
+    rating = review.get("rating")
+    movie_id = to_object_id(review.get("movie_id"))
+    if rating is None or movie_id is None:
+        return
+
+    movie = await db.movies.find_one_and_update(
+        {"_id": movie_id},
+        {
+            "$inc": {
+                "review_count": 1,
+                "rating_sum": float(rating),
+                f"rating_histogram.{rating_bucket(rating)}": 1,
+            }
+        },
+        projection={"review_count": 1, "rating_sum": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    if movie is None:
+        return
+
+    await db.movies.update_one(
+        {"_id": movie_id, "review_count": movie["review_count"]},
+        {"$set": {"rating_avg": movie["rating_sum"] / movie["review_count"]}},
+    )
+
+
+async def revert_review_aggregates(db, review: Dict[str, Any]) -> None:
+    """
+    Retira dos agregados do filme uma avaliação removida: o inverso de
+    `apply_review_aggregates`, com a média regravada da mesma forma.
+    """
+    rating = review.get("rating")
+    movie_id = to_object_id(review.get("movie_id"))
+    if rating is None or movie_id is None:
+        return
+
+    movie = await db.movies.find_one_and_update(
+        {"_id": movie_id, "review_count": {"$gt": 0}},
+        {
+            "$inc": {
+                "review_count": -1,
+                "rating_sum": -float(rating),
+                f"rating_histogram.{rating_bucket(rating)}": -1,
+            }
+        },
+        projection={"review_count": 1, "rating_sum": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    if movie is None:
+        return
+
+    count = movie["review_count"]
+    await db.movies.update_one(
+        {"_id": movie_id, "review_count": count},
+        {"$set": {"rating_avg": movie["rating_sum"] / count if count else 0.0}},
+    )
+
+
+async def repair_rating_aggregates(db, batch_size: int = 1000) -> int:
+    """
+    Recalcula os agregados de todos os filmes a partir da coleção `reviews`
+    (backfill de bases existentes ou correção após divergências).
+
+    Uma agregação agrupa as avaliações por filme e faixa do histograma; os
+    filmes são atualizados em lotes de `bulk_write` e os que não têm
+    avaliações voltam a zero. Avaliações inseridas durante a execução podem
+    ser sobrescritas: rode fora dos horários de pico.
+
+    Returns:
+        Quantidade de filmes com avaliações
+    """
+    rows = await db.reviews.aggregate(
+        [
+            {"$match": {"rating": {"$ne": None}}},
+            {
+                "$group": {
+                    "_id": {
+                        "movie_id": "$movie_id",
+                        "bucket": {"$floor": "$rating"},
+                    },
+                    "count": {"$sum": 1},
+                    "sum": {"$sum": "$rating"},
+                }
+            },
+        ]
+    ).to_list(length=None)
+
+    aggregates: Dict[Any, Dict[str, Any]] = {}
+    for row in rows:
+        movie_id = to_object_id(row["_id"]["movie_id"])
+        if movie_id is None:
+            continue
+        entry = aggregates.setdefault(
+            movie_id, {"review_count": 0, "rating_sum": 0.0, "rating_histogram": {}}
+        )
+        bucket = rating_bucket(row["_id"]["bucket"])
+        entry["review_count"] += row["count"]
+        entry["rating_sum"] += row["sum"]
+        entry["rating_histogram"][bucket] = (
+            entry["rating_histogram"].get(bucket, 0) + row["count"]
+        )
+
+    # Marca desta execução: filmes sem ela ao final não têm avaliações
+    run_id = ObjectId()
+    operations = [
+        UpdateOne(
+            {"_id": movie_id},
+            {
+                "$set": {
+                    **entry,
+                    "rating_avg": entry["rating_sum"] / entry["review_count"],
+                    "aggregates_run": run_id,
+                }
+            },
+        )
+        for movie_id, entry in aggregates.items()
+    ]
+    for start in range(0, len(operations), batch_size):
+        await db.movies.bulk_write(
+            operations[start : start + batch_size], ordered=False
+        )
+
+    # Filmes sem nenhuma avaliação
+    await db.movies.update_many(
+        {"aggregates_run": {"$ne": run_id}},
+        {
+            "$set": {
+                **empty_aggregates(),
+                "aggregates_run": run_id,
+            }
+        },
+    )
+    print(f"Rating aggregates repaired for {len(aggregates)} movies")
+    return len(aggregates)
@@ -0,0 +1,153 @@
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from app.config import RECOMMENDATION_RATING_STATS_TTL
+from app.utils.cache import ReloadingIndex
+from app.utils.recommendation import calculate_weighted_ratings, top_k_indices
+from app.utils.registry import get_db_scoped
+
+
+class RatingStats(ReloadingIndex):
+    """
+    Contagem e soma das notas de cada filme, em arrays alinhados a
+    `movie_ids`, mais os totais usados na média global.
+
+    Carregada com uma única agregação sobre `reviews` e atualizada de forma
+    incremental a cada nova avaliação, sem materializar os documentos.
+    Depois de `ttl_seconds`, a agregação é refeita em segundo plano enquanto
+    os valores atuais continuam sendo servidos, corrigindo alterações feitas
+    fora da API (scripts, remoções, migrações).
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = RECOMMENDATION_RATING_STATS_TTL,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        super().__init__(ttl_seconds, clock)
+        self.movie_ids: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self._counts = np.zeros(0, dtype=np.float64)
+        self._sums = np.zeros(0, dtype=np.float64)
+        self.total_count = 0.0
+        self.total_sum = 0.0
+
+    def __len__(self) -> int:
+        return len(self.movie_ids)
+
+    @property
+    def counts(self) -> np.ndarray:
+        return self._counts[: len(self.movie_ids)]
+
+    @property
+    def sums(self) -> np.ndarray:
+        return self._sums[: len(self.movie_ids)]
+
+    @property
+    def global_mean(self) -> float:
+        return self.total_sum / self.total_count if self.total_count else 0.0
+
+    @staticmethod
+    def aggregation_pipeline() -> List[Dict[str, Any]]:
+        """Pipeline que agrupa as avaliações por filme (contagem e soma)."""
+        return [
+            {"$match": {"rating": {"$ne": None}}},
+            {
+                "$group": {
+                    "_id": "$movie_id",
+                    "count": {"$sum": 1},
+                    "sum": {"$sum": "$rating"},
+                }
+            }
+        ]
+
+    async def fetch(self, db) -> List[Dict[str, Any]]:
+        return await db.reviews.aggregate(self.aggregation_pipeline()).to_list(
+            length=None
+        )
+
+    def load(self, rows: Iterable[Dict[str, Any]]) -> None:
+        """
+        Substitui as estatísticas pelo resultado da agregação.
+
+        IDs gravados como string e como ObjectId são somados juntos.
+        """
+        self.movie_ids = []
+        self._positions = {}
+        self._counts = np.zeros(0, dtype=np.float64)
+        self._sums = np.zeros(0, dtype=np.float64)
+        self.total_count = 0.0
+        self.total_sum = 0.0
+
+        for row in rows:
+            self._add(str(row["_id"]), float(row["count"]), float(row["sum"] or 0))
+        self._mark_loaded()
+
+    def add_review(self, movie_id: Any, rating: float) -> None:
+        """Atualiza as estatísticas com uma nova avaliação em O(1) amortizado."""
+        self._add(str(movie_id), 1.0, float(rating))
+
+    def remove_review(self, movie_id: Any, rating: float) -> None:
+        """Retira das estatísticas uma avaliação removida do banco."""
+        self._add(str(movie_id), -1.0, -float(rating))
+
+    def _add(self, movie_id: str, count: float, rating_sum: float) -> None:
+        position = self._positions.get(movie_id)
+        if position is None:
+            position = len(self.movie_ids)
+            if position == len(self._counts):
+                # Crescimento geométrico para inserções amortizadas
+                capacity = max(16, 2 * len(self._counts))
+                self._counts = np.resize(self._counts, capacity)
+                self._sums = np.resize(self._sums, capacity)
+            self._counts[position] = 0.0
+            self._sums[position] = 0.0
+            self._positions[movie_id] = position
+            self.movie_ids.append(movie_id)
+
+        self._counts[position] += count
+        self._sums[position] += rating_sum
+        self.total_count += count
+        self.total_sum += rating_sum
+
+    def weighted_ratings(self, min_reviews: int = 5) -> np.ndarray:
+        """Classificação ponderada (IMDB) de todos os filmes avaliados."""
+        return calculate_weighted_ratings(
+            self.counts, self.sums, min_reviews, self.global_mean
+        )
+
+    def weighted_ratings_for(
+        self, movie_ids: Iterable[str], min_reviews: int = 5
+    ) -> np.ndarray:
+        """Classificação ponderada dos filmes informados (0.0 se sem avaliações)."""
+        weighted = self.weighted_ratings(min_reviews)
+        return np.asarray(
+            [
+                weighted[self._positions[movie_id]]
+                if movie_id in self._positions
+                else 0.0
+                for movie_id in map(str, movie_ids)
+            ],
+            dtype=np.float64,
+        )
+
+    def top_rated(
+        self, k: int, min_reviews: int = 5, exclude: Optional[Iterable[str]] = None
+    ) -> List[str]:
+        """IDs dos `k` filmes com maior classificação ponderada."""
+        scores = self.weighted_ratings(min_reviews)
+        if exclude:
+            excluded = [
+                self._positions[str(movie_id)]
+                for movie_id in exclude
+                if str(movie_id) in self._positions
+            ]
+            scores[excluded] = -np.inf
+        return [self.movie_ids[i] for i in top_k_indices(scores, k)]
+
+
+def get_rating_stats(db) -> RatingStats:
+    """Retorna as estatísticas de avaliações associadas ao banco `db`."""
+    return get_db_scoped(db, "rating_stats", RatingStats)
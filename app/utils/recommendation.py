@@ -1,10 +1,34 @@
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from typing import List, Dict, Any
-from bson import ObjectId
+import scipy.sparse as sp
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
 from datetime import datetime, timedelta
 
+from app.config import (
+    RECOMMENDATION_ANN_BITS,
+    RECOMMENDATION_ANN_CANDIDATES,
+    RECOMMENDATION_ANN_MIN_ITEMS,
+    RECOMMENDATION_ANN_PROBES,
+    RECOMMENDATION_ANN_TABLES,
+    RECOMMENDATION_ARTIFACTS_DIR,
+    RECOMMENDATION_FEATURIZER,
+    RECOMMENDATION_HASHING_FEATURES,
+    RECOMMENDATION_HASHING_IDF,
+    RECOMMENDATION_SCORING_MODE,
+    RECOMMENDATION_STREAM_BATCH_SIZE,
+)
+from app.utils.executor import get_scoring_executor
+from app.utils.feature_index import MovieFeatureIndex
+from app.utils.genre_index import add_movie_genre_counts
+from app.utils.id_migration import review_id_filter
+from app.utils.registry import get_db_scoped, peek_db_scoped
+from app.utils.user_profile import (
+    PROFILE_MIN_RATING,
+    UserProfile,
+    load_user_profile,
+    save_user_profile,
+)
+from app.utils.validation import to_object_id
+
 
 class MovieRecommender:
     """
@@ -14,32 +38,89 @@ class MovieRecommender:
 
     @staticmethod
     async def get_user_preferences(
-        db, user_id: str, min_rating: float = 4.0
+        db,
+        user_id: str,
+        min_rating: float = 4.0,
+        reviews: Optional[List[Dict[str, Any]]] = None,
+        projection: Optional[Dict[str, int]] = None,
     ) -> List[Dict[str, Any]]:
         """
         Obtém os filmes que o usuário avaliou com nota mínima especificada.
-        """
-        # Encontrar todas as avaliações do usuário com nota >= min_rating
-        user_ratings = await db.reviews.find(
-            {"user_id": user_id, "rating": {"$gte": min_rating}}
-        ).to_list(length=100)
 
-        if not user_ratings:
+        Todos os filmes são carregados em uma única consulta `$in`.
+
+        Args:
+            db: Banco de dados
+            user_id: ID do usuário
+            min_rating: Nota mínima para considerar que o usuário gostou
+            reviews: Avaliações do usuário já carregadas pelo chamador;
+                quando informado, a coleção `reviews` não é consultada
+            projection: Campos dos filmes a carregar (padrão: os usados
+                nas características do TF-IDF)
+        """
+        if reviews is None:
+            # Encontrar todas as avaliações do usuário com nota >= min_rating
+            # em uma única consulta (inclui user_id gravado como string
+            # enquanto a migração de IDs não terminar)
+            reviews = await db.reviews.find(
+                {
+                    "user_id": await review_id_filter(db, [user_id]),
+                    "rating": {"$gte": min_rating},
+                },
+                {"movie_id": 1, "rating": 1},
+            ).to_list(length=100)
+
+        # Obter os IDs dos filmes que o usuário gostou, sem repetição
+        movie_ids = []
+        seen = set()
+        for review in reviews:
+            if review.get("rating", 0) < min_rating:
+                continue
+            movie_id = to_object_id(review.get("movie_id"))
+            if movie_id is not None and movie_id not in seen:
+                seen.add(movie_id)
+                movie_ids.append(movie_id)
+
+        if not movie_ids:
             return []
 
-        # Obter os IDs dos filmes que o usuário gostou
-        movie_ids = [ObjectId(rating["movie_id"]) for rating in user_ratings]
+        # Buscar os detalhes desses filmes em uma única consulta
+        movies = await db.movies.find(
+            {"_id": {"$in": movie_ids}},
+            projection or MovieFeatureIndex.PROJECTION,
+        ).to_list(length=len(movie_ids))
+        by_id = {movie["_id"]: movie for movie in movies}
 
-        # Buscar os detalhes desses filmes
         liked_movies = []
         for movie_id in movie_ids:
-            movie = await db.movies.find_one({"_id": movie_id})
+            movie = by_id.get(movie_id)
             if movie:
                 movie["id"] = str(movie["_id"])
                 liked_movies.append(movie)
 
         return liked_movies
 
+    @staticmethod
+    async def get_user_profile(
+        db, user_id: str, index: MovieFeatureIndex
+    ) -> UserProfile:
+        """
+        Retorna o perfil de gosto persistido do usuário, recalculando-o a
+        partir dos filmes que ele gostou se estiver ausente ou tiver sido
+        calculado com outra versão do índice.
+        """
+        profile = await load_user_profile(db, user_id, index)
+        if profile is None:
+            liked_movies = await MovieRecommender.get_user_preferences(
+                db, user_id, min_rating=PROFILE_MIN_RATING
+            )
+            # Filmes curtidos que ainda não estão no índice (inseridos por
+            # fora da API) são vetorizados com o vocabulário atual
+            index.add_movies(liked_movies)
+            profile = UserProfile.from_movies(user_id, liked_movies, index)
+            await save_user_profile(db, profile)
+        return profile
+
     @staticmethod
     def get_movie_features(movie: Dict[str, Any]) -> str:
         """
@@ -58,11 +139,14 @@ class MovieRecommender:
         """
         Gera recomendações de filmes para um usuário com base nas preferências.
         """
-        # 1. Obter filmes que o usuário gostou (avaliação >= 4)
-        liked_movies = await MovieRecommender.get_user_preferences(db, user_id)
+        # 1. Garantir que o índice TF-IDF do catálogo está em memória
+        index = await get_feature_index(db).ensure_built(db)
+
+        # 2. Perfil de gosto do usuário (filmes com avaliação >= 4)
+        profile = await MovieRecommender.get_user_profile(db, user_id, index)
 
-        if not liked_movies:
-            # 2. Se o usuário não avaliou nenhum filme, retornar filmes populares
+        if not profile.movie_ids:
+            # 3. Se o usuário não avaliou nenhum filme, retornar filmes populares
             all_movies = (
                 await db.movies.find()
                 .limit(max_recommendations)
@@ -74,50 +158,274 @@ class MovieRecommender:
                 recommendations.append(movie)
             return recommendations
 
-        # 3. Obter todos os filmes do banco
-        liked_movie_ids = {movie["id"] for movie in liked_movies}
-        candidate_movies = await db.movies.find(
-            {"_id": {"$nin": [ObjectId(mid) for mid in liked_movie_ids]}},
-            {"_id": 1, "title": 1, "genres": 1, "director": 1, "actors": 1},
-        ).to_list(length=1000)
+        if RECOMMENDATION_SCORING_MODE == "stream":
+            top_ids = await MovieRecommender.stream_recommendations(
+                db, index, profile, max_recommendations
+            )
+            return await MovieRecommender._fetch_in_order(db, top_ids)
 
         # 4. Se não houver candidatos, retornar lista vazia
-        if not candidate_movies:
+        liked_positions = index.positions_of(profile.movie_ids)
+        if len(index) <= len(liked_positions):
             return []
 
-        # 5. Preparar filmes para TF-IDF
-        liked_features = [
-            MovieRecommender.get_movie_features(movie) for movie in liked_movies
-        ]
-        candidate_features = [
-            MovieRecommender.get_movie_features(movie) for movie in candidate_movies
-        ]
+        # 5. Gerar candidatos: lista curta do índice ANN em catálogos
+        # grandes, ou o catálogo inteiro
+        item_matrix = index.matrix
+        centroid = profile.centroid
+        shortlist = index.shortlist(
+            centroid.toarray(),
+            min_size=max_recommendations + len(liked_positions),
+            max_candidates=RECOMMENDATION_ANN_CANDIDATES,
+        )
+        if shortlist is None:
+            candidate_positions = np.arange(len(index))
+            candidate_matrix = item_matrix
+        else:
+            candidate_positions = shortlist
+            candidate_matrix = item_matrix[shortlist]
+
+        # 6. Pontuação = produto escalar com o centróide do perfil. As linhas
+        # do índice são normalizadas em L2, então equivale à média do
+        # cosseno com cada filme curtido, em O(candidatos) e não
+        # O(candidatos x curtidos). Os próprios filmes curtidos são excluídos.
+        # O cálculo roda no executor, fora do event loop.
+        top_indices = await get_scoring_executor().run(
+            "content_scoring",
+            rank_against_centroid,
+            candidate_matrix,
+            centroid,
+            np.isin(candidate_positions, liked_positions),
+            max_recommendations,
+        )
+        top_ids = [index.movie_ids[candidate_positions[i]] for i in top_indices]
+
+        # 8. Buscar os filmes recomendados em uma única consulta
+        return await MovieRecommender._fetch_in_order(db, top_ids)
+
+    @staticmethod
+    async def stream_recommendations(
+        db,
+        index: MovieFeatureIndex,
+        profile: UserProfile,
+        k: int,
+        batch_size: int = RECOMMENDATION_STREAM_BATCH_SIZE,
+    ) -> List[str]:
+        """
+        Pontua o catálogo inteiro percorrendo o cursor de `movies` em lotes
+        de `batch_size`: cada lote é vetorizado com o vocabulário do índice,
+        pontuado contra o centróide do perfil e mesclado a um top-k
+        acumulado. A memória fica em O(lote + k), sem materializar a matriz
+        do catálogo, e todo filme é considerado, inclusive os inseridos por
+        fora da API.
+
+        Returns:
+            IDs dos `k` filmes mais similares ao perfil, em ordem
+        """
+        top = TopK(k)
+        excluded = set(profile.movie_ids)
+        executor = get_scoring_executor()
+
+        async def flush(batch: List[Dict[str, Any]]) -> None:
+            movie_ids = [str(movie["_id"]) for movie in batch]
+            scores = await executor.run(
+                "stream_scoring",
+                score_movie_batch,
+                index.vectorizer,
+                index.featurize,
+                batch,
+                profile.centroid,
+            )
+            scores[[movie_id in excluded for movie_id in movie_ids]] = -np.inf
+            top.push(scores, movie_ids)
+
+        batch = []
+        async for movie in db.movies.find(
+            {}, MovieFeatureIndex.PROJECTION, batch_size=batch_size
+        ):
+            batch.append(movie)
+            if len(batch) >= batch_size:
+                await flush(batch)
+                batch = []
+        if batch:
+            await flush(batch)
+
+        return [movie_id for movie_id, _ in top.items()]
+
+    @staticmethod
+    async def _fetch_in_order(db, movie_ids: List[str]) -> List[Dict[str, Any]]:
+        """Busca os filmes em uma única consulta, na ordem de `movie_ids`."""
+        object_ids = [oid for oid in map(to_object_id, movie_ids) if oid is not None]
+        if not object_ids:
+            return []
+        movies = await db.movies.find(
+            {"_id": {"$in": object_ids}}, MovieFeatureIndex.PROJECTION
+        ).to_list(length=len(object_ids))
+        by_id = {str(movie["_id"]): movie for movie in movies}
+
+        return [by_id[mid] for mid in movie_ids if mid in by_id]
+
+
+def create_feature_index(
+    artifacts_dir: Optional[str] = RECOMMENDATION_ARTIFACTS_DIR,
+) -> MovieFeatureIndex:
+    """Cria um índice TF-IDF (ainda não construído) com a configuração atual."""
+    return MovieFeatureIndex(
+        MovieRecommender.get_movie_features,
+        ann_min_items=RECOMMENDATION_ANN_MIN_ITEMS,
+        ann_params={
+            "n_tables": RECOMMENDATION_ANN_TABLES,
+            "n_bits": RECOMMENDATION_ANN_BITS,
+            "n_probes": RECOMMENDATION_ANN_PROBES,
+        },
+        featurizer=RECOMMENDATION_FEATURIZER,
+        hashing_features=RECOMMENDATION_HASHING_FEATURES,
+        hashing_idf=RECOMMENDATION_HASHING_IDF,
+        artifacts_dir=artifacts_dir,
+    )
+
+
+def get_feature_index(db) -> MovieFeatureIndex:
+    """Retorna o índice TF-IDF do catálogo associado ao banco `db`."""
+    return get_db_scoped(db, "feature_index", create_feature_index)
+
+
+def refresh_movie_indexes(db, movie: Dict[str, Any]) -> None:
+    """
+    Atualiza as estruturas em memória após a inserção de um filme.
+
+    Apenas índices já construídos são atualizados; os demais incluirão
+    o filme quando forem construídos pela primeira vez.
+    """
+    for name in ("feature_index", "genre_index"):
+        index = peek_db_scoped(db, name)
+        if index is not None:
+            index.add_movie(movie)
+    add_movie_genre_counts(db, movie)
+
+    time_index = peek_db_scoped(db, "time_index:movies")
+    if time_index is not None:
+        time_index.add_item(movie)
+
+
+def refresh_review_indexes(db, review: Dict[str, Any]) -> None:
+    """
+    Atualiza as estruturas em memória após a inserção de uma avaliação.
+
+    Assim como em `refresh_movie_indexes`, apenas estruturas já carregadas
+    são atualizadas.
+    """
+    stats = peek_db_scoped(db, "rating_stats")
+    if stats is not None and stats.is_loaded and review.get("rating") is not None:
+        stats.add_review(review["movie_id"], review["rating"])
+
+    time_index = peek_db_scoped(db, "time_index:reviews")
+    if time_index is not None:
+        time_index.add_item(review)
+
+
+def rank_against_centroid(
+    candidate_matrix: sp.csr_matrix,
+    centroid: sp.csr_matrix,
+    excluded: np.ndarray,
+    k: int,
+) -> np.ndarray:
+    """
+    Índices dos `k` candidatos com maior produto escalar com o centróide,
+    ignorando as posições marcadas em `excluded`.
+    """
+    scores = (candidate_matrix @ centroid.T).toarray().ravel()
+    scores[excluded] = -np.inf
+    return top_k_indices(scores, k)
+
+
+def score_like_matrix(
+    likes: sp.csr_matrix,
+    item_matrix: sp.csr_matrix,
+    rated_rows: List[int],
+    rated_cols: List[int],
+    k: int,
+) -> List[np.ndarray]:
+    """
+    Pontua um bloco de usuários pelo conteúdo com duas multiplicações:
+    `likes` (usuários x filmes curtidos, com peso 1/n) @ catálogo dá os
+    centróides, e centróides @ catálogoᵀ dá as pontuações. As posições
+    avaliadas (`rated_rows`, `rated_cols`) são excluídas.
 
-        # 6. Todos os recursos juntos para o ajuste do TF-IDF
-        all_features = liked_features + candidate_features
+    Returns:
+        Posições do top-k de cada usuário (vazio para usuários sem curtidas)
+    """
+    scores = ((likes @ item_matrix) @ item_matrix.T).toarray()
+    scores[rated_rows, rated_cols] = -np.inf
+
+    has_likes = np.diff(likes.indptr) > 0
+    return [
+        top_k_indices(scores[row], k) if has_likes[row] else np.empty(0, np.int64)
+        for row in range(likes.shape[0])
+    ]
+
+
+def score_movie_batch(
+    vectorizer,
+    featurize: Callable[[Dict[str, Any]], str],
+    movies: List[Dict[str, Any]],
+    centroid: sp.csr_matrix,
+) -> np.ndarray:
+    """Vetoriza um lote de filmes e calcula o produto escalar com o centróide."""
+    if vectorizer is None or not movies:
+        return np.zeros(len(movies))
+    rows = vectorizer.transform([featurize(movie) for movie in movies])
+    return (rows @ centroid.T).toarray().ravel()
+
+
+class TopK:
+    """
+    Top-k acumulado ao longo de lotes de pontuações: a cada `push` o lote é
+    mesclado aos `k` melhores atuais com `argpartition`, então a memória
+    fica em O(lote + k) independentemente do total de itens vistos.
+    Pontuações -inf são ignoradas; entre empates, a ordem final segue a
+    ordem de chegada.
+    """
 
-        # 7. Calcular TF-IDF
-        vectorizer = TfidfVectorizer(stop_words="english")
-        tfidf_matrix = vectorizer.fit_transform(all_features)
+    def __init__(self, k: int):
+        self.k = k
+        self._scores = np.empty(0, dtype=np.float64)
+        self._ids: List[Any] = []
 
-        # 8. Calcular a similaridade média dos filmes candidatos com os filmes curtidos
-        num_liked = len(liked_features)
-        liked_matrix = tfidf_matrix[:num_liked]
-        candidate_matrix = tfidf_matrix[num_liked:]
+    def __len__(self) -> int:
+        return len(self._ids)
 
-        # 9. Calcular similaridade de cosseno
-        sim_scores = cosine_similarity(candidate_matrix, liked_matrix)
+    def push(self, scores: np.ndarray, ids: Iterable[Any]) -> None:
+        merged_scores = np.concatenate([self._scores, np.asarray(scores, np.float64)])
+        merged_ids = self._ids + list(ids)
+        keep = top_k_indices(merged_scores, self.k)
+        self._scores = merged_scores[keep]
+        self._ids = [merged_ids[i] for i in keep]
 
-        # 10. Calcular pontuação média para cada candidato
-        mean_sim_scores = np.mean(sim_scores, axis=1)
+    def items(self) -> List[Tuple[Any, float]]:
+        """Pares (id, pontuação) em ordem decrescente de pontuação."""
+        return list(zip(self._ids, self._scores.tolist()))
 
-        # 11. Obter os índices dos filmes mais similares
-        top_indices = mean_sim_scores.argsort()[-max_recommendations:][::-1]
 
-        # 12. Retornar os filmes recomendados
-        recommended_movies = [candidate_movies[i] for i in top_indices]
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Retorna os índices das `k` maiores pontuações em ordem decrescente,
+    ignorando posições com pontuação -inf.
 
-        return recommended_movies
+    Usa `argpartition` para evitar ordenar o vetor inteiro.
+    """
+    valid = np.flatnonzero(scores > -np.inf)
+    if k <= 0 or valid.size == 0:
+        return np.empty(0, dtype=np.int64)
+
+    valid_scores = scores[valid]
+    if valid.size > k:
+        part = np.argpartition(-valid_scores, k - 1)[:k]
+    else:
+        part = np.arange(valid.size)
+
+    order = np.argsort(-valid_scores[part], kind="stable")
+    return valid[part[order]]
 
 
 def calculate_similarity(movie1: Dict[str, Any], movie2: Dict[str, Any]) -> float:
@@ -163,6 +471,207 @@ def calculate_similarity(movie1: Dict[str, Any], movie2: Dict[str, Any]) -> floa
     return score
 
 
+def _overlap_expression(field: str, values: List[Any]) -> Dict[str, Any]:
+    """Expressão de |A ∩ B| / |A ∪ B| entre o campo `field` e `values`."""
+    field_values = {"$ifNull": [f"${field}", []]}
+    union = {"$size": {"$setUnion": [field_values, values]}}
+    return {
+        "$cond": [
+            {"$gt": [union, 0]},
+            {
+                "$divide": [
+                    {"$size": {"$setIntersection": [field_values, values]}},
+                    union,
+                ]
+            },
+            0,
+        ]
+    }
+
+
+def similarity_pipeline(movie: Dict[str, Any], limit: int) -> List[Dict[str, Any]]:
+    """
+    Pipeline de agregação que calcula no MongoDB a mesma pontuação de
+    `calculate_similarity` entre `movie` e todos os filmes com algum gênero,
+    ator ou diretor em comum, retornando apenas os `limit` mais similares
+    (empates pela ordem de `_id`).
+    """
+    genres = list(dict.fromkeys(movie.get("genres") or []))
+    actors = list(dict.fromkeys(movie.get("actors") or []))
+    director = movie.get("director")
+
+    overlap = []
+    if genres:
+        overlap.append({"genres": {"$in": genres}})
+    if actors:
+        overlap.append({"actors": {"$in": actors}})
+    if director:
+        overlap.append({"director": director})
+    if not overlap:
+        return []
+
+    director_score = (
+        {"$cond": [{"$eq": ["$director", director]}, 0.3, 0.0]} if director else 0.0
+    )
+    return [
+        {"$match": {"_id": {"$ne": movie["_id"]}, "$or": overlap}},
+        {
+            "$addFields": {
+                "similarity": {
+                    "$add": [
+                        {"$multiply": [0.5, _overlap_expression("genres", genres)]},
+                        director_score,
+                        {"$multiply": [0.2, _overlap_expression("actors", actors)]},
+                    ]
+                }
+            }
+        },
+        {"$sort": {"similarity": -1, "_id": 1}},
+        {"$limit": limit},
+        {"$project": {"similarity": 0}},
+    ]
+
+
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _popcount(masks: np.ndarray) -> np.ndarray:
+    """Conta os bits ligados de cada linha de uma matriz de máscaras uint64."""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(masks).sum(axis=-1, dtype=np.int64)
+    as_bytes = np.ascontiguousarray(masks).view(np.uint8)
+    return _POPCOUNT_TABLE[as_bytes].sum(axis=-1, dtype=np.int64)
+
+
+def encode_similarity_features(movies: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Codifica os atributos usados por `calculate_similarity` em arrays.
+
+    - gêneros: máscaras de bits (uint64, 64 gêneros por palavra)
+    - diretor: código inteiro (-1 quando ausente ou vazio)
+    - atores: matriz CSR binária (sem duplicatas)
+
+    Args:
+        movies: Lista de dicionários de filmes
+
+    Returns:
+        Dicionário com `genre_masks`, `genre_counts`, `directors`,
+        `actors` e `actor_counts`
+    """
+    genre_codes: Dict[str, int] = {}
+    director_codes: Dict[str, int] = {}
+    actor_codes: Dict[str, int] = {}
+
+    movie_genres = []
+    directors = np.full(len(movies), -1, dtype=np.int64)
+    actor_indptr = [0]
+    actor_indices: List[int] = []
+
+    for i, movie in enumerate(movies):
+        movie_genres.append(
+            {
+                genre_codes.setdefault(genre, len(genre_codes))
+                for genre in movie.get("genres") or []
+            }
+        )
+        if movie.get("director"):
+            directors[i] = director_codes.setdefault(
+                movie["director"], len(director_codes)
+            )
+        actor_indices.extend(
+            sorted(
+                {
+                    actor_codes.setdefault(actor, len(actor_codes))
+                    for actor in movie.get("actors") or []
+                }
+            )
+        )
+        actor_indptr.append(len(actor_indices))
+
+    n_words = max(1, -(-len(genre_codes) // 64))
+    genre_masks = np.zeros((len(movies), n_words), dtype=np.uint64)
+    for i, codes in enumerate(movie_genres):
+        for code in codes:
+            genre_masks[i, code // 64] |= np.uint64(1) << np.uint64(code % 64)
+
+    actors = sp.csr_matrix(
+        (
+            np.ones(len(actor_indices)),
+            np.asarray(actor_indices, dtype=np.int64),
+            np.asarray(actor_indptr, dtype=np.int64),
+        ),
+        shape=(len(movies), max(1, len(actor_codes))),
+    )
+
+    return {
+        "genre_masks": genre_masks,
+        "genre_counts": _popcount(genre_masks),
+        "directors": directors,
+        "actors": actors,
+        "actor_counts": np.diff(actors.indptr),
+    }
+
+
+def similarity_to_rows(encoded: Dict[str, Any], rows: np.ndarray) -> np.ndarray:
+    """
+    Calcula `calculate_similarity` entre os filmes nas posições `rows` e
+    todos os filmes codificados, de forma vetorizada.
+
+    Usa as mesmas operações e pesos da função escalar (0.5 gêneros,
+    0.3 diretor, 0.2 atores), portanto os resultados são idênticos.
+
+    Returns:
+        Matriz (len(rows), N) de similaridades
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+
+    # Gêneros: Jaccard por popcount das máscaras de bits
+    masks = encoded["genre_masks"]
+    genre_counts = encoded["genre_counts"]
+    common = _popcount(masks[rows][:, None, :] & masks[None, :, :])
+    union = genre_counts[rows][:, None] + genre_counts[None, :] - common
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scores = np.where(union > 0, 0.5 * (common / union), 0.0)
+
+    # Mesmo diretor
+    directors = encoded["directors"]
+    same_director = (directors[rows][:, None] == directors[None, :]) & (
+        directors[rows][:, None] >= 0
+    )
+    scores += np.where(same_director, 0.3, 0.0)
+
+    # Atores: Jaccard pelo produto das linhas CSR
+    actors = encoded["actors"]
+    actor_counts = encoded["actor_counts"]
+    common = (actors[rows] @ actors.T).toarray()
+    union = actor_counts[rows][:, None] + actor_counts[None, :] - common
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scores += np.where(union > 0, 0.2 * (common / union), 0.0)
+
+    return scores
+
+
+def batch_calculate_similarity(
+    movie: Dict[str, Any], candidates: List[Dict[str, Any]]
+) -> np.ndarray:
+    """
+    Versão vetorizada de `calculate_similarity` para um filme de referência
+    e N candidatos.
+
+    Args:
+        movie: Dicionário com dados do filme de referência
+        candidates: Lista de dicionários dos filmes candidatos
+
+    Returns:
+        Array com N pontuações, idênticas às da função escalar
+    """
+    if not candidates:
+        return np.zeros(0)
+
+    encoded = encode_similarity_features([movie] + list(candidates))
+    return similarity_to_rows(encoded, np.array([0]))[0, 1:]
+
+
 def filter_by_genres(
     movies: List[Dict[str, Any]], genres: List[str], min_match: int = 1
 ) -> List[Dict[str, Any]]:
@@ -197,6 +706,9 @@ def get_recent_items(
     """
     Filtra itens baseados na data de criação.
 
+    Percorre a lista inteira; para consultas recorrentes sobre as coleções
+    use `app.utils.time_index.TimeIndex`, que responde em O(log n + k).
+
     Args:
         items: Lista de dicionários com campo 'created_at'
         days: Número de dias para considerar um item recente
@@ -217,7 +729,9 @@ def get_recent_items(
     return recent_items
 
 
-def calculate_weighted_rating(movie: Dict[str, Any], min_reviews: int = 5) -> float:
+def calculate_weighted_rating(
+    movie: Dict[str, Any], min_reviews: int = 5, global_avg_rating: float = 3.0
+) -> float:
     """
     Calcula uma classificação ponderada para um filme usando o método do IMDB.
 
@@ -228,9 +742,13 @@ def calculate_weighted_rating(movie: Dict[str, Any], min_reviews: int = 5) -> fl
     - R: média de avaliações do filme
     - C: média de avaliações de todos os filmes
 
+    Para o catálogo inteiro, prefira `calculate_weighted_ratings`, que usa
+    contagens e somas agregadas e a média global real.
+
     Args:
         movie: Dicionário com dados do filme
         min_reviews: Número mínimo de avaliações para peso total
+        global_avg_rating: Média de avaliações de todos os filmes
 
     Returns:
         Classificação ponderada
@@ -245,9 +763,6 @@ def calculate_weighted_rating(movie: Dict[str, Any], min_reviews: int = 5) -> fl
         / num_reviews
     )
 
-    # Para simplificar, consideramos a média global como 3.0
-    global_avg_rating = 3.0
-
     # Aplicar a fórmula
     weighted_rating = (
         num_reviews / (num_reviews + min_reviews) * avg_rating
@@ -255,3 +770,41 @@ def calculate_weighted_rating(movie: Dict[str, Any], min_reviews: int = 5) -> fl
     )
 
     return weighted_rating
+
+
+def calculate_weighted_ratings(
+    counts: np.ndarray,
+    sums: np.ndarray,
+    min_reviews: int = 5,
+    global_avg_rating: Optional[float] = None,
+) -> np.ndarray:
+    """
+    Versão vetorizada de `calculate_weighted_rating` para o catálogo inteiro.
+
+    Args:
+        counts: Número de avaliações de cada filme
+        sums: Soma das notas de cada filme
+        min_reviews: Número mínimo de avaliações para peso total
+        global_avg_rating: Média global; quando ausente, é calculada a
+            partir das próprias contagens e somas (média real de todas as
+            avaliações)
+
+    Returns:
+        Array com a classificação ponderada de cada filme (0.0 para filmes
+        sem avaliações)
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    sums = np.asarray(sums, dtype=np.float64)
+
+    if global_avg_rating is None:
+        total = counts.sum()
+        global_avg_rating = sums.sum() / total if total > 0 else 0.0
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        avg_ratings = np.where(counts > 0, sums / counts, 0.0)
+        weighted = (
+            counts / (counts + min_reviews) * avg_ratings
+            + min_reviews / (counts + min_reviews) * global_avg_rating
+        )
+
+    return np.where(counts > 0, weighted, 0.0)
@@ -0,0 +1,44 @@
+import weakref
+from typing import Any, Callable, Dict, Tuple
+
+# Estado em memória associado a cada instância de banco de dados.
+# As instâncias do Motor não são "hashable", então indexamos pelo id()
+# do objeto e guardamos uma referência fraca para detectar reutilização
+# do id depois que o banco original foi coletado.
+_db_state: Dict[Tuple[int, str], Tuple[weakref.ref, Any]] = {}
+
+
+def get_db_scoped(db, name: str, factory: Callable[[], Any]) -> Any:
+    """
+    Retorna o objeto de estado `name` associado ao banco `db`,
+    criando-o com `factory` na primeira chamada.
+
+    Cada processo mantém uma única instância por banco, compartilhada
+    entre todas as requisições.
+    """
+    key = (id(db), name)
+    entry = _db_state.get(key)
+    if entry is not None and entry[0]() is db:
+        return entry[1]
+
+    value = factory()
+    _db_state[key] = (weakref.ref(db), value)
+    return value
+
+
+def peek_db_scoped(db, name: str) -> Any:
+    """Retorna o estado `name` do banco `db` sem criá-lo (ou None)."""
+    entry = _db_state.get((id(db), name))
+    if entry is not None and entry[0]() is db:
+        return entry[1]
+    return None
+
+
+def clear_db_scoped(db=None) -> None:
+    """Remove o estado de um banco específico ou de todos os bancos."""
+    if db is None:
+        _db_state.clear()
+        return
+
+    for key in [key for key in _db_state if key[0] == id(db)]:
+        del _db_state[key]
@@ -0,0 +1,147 @@
+from typing import Any, Dict, Iterable, List, Optional
+
+from bson import ObjectId
+
+from app.utils.id_migration import review_id_filter
+
+# Tipos de leitura memorizados pelo contexto
+READ_KINDS = ("users", "reviews", "movies")
+
+
+class RequestContextStats:
+    """Contadores acumulados de todos os contextos de requisição encerrados."""
+
+    def __init__(self):
+        self.requests = 0
+        self.db_reads = {kind: 0 for kind in READ_KINDS}
+        self.duplicate_reads = {kind: 0 for kind in READ_KINDS}
+
+    def record(self, context: "RequestContext") -> None:
+        self.requests += 1
+        for kind in READ_KINDS:
+            self.db_reads[kind] += context.db_reads[kind]
+            self.duplicate_reads[kind] += context.duplicate_reads[kind]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "db_reads": dict(self.db_reads),
+            "duplicate_reads_absorbed": dict(self.duplicate_reads),
+        }
+
+
+_stats = RequestContextStats()
+
+
+def get_request_context_stats() -> RequestContextStats:
+    return _stats
+
+
+class RequestContext:
+    """
+    Mapa de identidade de uma requisição: usuários, avaliações por usuário e
+    filmes lidos do banco ficam memorizados até o fim da requisição, de modo
+    que o router e o `RecommendationService` compartilham as mesmas leituras.
+    Ausências (None) também são memorizadas.
+
+    `db_reads` conta as consultas feitas ao banco e `duplicate_reads` as
+    leituras repetidas atendidas pela memória, por tipo.
+
+    Com `memoize=False` (uso fora de uma requisição, como nos jobs de
+    linha de comando), cada leitura vai ao banco e nada fica retido.
+    """
+
+    def __init__(self, db, memoize: bool = True):
+        self.db = db
+        self.memoize = memoize
+        self._users: Dict[str, Optional[Dict[str, Any]]] = {}
+        self._reviews: Dict[str, List[Dict[str, Any]]] = {}
+        self._movies: Dict[ObjectId, Optional[Dict[str, Any]]] = {}
+        self.db_reads = {kind: 0 for kind in READ_KINDS}
+        self.duplicate_reads = {kind: 0 for kind in READ_KINDS}
+        self._closed = False
+
+    def remember_user(self, user: Dict[str, Any]) -> None:
+        """Registra um usuário já carregado (ex.: o usuário autenticado)."""
+        if self.memoize:
+            self._users[str(user["_id"])] = user
+
+    async def get_user(self, user_id: str) -> Optional[Dict[str, Any]]:
+        user_id = str(user_id)
+        if user_id in self._users:
+            self.duplicate_reads["users"] += 1
+            return self._users[user_id]
+
+        user = None
+        if ObjectId.is_valid(user_id):
+            self.db_reads["users"] += 1
+            user = await self.db.users.find_one({"_id": ObjectId(user_id)})
+        if self.memoize:
+            self._users[user_id] = user
+        return user
+
+    async def get_user_reviews(
+        self, user_id: str, limit: int = 100
+    ) -> List[Dict[str, Any]]:
+        """Avaliações do usuário (até `limit`), em uma única consulta indexada."""
+        user_id = str(user_id)
+        if user_id in self._reviews:
+            self.duplicate_reads["reviews"] += 1
+            return self._reviews[user_id]
+
+        self.db_reads["reviews"] += 1
+        reviews = await self.db.reviews.find(
+            {"user_id": await review_id_filter(self.db, [user_id])}
+        ).to_list(length=limit)
+        if self.memoize:
+            self._reviews[user_id] = reviews
+        return reviews
+
+    async def get_movies(self, movie_ids: Iterable[ObjectId]) -> List[Dict[str, Any]]:
+        """
+        Documentos dos filmes na ordem de `movie_ids` (inexistentes são
+        omitidos). Apenas os IDs ainda não lidos vão ao banco, em uma
+        única consulta `$in`.
+        """
+        movie_ids = list(movie_ids)
+        if not self.memoize:
+            return await self._find_movies(movie_ids)
+
+        missing = list(
+            dict.fromkeys(m for m in movie_ids if m not in self._movies)
+        )
+        self.duplicate_reads["movies"] += len(movie_ids) - len(missing)
+        if missing:
+            self.db_reads["movies"] += 1
+            documents = await self.db.movies.find({"_id": {"$in": missing}}).to_list(
+                length=len(missing)
+            )
+            self._movies.update(dict.fromkeys(missing))
+            self._movies.update((document["_id"], document) for document in documents)
+        return [
+            self._movies[movie_id]
+            for movie_id in movie_ids
+            if self._movies.get(movie_id) is not None
+        ]
+
+    async def _find_movies(self, movie_ids: List[ObjectId]) -> List[Dict[str, Any]]:
+        """Consulta `$in` direta, sem memorização, na ordem de `movie_ids`."""
+        unique_ids = list(dict.fromkeys(movie_ids))
+        if not unique_ids:
+            return []
+        self.db_reads["movies"] += 1
+        documents = await self.db.movies.find({"_id": {"$in": unique_ids}}).to_list(
+            length=len(unique_ids)
+        )
+        by_id = {document["_id"]: document for document in documents}
+        return [by_id[movie_id] for movie_id in movie_ids if movie_id in by_id]
+
+    async def get_movie(self, movie_id: ObjectId) -> Optional[Dict[str, Any]]:
+        movies = await self.get_movies([movie_id])
+        return movies[0] if movies else None
+
+    def close(self) -> None:
+        """Encerra o contexto, somando seus contadores às métricas do processo."""
+        if not self._closed:
+            self._closed = True
+            _stats.record(self)
@@ -0,0 +1,205 @@
+import time
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from bson import ObjectId
+
+from app.config import (
+    RECOMMENDATION_TIME_INDEX_SYNC_SECONDS,
+    RECOMMENDATION_TIME_INDEX_TTL,
+)
+from app.utils.cache import ReloadingIndex
+from app.utils.registry import get_db_scoped
+from app.utils.validation import to_object_id
+
+EPOCH = datetime(1970, 1, 1)
+
+# Cursor de paginação: (timestamp em segundos, ID do documento)
+TimeCursor = Tuple[float, str]
+
+# Margem (segundos) da faixa de _id relida a cada sincronização, para
+# ObjectIds gerados por outros processos ou hosts com relógio adiantado
+SYNC_OVERLAP_SECONDS = 60
+
+
+def to_timestamp(value: datetime) -> float:
+    """Converte um datetime (ingênuo em UTC ou com fuso) para segundos epoch."""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (value - EPOCH).total_seconds()
+
+
+def document_timestamp(document: Dict[str, Any]) -> Optional[float]:
+    """
+    Momento de criação de um documento: o campo `created_at` ou, na falta
+    dele, o horário embutido no ObjectId. None se nenhum estiver disponível.
+    """
+    created_at = document.get("created_at")
+    if isinstance(created_at, datetime):
+        return to_timestamp(created_at)
+
+    object_id = to_object_id(document.get("_id", document.get("id")))
+    if object_id is None:
+        return None
+    return to_timestamp(object_id.generation_time)
+
+
+def recency_weights(
+    timestamps: Iterable[float],
+    half_life_days: float = 30.0,
+    now: Optional[float] = None,
+) -> np.ndarray:
+    """
+    Pesos de recência com decaimento exponencial: 1.0 para itens criados
+    agora e 0.5 para itens com `half_life_days` dias.
+    """
+    timestamps = np.asarray(list(timestamps), dtype=np.float64)
+    now = to_timestamp(datetime.utcnow()) if now is None else now
+    age_days = np.maximum(now - timestamps, 0.0) / 86400.0
+    return np.power(0.5, age_days / half_life_days)
+
+
+class TimeIndex(ReloadingIndex):
+    """
+    Índice temporal em memória de uma coleção: pares (timestamp, ID)
+    mantidos em ordem, consultados com busca binária.
+
+    "Itens dos últimos N dias" custa O(log n + k) e a paginação do mais
+    recente para o mais antigo usa o par (timestamp, ID) do último item
+    como cursor, estável mesmo com inserções entre as páginas.
+
+    O índice é um cache da coleção: inserções do próprio processo entram
+    por `add_item`; as de outros processos (outros workers, `load_data.py`,
+    escritas diretas) entram na sincronização feita a cada `sync_seconds`
+    por `ensure_loaded`, uma consulta indexada pelos `_id` gerados desde a
+    anterior. A recarga completa após o TTL descarta documentos removidos.
+    """
+
+    def __init__(
+        self,
+        collection: str,
+        ttl_seconds: float = RECOMMENDATION_TIME_INDEX_TTL,
+        sync_seconds: float = RECOMMENDATION_TIME_INDEX_SYNC_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        super().__init__(ttl_seconds, clock)
+        self.collection = collection
+        self.sync_seconds = sync_seconds
+        self._keys: List[TimeCursor] = []
+        self._ids = set()
+        self._synced_at = 0.0
+        self._sync_from = EPOCH
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    async def fetch(self, db) -> List[Dict[str, Any]]:
+        # Documentos inseridos durante a leitura entram na próxima sincronização
+        self._sync_from = datetime.utcnow() - timedelta(seconds=SYNC_OVERLAP_SECONDS)
+        return await db[self.collection].find({}, {"created_at": 1}).to_list(
+            length=None
+        )
+
+    async def ensure_loaded(self, db) -> "TimeIndex":
+        """
+        Carrega os timestamps da coleção na primeira chamada e, depois,
+        incorpora os documentos inseridos por outros processos.
+        """
+        await super().ensure_loaded(db)
+        if self._clock() >= self._synced_at + self.sync_seconds:
+            await self.sync(db)
+        return self
+
+    async def sync(self, db) -> int:
+        """
+        Inclui os documentos com `_id` gerado desde a última sincronização
+        (com margem de SYNC_OVERLAP_SECONDS). Retorna quantos eram novos.
+        """
+        since = self._sync_from
+        self._synced_at = self._clock()
+        self._sync_from = datetime.utcnow() - timedelta(seconds=SYNC_OVERLAP_SECONDS)
+        documents = await db[self.collection].find(
+            {"_id": {"$gte": ObjectId.from_datetime(since)}}, {"created_at": 1}
+        ).to_list(length=None)
+        return sum(self.add_item(document) for document in documents)
+
+    def load(self, documents: Iterable[Dict[str, Any]]) -> None:
+        """Reconstrói o índice a partir dos documentos (apenas _id e created_at)."""
+        keys = []
+        for document in documents:
+            timestamp = document_timestamp(document)
+            if timestamp is not None:
+                keys.append((timestamp, str(document.get("_id", document.get("id")))))
+        self._keys = sorted(set(keys))
+        self._ids = {item_id for _, item_id in self._keys}
+        self._synced_at = self._clock()
+        self._mark_loaded()
+
+    def add_item(self, document: Dict[str, Any]) -> bool:
+        """Inclui um documento novo (apenas se o índice já foi carregado)."""
+        if not self.is_loaded:
+            return False
+
+        item_id = str(document.get("_id", document.get("id")))
+        timestamp = document_timestamp(document)
+        if timestamp is None or item_id in self._ids:
+            return False
+
+        key = (timestamp, item_id)
+        # Caso comum: documentos chegam em ordem cronológica (append O(1))
+        if not self._keys or key > self._keys[-1]:
+            self._keys.append(key)
+        else:
+            insort(self._keys, key)
+        self._ids.add(item_id)
+        return True
+
+    def since(self, start: float) -> List[TimeCursor]:
+        """Pares (timestamp, ID) criados a partir de `start`, mais recentes primeiro."""
+        position = bisect_left(self._keys, (start, ""))
+        return self._keys[position:][::-1]
+
+    def recent(self, days: float, now: Optional[datetime] = None) -> List[TimeCursor]:
+        """Pares (timestamp, ID) dos últimos `days` dias, mais recentes primeiro."""
+        now = datetime.utcnow() if now is None else now
+        return self.since(to_timestamp(now - timedelta(days=days)))
+
+    def page(
+        self, limit: int, before: Optional[TimeCursor] = None
+    ) -> Tuple[List[TimeCursor], Optional[TimeCursor]]:
+        """
+        Página de até `limit` itens anteriores ao cursor `before` (ou os mais
+        recentes, sem cursor), do mais recente ao mais antigo.
+
+        Returns:
+            Tupla (itens da página, cursor da próxima página ou None)
+        """
+        end = len(self._keys) if before is None else bisect_left(self._keys, before)
+        start = max(0, end - limit)
+        items = self._keys[start:end][::-1]
+        next_cursor = items[-1] if items and start > 0 else None
+        return items, next_cursor
+
+
+def encode_cursor(cursor: Optional[TimeCursor]) -> Optional[str]:
+    """Serializa um cursor como "<timestamp>_<id>" para uso em query string."""
+    if cursor is None:
+        return None
+    return f"{cursor[0]!r}_{cursor[1]}"
+
+
+def decode_cursor(value: Optional[str]) -> Optional[TimeCursor]:
+    """Inverso de `encode_cursor`; lança ValueError se o cursor for inválido."""
+    if not value:
+        return None
+    timestamp, _, item_id = value.partition("_")
+    if not item_id:
+        raise ValueError(f"Cursor inválido: {value}")
+    return float(timestamp), item_id
+
+
+def get_time_index(db, collection: str) -> TimeIndex:
+    """Retorna o índice temporal da coleção `collection` do banco `db`."""
+    return get_db_scoped(db, f"time_index:{collection}", lambda: TimeIndex(collection))
@@ -0,0 +1,196 @@
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import scipy.sparse as sp
+from bson import ObjectId
+
+from app.utils.feature_index import MovieFeatureIndex
+from app.utils.registry import peek_db_scoped
+
+# Nota mínima para um filme entrar no perfil de gosto do usuário
+PROFILE_MIN_RATING = 4.0
+
+
+class UserProfile:
+    """
+    Perfil de gosto de um usuário: soma ponderada dos vetores TF-IDF dos
+    filmes que ele curtiu, peso total e contagem de gêneros.
+
+    O centróide (`vector / weight`) pontua o catálogo inteiro com um único
+    produto matriz-vetor. Com peso 1 por filme, o resultado é idêntico à
+    média das similaridades de cosseno com cada filme curtido.
+
+    Persistido na coleção `user_profiles` com o vetor esparso no formato
+    {"<coluna>": valor}, o que permite atualizações com `$inc`. O campo
+    `feature_version` guarda o fingerprint do índice usado; perfis de outra
+    versão são recalculados na próxima leitura.
+    """
+
+    def __init__(
+        self,
+        user_id: str,
+        vector: sp.csr_matrix,
+        weight: float,
+        genre_counts: Dict[str, int],
+        movie_ids: List[str],
+        feature_version: Optional[str],
+    ):
+        self.user_id = str(user_id)
+        self.vector = vector
+        self.weight = weight
+        self.genre_counts = genre_counts
+        self.movie_ids = movie_ids
+        self.feature_version = feature_version
+
+    @property
+    def centroid(self) -> sp.csr_matrix:
+        """Vetor médio (1 x n_features) dos filmes curtidos."""
+        if not self.weight:
+            return self.vector
+        return self.vector / self.weight
+
+    def preferred_genres(self, limit: int = 5) -> List[str]:
+        """Gêneros mais frequentes entre os filmes curtidos."""
+        return [genre for genre, _ in Counter(self.genre_counts).most_common(limit)]
+
+    @classmethod
+    def from_movies(
+        cls, user_id: str, movies: List[Dict[str, Any]], index: MovieFeatureIndex
+    ) -> "UserProfile":
+        """Calcula o perfil a partir dos filmes curtidos (já presentes no índice)."""
+        movie_ids = [str(movie.get("_id", movie.get("id"))) for movie in movies]
+        rows = index.rows(movie_ids)
+        vector = sp.csr_matrix(rows.sum(axis=0), shape=(1, rows.shape[1]))
+        genre_counts = Counter(
+            genre for movie in movies for genre in movie.get("genres", [])
+        )
+        return cls(
+            user_id,
+            vector,
+            float(rows.shape[0]),
+            dict(genre_counts),
+            movie_ids,
+            index.version,
+        )
+
+    @classmethod
+    def from_document(cls, document: Dict[str, Any], n_features: int) -> "UserProfile":
+        """Reconstrói o perfil gravado em `user_profiles`."""
+        entries = document.get("vector") or {}
+        columns = np.fromiter((int(c) for c in entries), dtype=np.int64)
+        values = np.fromiter(entries.values(), dtype=np.float64, count=len(entries))
+        keep = columns < n_features
+        vector = sp.csr_matrix(
+            (values[keep], (np.zeros(int(keep.sum()), dtype=np.int64), columns[keep])),
+            shape=(1, n_features),
+        )
+        return cls(
+            document["_id"],
+            vector,
+            float(document.get("weight", 0.0)),
+            dict(document.get("genre_counts") or {}),
+            list(document.get("movie_ids") or []),
+            document.get("feature_version"),
+        )
+
+    def to_document(self) -> Dict[str, Any]:
+        return {
+            "_id": self.user_id,
+            "feature_version": self.feature_version,
+            "weight": self.weight,
+            "vector": sparse_row_to_dict(self.vector),
+            "genre_counts": self.genre_counts,
+            "movie_ids": self.movie_ids,
+            "updated_at": datetime.utcnow(),
+        }
+
+
+def sparse_row_to_dict(row: sp.csr_matrix) -> Dict[str, float]:
+    """Converte uma linha esparsa em {"<coluna>": valor} para o MongoDB."""
+    row = sp.csr_matrix(row)
+    return {str(int(c)): float(v) for c, v in zip(row.indices, row.data)}
+
+
+async def load_user_profile(
+    db, user_id: str, index: Optional[MovieFeatureIndex] = None
+) -> Optional[UserProfile]:
+    """
+    Lê o perfil persistido do usuário.
+
+    Com `index`, retorna None se o perfil foi calculado com outra versão
+    do índice (ou marcado como defasado); sem `index`, o vetor é ignorado
+    e apenas pesos, gêneros e filmes são confiáveis.
+    """
+    document = await db.user_profiles.find_one({"_id": str(user_id)})
+    if document is None:
+        return None
+    if index is None:
+        return UserProfile.from_document({**document, "vector": {}}, 0)
+    if document.get("feature_version") != index.version:
+        return None
+    return UserProfile.from_document(document, index.matrix.shape[1])
+
+
+async def save_user_profile(db, profile: UserProfile) -> None:
+    """Grava (ou substitui) o perfil do usuário."""
+    await db.user_profiles.replace_one(
+        {"_id": profile.user_id}, profile.to_document(), upsert=True
+    )
+
+
+async def update_user_profile(db, review: Dict[str, Any]) -> bool:
+    """
+    Incorpora uma nova avaliação ao perfil persistido do usuário.
+
+    Custa O(features do filme): um `$inc` nas colunas do vetor do filme.
+    Perfis inexistentes não são criados aqui (serão calculados por completo
+    na próxima recomendação); se o índice TF-IDF não estiver em memória ou
+    o perfil for de outra versão, ele é apenas marcado como defasado.
+
+    Returns:
+        True se o vetor do perfil foi atualizado incrementalmente
+    """
+    if review.get("rating") is None or review["rating"] < PROFILE_MIN_RATING:
+        return False
+
+    user_id = str(review["user_id"])
+    movie_id = str(review["movie_id"])
+    if not ObjectId.is_valid(movie_id):
+        return False
+
+    movie = await db.movies.find_one(
+        {"_id": ObjectId(movie_id)}, MovieFeatureIndex.PROJECTION
+    )
+    if movie is None:
+        return False
+
+    genre_counts = Counter(movie.get("genres", []))
+    changes = {
+        "$inc": {"weight": 1.0, **_prefixed("genre_counts", genre_counts)},
+        "$push": {"movie_ids": movie_id},
+        "$set": {"updated_at": datetime.utcnow()},
+    }
+    # Filmes já presentes no perfil (avaliados de novo) não contam duas vezes
+    query = {"_id": user_id, "movie_ids": {"$ne": movie_id}}
+
+    index = peek_db_scoped(db, "feature_index")
+    if index is not None and index.is_built:
+        index.add_movie(movie)
+        vector = sparse_row_to_dict(index.rows([movie_id]))
+        result = await db.user_profiles.update_one(
+            {**query, "feature_version": index.version},
+            {**changes, "$inc": {**changes["$inc"], **_prefixed("vector", vector)}},
+        )
+        if result.matched_count:
+            return True
+
+    await db.user_profiles.update_one(
+        query, {**changes, "$set": {**changes["$set"], "feature_version": None}}
+    )
+    return False
+
+
+def _prefixed(field: str, values: Dict[str, Any]) -> Dict[str, Any]:
+    return {f"{field}.{key}": value for key, value in values.items()}
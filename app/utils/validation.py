@@ -1,4 +1,4 @@
-from typing import Dict, Any
+from typing import Any, Dict, Optional
 import re
 from bson import ObjectId
 
@@ -20,6 +20,16 @@ def validate_object_id(id_value: str) -> bool:
         return False
 
 
+def to_object_id(value: Any) -> Optional[ObjectId]:
+    """Converte um ID (string ou ObjectId) para ObjectId, ou None se inválido."""
+    if isinstance(value, ObjectId):
+        return value
+    try:
+        return ObjectId(value)
+    except Exception:
+        return None
+
+
 def validate_email(email: str) -> bool:
     """
     Valida se uma string é um email em formato válido.
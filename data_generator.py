@@ -147,8 +147,9 @@ def generate_reviews(users, movies, count=100):
         user = random.choice(users)
         movie = random.choice(movies)
         
-        user_id = str(user["_id"])
-        movie_id = str(movie["_id"])
+        # IDs como ObjectId, no mesmo formato gravado pela API
+        user_id = user["_id"]
+        movie_id = movie["_id"]
         
         # Evitar duplicatas
         if (user_id, movie_id) in evaluated_pairs:
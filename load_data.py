@@ -8,6 +8,8 @@ from data_generator import (
     connect_to_mongo,
     close_mongo_connection,
 )
+from app.utils.id_migration import migrate_review_ids
+from app.utils.rating_aggregates import POPULARITY_SORT, repair_rating_aggregates
 
 
 async def clean_database(db, collections=None):
@@ -46,6 +48,10 @@ async def create_indexes(db):
         await db.reviews.create_index("movie_id")
         print("✓ Índice criado: reviews.movie_id")
 
+        # Agregados de avaliações mantidos em cada filme (filmes populares)
+        await db.movies.create_index(POPULARITY_SORT)
+        print("✓ Índice criado: movies.review_count + rating_avg")
+
         print("\nTodos os índices essenciais foram criados com sucesso!")
     except Exception as e:
         print(f"Erro ao criar índices: {str(e)}")
@@ -85,6 +91,13 @@ async def load_data(
             f"Inseridas {len(result_reviews.inserted_ids)} avaliações no banco de dados."
         )
 
+        # Calcular os agregados de avaliações de cada filme
+        await repair_rating_aggregates(db)
+
+        # Registrar as avaliações como migradas para ObjectId (desliga a
+        # leitura dupla de user_id/movie_id)
+        await migrate_review_ids(db, resume=False)
+
         # Criar índices
         await create_indexes(db)
 
@@ -1,9 +1,13 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 
 from app.routers import users, auth, movies  # Adicionado o import do router de filmes
 from app.config import API_TITLE, API_DESCRIPTION, API_VERSION
 from app.config import CORS_ORIGINS, CORS_ALLOW_CREDENTIALS, CORS_ALLOW_METHODS, CORS_ALLOW_HEADERS
+from app.dependencies import get_database
+from app.utils.executor import ScoringUnavailableError, get_scoring_executor
+from app.utils.rating_aggregates import create_popularity_index
 
 # Criação da aplicação FastAPI
 app = FastAPI(
@@ -15,6 +19,28 @@ app = FastAPI(
     openapi_url="/openapi.json"
 )
 
+
+# Cálculo de recomendações indisponível (fila cheia ou timeout)
+@app.exception_handler(ScoringUnavailableError)
+async def scoring_unavailable_handler(request, exc):
+    return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"detail": str(exc)})
+
+
+@app.on_event("startup")
+async def create_startup_indexes():
+    # Índice dos filmes populares (agregados de avaliações em cada filme)
+    get_db = app.dependency_overrides.get(get_database, get_database)
+    try:
+        await create_popularity_index(await get_db())
+    except Exception as e:
+        print(f"Error creating popularity index: {str(e)}")
+
+
+@app.on_event("shutdown")
+async def shutdown_scoring_executor():
+    get_scoring_executor().shutdown()
+
+
 # Configuração do CORS
 app.add_middleware(
     CORSMiddleware,
@@ -29,6 +55,7 @@ app.include_router(auth.router)
 app.include_router(users.router)
 app.include_router(movies.router)  # Adicionado o router de filmes
 
+
 @app.get("/", tags=["root"])
 async def root():
     """
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+import asyncio
+import argparse
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from app.config import (
+    RECOMMENDATION_ARTIFACTS_DIR,
+    RECOMMENDATION_MF_MODEL_DIR,
+    RECOMMENDATION_NEIGHBORS_K,
+)
+from app.services.recommendation_service import RecommendationService
+from app.utils.id_migration import migrate_review_ids
+from app.utils.rating_aggregates import repair_rating_aggregates
+
+
+async def build_neighbors(db, args):
+    """Recalcular a tabela de vizinhos (movie_neighbors) de todo o catálogo"""
+    print(f"Calculando os {args.k} vizinhos mais similares de cada filme...")
+    count = await RecommendationService(db).build_neighbor_table(k=args.k)
+    print(f"Tabela de vizinhos gravada para {count} filmes.")
+
+
+async def train_mf(db, args):
+    """Treinar o modelo de fatoração de matriz com a coleção reviews"""
+    print(
+        f"Treinando fatoração de matriz ({args.factors} fatores, "
+        f"{args.iterations} iterações)..."
+    )
+    await RecommendationService(db).train_matrix_factorization(
+        output_dir=args.output,
+        n_factors=args.factors,
+        regularization=args.regularization,
+        iterations=args.iterations,
+        n_jobs=args.jobs,
+    )
+
+
+async def precompute_recommendations(db, args):
+    """Gravar o top-N de cada usuário em user_recommendations"""
+    print(
+        f"Pré-calculando recomendações (shard {args.shard + 1}/{args.shards}, "
+        f"top {args.limit})..."
+    )
+    count = await RecommendationService(db).precompute_user_recommendations(
+        limit=args.limit,
+        shard=args.shard,
+        shards=args.shards,
+        batch_size=args.batch_size,
+        resume=not args.restart,
+    )
+    print(f"Recomendações gravadas para {count} usuários.")
+
+
+async def build_artifacts(db, args):
+    """Gravar a matriz de features e a tabela de vizinhos como artefatos"""
+    print(f"Gerando artefatos do modelo em {args.output} (k={args.k})...")
+    await RecommendationService(db).build_model_artifacts(
+        output_dir=args.output, k=args.k
+    )
+
+
+async def repair_aggregates(db, args):
+    """Recalcular os agregados de avaliações gravados em cada filme"""
+    print("Recalculando review_count, rating_sum, rating_avg e histograma...")
+    count = await repair_rating_aggregates(db, batch_size=args.batch_size)
+    print(f"Agregados recalculados para {count} filmes avaliados.")
+
+
+async def migrate_ids(db, args):
+    """Converter reviews.user_id e reviews.movie_id para ObjectId"""
+    print("Convertendo user_id e movie_id das avaliações para ObjectId...")
+    counts = await migrate_review_ids(
+        db, batch_size=args.batch_size, resume=not args.restart
+    )
+    print(
+        f"{counts['converted']} de {counts['scanned']} avaliações convertidas, "
+        f"{counts['duplicates_removed']} duplicatas removidas."
+    )
+    if counts["remaining"]:
+        print(
+            f"{counts['remaining']} avaliações ainda têm IDs inválidos; "
+            "a leitura dupla continua ativa."
+        )
+    else:
+        print("Migração concluída; a leitura dupla será desligada.")
+
+
+async def benchmark_similarity(db, args):
+    """Comparar os modos python e aggregate de filmes similares"""
+    print(
+        f"Medindo filmes similares em {args.samples} filmes "
+        f"(top {args.limit})..."
+    )
+    report = await RecommendationService(db).benchmark_similarity(
+        samples=args.samples, limit=args.limit
+    )
+    for mode, stats in report.items():
+        details = ", ".join(f"{key}={value}" for key, value in stats.items())
+        print(f"  {mode}: {details}")
+
+
+async def run(args):
+    """Conectar ao MongoDB e executar o job selecionado"""
+    client = AsyncIOMotorClient(args.mongo_url)
+    db = client[args.database]
+
+    try:
+        await args.job(db, args)
+    except Exception as e:
+        print(f"Erro ao executar o job: {str(e)}")
+        raise
+    finally:
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Jobs offline do sistema de recomendação"
+    )
+    parser.add_argument(
+        "--mongo-url",
+        default="mongodb://localhost:27017",
+        help="URL de conexão com o MongoDB (default: mongodb://localhost:27017)",
+    )
+    parser.add_argument(
+        "--database",
+        default="myfastapidb",
+        help="Nome do banco de dados (default: myfastapidb)",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    neighbors_parser = subparsers.add_parser(
+        "build-neighbors",
+        help="Pré-calcular os filmes similares de cada filme",
+    )
+    neighbors_parser.add_argument(
+        "--k",
+        type=int,
+        default=RECOMMENDATION_NEIGHBORS_K,
+        help=f"Vizinhos armazenados por filme (default: {RECOMMENDATION_NEIGHBORS_K})",
+    )
+    neighbors_parser.set_defaults(job=build_neighbors)
+
+    mf_parser = subparsers.add_parser(
+        "train-mf",
+        help="Treinar a fatoração de matriz (filtragem colaborativa)",
+    )
+    mf_parser.add_argument(
+        "--factors", type=int, default=32, help="Dimensão dos fatores (default: 32)"
+    )
+    mf_parser.add_argument(
+        "--iterations",
+        type=int,
+        default=10,
+        help="Iterações do ALS (default: 10)",
+    )
+    mf_parser.add_argument(
+        "--regularization",
+        type=float,
+        default=0.1,
+        help="Regularização L2 (default: 0.1)",
+    )
+    mf_parser.add_argument(
+        "--jobs",
+        type=int,
+        default=None,
+        help="Threads usadas no treino (default: todos os núcleos)",
+    )
+    mf_parser.add_argument(
+        "--output",
+        default=RECOMMENDATION_MF_MODEL_DIR,
+        help=f"Diretório do modelo (default: {RECOMMENDATION_MF_MODEL_DIR})",
+    )
+    mf_parser.set_defaults(job=train_mf)
+
+    precompute_parser = subparsers.add_parser(
+        "precompute-recommendations",
+        help="Pré-calcular as recomendações de cada usuário",
+    )
+    precompute_parser.add_argument(
+        "--limit", type=int, default=20, help="Filmes por usuário (default: 20)"
+    )
+    precompute_parser.add_argument(
+        "--shard", type=int, default=0, help="Shard deste processo (default: 0)"
+    )
+    precompute_parser.add_argument(
+        "--shards", type=int, default=1, help="Total de shards (default: 1)"
+    )
+    precompute_parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1000,
+        help="Usuários por lote e checkpoint (default: 1000)",
+    )
+    precompute_parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="Ignorar o checkpoint e recomeçar o shard do início",
+    )
+    precompute_parser.set_defaults(job=precompute_recommendations)
+
+    artifacts_parser = subparsers.add_parser(
+        "build-artifacts",
+        help="Gravar artefatos mapeados em memória compartilhados entre os workers",
+    )
+    artifacts_parser.add_argument(
+        "--k",
+        type=int,
+        default=RECOMMENDATION_NEIGHBORS_K,
+        help=f"Vizinhos armazenados por filme (default: {RECOMMENDATION_NEIGHBORS_K})",
+    )
+    artifacts_parser.add_argument(
+        "--output",
+        default=RECOMMENDATION_ARTIFACTS_DIR,
+        help=f"Diretório dos artefatos (default: {RECOMMENDATION_ARTIFACTS_DIR})",
+    )
+    artifacts_parser.set_defaults(job=build_artifacts)
+
+    aggregates_parser = subparsers.add_parser(
+        "repair-aggregates",
+        help="Recalcular os agregados de avaliações de cada filme",
+    )
+    aggregates_parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1000,
+        help="Filmes atualizados por bulk_write (default: 1000)",
+    )
+    aggregates_parser.set_defaults(job=repair_aggregates)
+
+    migrate_parser = subparsers.add_parser(
+        "migrate-ids",
+        help="Converter user_id/movie_id das avaliações para ObjectId",
+    )
+    migrate_parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1000,
+        help="Avaliações por lote e checkpoint (default: 1000)",
+    )
+    migrate_parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="Ignorar o checkpoint e recomeçar do início",
+    )
+    migrate_parser.set_defaults(job=migrate_ids)
+
+    benchmark_parser = subparsers.add_parser(
+        "benchmark-similarity",
+        help="Comparar a similaridade em Python com a agregação no MongoDB",
+    )
+    benchmark_parser.add_argument(
+        "--samples", type=int, default=20, help="Filmes sorteados (default: 20)"
+    )
+    benchmark_parser.add_argument(
+        "--limit", type=int, default=10, help="Similares por filme (default: 10)"
+    )
+    benchmark_parser.set_defaults(job=benchmark_similarity)
+
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
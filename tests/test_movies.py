@@ -272,6 +272,27 @@ async def test_get_user_preferences(async_mock_db, populate_db, recommender):
     assert "The Shawshank Redemption" in movie_titles
     assert "The Godfather" in movie_titles
 
+async def test_get_user_preferences_with_prefetched_reviews(async_mock_db, populate_db, recommender):
+    """Testa se get_user_preferences usa as avaliações já carregadas pelo chamador."""
+    await populate_db
+
+    # Avaliações carregadas pelo chamador (incluindo ObjectId e nota baixa)
+    reviews = [
+        {"movie_id": ObjectId("60d21b4967d0d8992e610c89"), "rating": 5.0},  # Inception
+        {"movie_id": "60d21b4967d0d8992e610c8a", "rating": 4.0},  # Pulp Fiction
+        {"movie_id": "60d21b4967d0d8992e610c86", "rating": 2.0},  # Shawshank
+    ]
+
+    # A coleção reviews não deve ser consultada
+    await async_mock_db.reviews.delete_many({})
+    liked_movies = await recommender.get_user_preferences(
+        async_mock_db, "60d21b4967d0d8992e610c85", reviews=reviews
+    )
+
+    # Apenas os filmes com nota >= 4, na ordem das avaliações
+    assert [movie["title"] for movie in liked_movies] == ["Inception", "Pulp Fiction"]
+    assert all("id" in movie for movie in liked_movies)
+
 def test_get_movie_features(recommender):
     """Testa a função get_movie_features do recomendador de filmes."""
     # Criar um filme
@@ -384,3 +405,970 @@ async def test_tfidf_vectorization_in_recommendations(async_mock_db, populate_db
     # Inception (também Action, Sci-Fi) deve estar nas recomendações
     recommended_titles = [movie["title"] for movie in recommendations]
     assert "Inception" in recommended_titles
+
+async def test_feature_index_is_reused_and_refreshed_on_create(async_mock_db, populate_db, auth_headers, test_client, recommender):
+    """Testa se o índice TF-IDF é construído uma vez e atualizado ao criar um filme."""
+    from app.utils.recommendation import get_feature_index
+
+    await populate_db
+
+    # Primeira recomendação constrói o índice com todo o catálogo
+    user_id = "60d21b4967d0d8992e610c85"  # testuser
+    await recommender.get_recommendations(async_mock_db, user_id)
+    index = get_feature_index(async_mock_db)
+    assert index.is_built
+    assert len(index) == 5
+    matrix_before = index.matrix
+
+    # Criar um filme pela API deve anexá-lo ao índice sem reajustar o vocabulário
+    response = test_client.post(
+        "/movies/",
+        json={
+            "title": "The Mist",
+            "genres": ["Drama", "Horror"],
+            "director": "Frank Darabont",
+            "actors": ["Thomas Jane", "Morgan Freeman"]
+        },
+        headers=auth_headers
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    new_id = response.json()["id"]
+
+    assert new_id in index
+    assert index.matrix.shape[0] == matrix_before.shape[0] + 1
+    assert index.matrix.shape[1] == matrix_before.shape[1]
+
+    # O novo filme (mesmo diretor e ator de Shawshank) deve ser recomendado
+    recommendations = await recommender.get_recommendations(async_mock_db, user_id)
+    assert "The Mist" in [movie["title"] for movie in recommendations]
+
+async def test_similar_movies_from_neighbor_table(async_mock_db, populate_db, test_client):
+    """Testa se /recommendations/similar usa a tabela de vizinhos pré-calculada."""
+    from app.services.recommendation_service import RecommendationService
+    from app.utils.recommendation import calculate_similarity
+
+    await populate_db
+
+    service = RecommendationService(async_mock_db)
+    count = await service.build_neighbor_table(k=3)
+    assert count == 5
+
+    # Os vizinhos gravados devem seguir a mesma pontuação da função escalar
+    movies = await async_mock_db.movies.find().to_list(length=None)
+    inception = next(m for m in movies if m["title"] == "Inception")
+    entry = await async_mock_db.movie_neighbors.find_one({"_id": inception["_id"]})
+    expected = sorted(
+        (calculate_similarity(inception, other) for other in movies if other is not inception),
+        reverse=True,
+    )
+    assert entry["scores"] == [score for score in expected if score > 0][:3]
+
+    # A rota deve devolver os filmes na ordem da tabela
+    response = test_client.get(f"/movies/recommendations/similar/{inception['_id']}?limit=2")
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()
+    assert [movie["id"] for movie in data] == [str(mid) for mid in entry["neighbors"][:2]]
+    assert data[0]["title"] == "The Dark Knight"
+
+async def test_recommendations_with_ann_shortlist(async_mock_db, populate_db, recommender, monkeypatch):
+    """Testa se as recomendações usam a lista curta do índice ANN quando habilitado."""
+    from app.utils import recommendation
+
+    from app.utils.registry import clear_db_scoped
+
+    await populate_db
+    user_id = "60d21b4967d0d8992e610c85"  # testuser
+
+    # Resultado da busca exata sobre o catálogo inteiro
+    exact = await recommender.get_recommendations(async_mock_db, user_id)
+    assert recommendation.get_feature_index(async_mock_db).ann is None
+
+    # Reconstruir o índice com ANN; com muitas sondagens a lista curta cobre
+    # o catálogo pequeno inteiro e o re-ranqueamento exato dá o mesmo resultado
+    clear_db_scoped(async_mock_db)
+    monkeypatch.setattr(recommendation, "RECOMMENDATION_ANN_MIN_ITEMS", 1)
+    monkeypatch.setattr(recommendation, "RECOMMENDATION_ANN_PROBES", 16)
+    approximate = await recommender.get_recommendations(async_mock_db, user_id)
+
+    index = recommendation.get_feature_index(async_mock_db)
+    assert index.ann is not None
+    assert len(index.ann) == len(index)
+    assert [movie["title"] for movie in approximate] == [movie["title"] for movie in exact]
+
+async def test_matrix_factorization_training_and_serving(async_mock_db, populate_db, tmp_path, monkeypatch):
+    """Testa o treino da fatoração de matriz a partir de reviews e o uso nas recomendações."""
+    from app.services import recommendation_service
+    from app.services.recommendation_service import RecommendationService
+    from app.utils.matrix_factorization import MatrixFactorizationModel
+
+    await populate_db
+
+    # Outro usuário com gosto parecido ao do testuser que também gostou de Pulp Fiction
+    other_user = ObjectId("60d21b4967d0d8992e610c83")
+    await async_mock_db.reviews.insert_many([
+        {"user_id": other_user, "movie_id": ObjectId("60d21b4967d0d8992e610c86"), "rating": 5.0},
+        {"user_id": other_user, "movie_id": ObjectId("60d21b4967d0d8992e610c87"), "rating": 4.5},
+        {"user_id": other_user, "movie_id": ObjectId("60d21b4967d0d8992e610c8a"), "rating": 5.0},
+        {"user_id": other_user, "movie_id": ObjectId("60d21b4967d0d8992e610c89"), "rating": 1.0},
+        # ID legado inválido: ignorado no treino
+        {"user_id": other_user, "movie_id": "legado", "rating": 4.0},
+    ])
+
+    service = RecommendationService(async_mock_db)
+    model_dir = str(tmp_path / "mf")
+    model = await service.train_matrix_factorization(
+        output_dir=model_dir, n_factors=4, iterations=5
+    )
+    assert model.user_factors.shape == (2, 4)
+    assert model.item_factors.shape == (4, 4)
+
+    # O modelo gravado pode ser recarregado com os mesmos fatores, com os IDs
+    # ordenados em arrays mapeados e consultados por busca binária
+    loaded = MatrixFactorizationModel.load(model_dir)
+    assert isinstance(loaded.item_ids, np.memmap)
+    assert list(loaded.item_ids) == sorted(model.item_ids)
+    assert np.allclose(loaded.item_factors[loaded.item_rows(model.item_ids)], model.item_factors)
+    assert loaded.item_rows(["legado"]).tolist() == [-1]
+    user_rows = loaded.user_rows(model.user_ids)
+
+    # Regravar sobre um modelo mapeado troca o diretório sem tocar nos arquivos abertos
+    from app.utils.matrix_factorization import get_mf_model
+    first = get_mf_model(model_dir)
+    retrained = MatrixFactorizationModel(
+        model.user_ids, model.item_ids, model.user_factors * 2, model.item_factors, 1.0
+    )
+    retrained.save(model_dir)
+    assert np.allclose(loaded.user_factors[user_rows], model.user_factors)
+    current = get_mf_model(model_dir)
+    assert current is not first and current.global_mean == 1.0
+    assert np.allclose(current.user_factors[user_rows], model.user_factors * 2)
+
+    # Recomendações do testuser passam a vir do modelo, sem filmes já avaliados
+    monkeypatch.setattr(recommendation_service, "RECOMMENDATION_MF_MODEL_DIR", model_dir)
+    movies = await service.get_recommendations_for_user("60d21b4967d0d8992e610c85", limit=2)
+    assert [movie.title for movie in movies] == ["Pulp Fiction", "Inception"]
+
+    # Um ID inválido no modelo é descartado sem derrubar as recomendações
+    user = model.user_factors[model.user_ids.index("60d21b4967d0d8992e610c85")]
+    legacy_dir = str(tmp_path / "legacy")
+    MatrixFactorizationModel(
+        model.user_ids, model.item_ids + ["legado"], model.user_factors,
+        np.vstack([model.item_factors, user * 10]), model.global_mean,
+    ).save(legacy_dir)
+    monkeypatch.setattr(recommendation_service, "RECOMMENDATION_MF_MODEL_DIR", legacy_dir)
+    movies = await service.get_recommendations_for_user("60d21b4967d0d8992e610c85", limit=2)
+    assert [movie.title for movie in movies] == ["Pulp Fiction"]
+
+async def test_weighted_ratings_with_global_mean_and_incremental_update(async_mock_db, populate_db, auth_headers, test_client):
+    """Testa a classificação ponderada vetorizada e a atualização incremental por nova avaliação."""
+    from app.utils.rating_stats import get_rating_stats
+    from app.utils.recommendation import calculate_weighted_rating, calculate_weighted_ratings
+
+    await populate_db
+
+    # A versão vetorizada reproduz a escalar quando recebe a mesma média global
+    reviews = [{"rating": 5.0}, {"rating": 3.0}]
+    weighted = calculate_weighted_ratings([2, 0], [8.0, 0.0], global_avg_rating=3.0)
+    assert weighted.tolist() == [calculate_weighted_rating({"reviews": reviews}), 0.0]
+
+    # Shawshank (5.0) deve ficar acima de Godfather (4.5); média global = 4.75
+    response = test_client.get("/movies/recommendations/popular?ranking=weighted")
+    assert response.status_code == status.HTTP_200_OK
+    assert [movie["title"] for movie in response.json()] == ["The Shawshank Redemption", "The Godfather"]
+
+    stats = get_rating_stats(async_mock_db)
+    assert stats.global_mean == 4.75
+
+    # Uma nova avaliação atualiza as estatísticas já carregadas sem nova agregação
+    response = test_client.post(
+        "/movies/reviews",
+        json={"movie_id": "60d21b4967d0d8992e610c89", "rating": 5.0},
+        headers=auth_headers
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    assert stats.total_count == 3
+    assert "60d21b4967d0d8992e610c89" in stats.movie_ids
+
+    response = test_client.get("/movies/recommendations/popular?ranking=invalid")
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+async def test_rating_stats_refresh_after_ttl(async_mock_db, populate_db):
+    """Testa a reagregação das estatísticas de avaliações após o TTL, ignorando notas ausentes."""
+    from app.utils.rating_stats import RatingStats
+
+    await populate_db
+    now = [0.0]
+    stats = RatingStats(ttl_seconds=60, clock=lambda: now[0])
+    await stats.ensure_loaded(async_mock_db)
+    assert stats.total_count == 2
+
+    # Avaliações gravadas fora da API (uma sem nota) não passam por add_review
+    movie_id = ObjectId("60d21b4967d0d8992e610c89")
+    await async_mock_db.reviews.insert_many([
+        {"user_id": ObjectId(), "movie_id": movie_id, "rating": 3.0},
+        {"user_id": ObjectId(), "movie_id": movie_id, "rating": None},
+    ])
+    await stats.ensure_loaded(async_mock_db)
+    assert stats.total_count == 2
+
+    # Vencido o TTL, os valores atuais são servidos enquanto a recarga roda
+    now[0] = 61.0
+    assert (await stats.ensure_loaded(async_mock_db)).total_count == 2
+    await stats._refreshing
+    assert stats.total_count == 3
+    assert stats.weighted_ratings_for([str(movie_id)], min_reviews=1)[0] > 0
+
+async def test_genre_index_matches_filter_by_genres(async_mock_db, populate_db, sample_movies):
+    """Testa o índice invertido de gêneros contra o filtro linear e sua atualização na criação de filmes."""
+    from app.utils.genre_index import GenreIndex, get_genre_index
+    from app.utils.recommendation import filter_by_genres
+
+    index = GenreIndex()
+    index.load(sample_movies)
+    for genres in ([], ["Drama"], ["Crime", "Drama"], ["Action", "Crime", "Drama"], ["Sci-Fi", "Unknown"]):
+        for min_match in (0, 1, 2, 3):
+            expected = [str(movie["_id"]) for movie in filter_by_genres(sample_movies, genres, min_match)]
+            assert index.movie_ids_for(genres, min_match) == expected
+
+    await populate_db
+    genre_index = await get_genre_index(async_mock_db).ensure_loaded(async_mock_db)
+    assert len(genre_index) == len(sample_movies)
+
+    from app.repositories.movie_repository import MovieRepository
+
+    repository = MovieRepository(async_mock_db)
+    created = await repository.create(Movie(
+        title="Novo Drama", genres=["Drama", "Romance"], director="Alguém", actors=[]
+    ))
+    assert genre_index.movie_ids_for(["Romance"]) == [str(created.id)]
+
+    # Após o TTL, a recarga incorpora filmes gravados fora do repositório e
+    # descarta gêneros alterados
+    import time
+
+    now = [time.monotonic()]
+    genre_index._clock = lambda: now[0]
+    direct = await async_mock_db.movies.insert_one(
+        {"title": "Direto", "genres": ["Romance"], "director": "", "actors": []}
+    )
+    await async_mock_db.movies.update_one({"_id": ObjectId(created.id)}, {"$set": {"genres": ["Drama"]}})
+    assert genre_index.movie_ids_for(["Romance"]) == [str(created.id)]
+    now[0] += genre_index.ttl_seconds
+    await genre_index.ensure_loaded(async_mock_db)
+    await genre_index._refreshing
+    assert genre_index.movie_ids_for(["Romance"]) == [str(direct.inserted_id)]
+
+async def test_recent_reviews_feed_and_new_movies(async_mock_db, populate_db, auth_headers, test_client):
+    """Testa o índice temporal: feed paginado de avaliações recentes e filmes novos."""
+    from app.utils.time_index import TimeIndex, recency_weights
+
+    await populate_db
+
+    # Primeira página com uma avaliação e cursor para a seguinte
+    response = test_client.get("/movies/reviews/recent?limit=1")
+    assert response.status_code == status.HTTP_200_OK
+    first_page = response.json()
+    assert len(first_page["items"]) == 1
+    assert first_page["next_cursor"]
+
+    response = test_client.get(f"/movies/reviews/recent?limit=1&cursor={first_page['next_cursor']}")
+    second_page = response.json()
+    assert len(second_page["items"]) == 1
+    assert second_page["next_cursor"] is None
+    assert {first_page["items"][0]["id"], second_page["items"][0]["id"]} == {
+        "60d21b4967d0d8992e610c90", "60d21b4967d0d8992e610c91"
+    }
+
+    # Uma nova avaliação entra no topo do feed sem recarregar o índice
+    response = test_client.post(
+        "/movies/reviews",
+        json={"movie_id": "60d21b4967d0d8992e610c88", "rating": 4.0},
+        headers=auth_headers
+    )
+    new_review_id = response.json()["id"]
+    response = test_client.get("/movies/reviews/recent?limit=10")
+    assert response.json()["items"][0]["id"] == new_review_id
+    assert len(response.json()["items"]) == 3
+
+    assert test_client.get("/movies/reviews/recent?cursor=invalido").status_code == status.HTTP_400_BAD_REQUEST
+
+    # Filmes de exemplo não têm created_at: vale a data embutida no ObjectId (2021)
+    assert test_client.get("/movies/new?days=7").json() == []
+    response = test_client.post(
+        "/movies/",
+        json={"title": "Lançamento", "genres": ["Drama"], "director": "Alguém", "actors": []},
+        headers=auth_headers
+    )
+    assert [movie["title"] for movie in test_client.get("/movies/new?days=7").json()] == ["Lançamento"]
+
+    # Escritas diretas no banco (outros workers, scripts) entram na sincronização seguinte
+    import time
+    from app.utils.time_index import get_time_index
+
+    reviews_index = get_time_index(async_mock_db, "reviews")
+    movies_index = get_time_index(async_mock_db, "movies")
+    now = [time.monotonic()]
+    reviews_index._clock = movies_index._clock = lambda: now[0]
+    direct_review = await async_mock_db.reviews.insert_one({
+        "user_id": ObjectId(), "movie_id": ObjectId("60d21b4967d0d8992e610c89"),
+        "rating": 3.0, "comment": "Direto", "created_at": datetime.utcnow(),
+    })
+    await async_mock_db.movies.insert_one({"title": "Direto", "genres": [], "director": "", "actors": [], "created_at": datetime.utcnow()})
+    now[0] += reviews_index.sync_seconds
+    response = test_client.get("/movies/reviews/recent?limit=10")
+    assert response.json()["items"][0]["id"] == str(direct_review.inserted_id)
+    assert [movie["title"] for movie in test_client.get("/movies/new?days=7").json()] == ["Direto", "Lançamento"]
+
+    # Após o TTL, a recarga completa descarta documentos removidos
+    await async_mock_db.reviews.delete_one({"_id": direct_review.inserted_id})
+    now[0] += reviews_index.ttl_seconds
+    await reviews_index.ensure_loaded(async_mock_db)
+    await reviews_index._refreshing
+    assert len(reviews_index) == 3
+
+    # Consultas por janela e pesos de recência
+    index = TimeIndex("reviews")
+    index.load([{"_id": str(i), "created_at": datetime(2024, 1, i + 1)} for i in range(10)])
+    assert [item_id for _, item_id in index.recent(3, now=datetime(2024, 1, 10))] == ["9", "8", "7", "6"]
+    weights = recency_weights([0.0, 86400.0 * 30], half_life_days=30, now=86400.0 * 30)
+    assert weights.tolist() == [0.5, 1.0]
+
+async def test_user_profile_is_persisted_and_updated_on_review(async_mock_db, populate_db, auth_headers, test_client, recommender):
+    """Testa o perfil de gosto persistido e sua atualização incremental por nova avaliação."""
+    from app.utils.recommendation import get_feature_index
+    from app.utils.user_profile import UserProfile, load_user_profile
+
+    await populate_db
+    user_id = "60d21b4967d0d8992e610c85"  # testuser
+
+    # A primeira recomendação calcula e grava o perfil (Shawshank + Godfather)
+    recommendations = await recommender.get_recommendations(async_mock_db, user_id)
+    index = get_feature_index(async_mock_db)
+    profile = await load_user_profile(async_mock_db, user_id, index)
+    assert profile.weight == 2.0
+    assert profile.genre_counts == {"Drama": 2, "Crime": 1}
+
+    # O centróide reproduz a média das similaridades de cosseno
+    liked = index.rows(profile.movie_ids)
+    expected = np.asarray((index.matrix @ liked.T).mean(axis=1)).ravel()
+    np.testing.assert_allclose((index.matrix @ profile.centroid.T).toarray().ravel(), expected)
+    assert len(recommendations) == 3
+
+    # Nova avaliação positiva atualiza o perfil com $inc, sem recalcular
+    response = test_client.post(
+        "/movies/reviews",
+        json={"movie_id": "60d21b4967d0d8992e610c88", "rating": 5.0},
+        headers=auth_headers
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    updated = await load_user_profile(async_mock_db, user_id, index)
+    assert updated is not None
+    assert updated.weight == 3.0
+    assert updated.genre_counts["Action"] == 1
+
+    movies = await async_mock_db.movies.find({"_id": {"$in": [ObjectId(m) for m in updated.movie_ids]}}).to_list(None)
+    fresh = UserProfile.from_movies(user_id, movies, index)
+    np.testing.assert_allclose(updated.vector.toarray(), fresh.vector.toarray())
+
+    # Avaliações abaixo de 4 não alteram o perfil
+    test_client.post(
+        "/movies/reviews",
+        json={"movie_id": "60d21b4967d0d8992e610c89", "rating": 2.0},
+        headers=auth_headers
+    )
+    assert (await load_user_profile(async_mock_db, user_id, index)).weight == 3.0
+
+    # Um perfil de outra versão do índice é recalculado na próxima leitura
+    await async_mock_db.user_profiles.update_one({"_id": user_id}, {"$set": {"feature_version": "antiga"}})
+    assert await load_user_profile(async_mock_db, user_id, index) is None
+    await recommender.get_recommendations(async_mock_db, user_id)
+    assert (await load_user_profile(async_mock_db, user_id, index)).weight == 3.0
+
+async def test_batch_recommendations_stream(async_mock_db, populate_db, auth_headers, test_client, recommender):
+    """Testa o endpoint de recomendações em lote (NDJSON, uma linha por usuário)."""
+    import json
+    from app.config import RECOMMENDATION_BATCH_MAX_USERS
+
+    await populate_db
+    payload = {
+        "user_ids": ["60d21b4967d0d8992e610c85", "60d21b4967d0d8992e610c84", "60d21b4967d0d8992e610c99"],
+        "limit": 3,
+    }
+
+    # Rota autenticada e com limite de usuários por chamada
+    response = test_client.post("/movies/recommendations/batch", json=payload)
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    too_many = {"user_ids": ["60d21b4967d0d8992e610c85"] * (RECOMMENDATION_BATCH_MAX_USERS + 1)}
+    response = test_client.post("/movies/recommendations/batch", json=too_many, headers=auth_headers)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    response = test_client.post("/movies/recommendations/batch", json=payload, headers=auth_headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["user_id"] for line in lines] == [
+        "60d21b4967d0d8992e610c85", "60d21b4967d0d8992e610c84", "60d21b4967d0d8992e610c99"
+    ]
+
+    # testuser: mesma pontuação por conteúdo da recomendação individual
+    expected = await recommender.get_recommendations(async_mock_db, "60d21b4967d0d8992e610c85", max_recommendations=3)
+    assert [movie["id"] for movie in lines[0]["recommendations"]] == [str(movie["_id"]) for movie in expected]
+
+    # emptyuser (sem avaliações) recebe populares; usuário inexistente recebe erro
+    assert len(lines[1]["recommendations"]) > 0
+    assert lines[2]["recommendations"] == [] and "error" in lines[2]
+
+async def test_precomputed_recommendations_store(async_mock_db, populate_db, auth_headers, test_client):
+    """Testa o job de pré-cálculo (com shards e retomada) e o modo de leitura do store."""
+    from app.services.recommendation_service import RecommendationService
+
+    await populate_db
+    service = RecommendationService(async_mock_db)
+
+    # Dois shards cobrem todos os usuários, sem sobreposição
+    assert await service.precompute_user_recommendations(limit=3, shard=0, shards=2) == 1
+    assert await service.precompute_user_recommendations(limit=3, shard=1, shards=2) == 1
+    entry = await async_mock_db.user_recommendations.find_one({"_id": "60d21b4967d0d8992e610c85"})
+    assert len(entry["movie_ids"]) == 3
+    assert entry["model_version"].startswith("content:")
+    assert await async_mock_db.user_recommendations.count_documents({}) == 2
+
+    # Shard concluído não é reprocessado ao retomar; com restart recomeça do zero
+    checkpoint = await async_mock_db.recommendation_jobs.find_one({"_id": "precompute-recommendations:0/2"})
+    assert checkpoint["finished_at"] is not None
+    await async_mock_db.recommendation_jobs.update_one(
+        {"_id": "precompute-recommendations:0/2"}, {"$set": {"finished_at": None}}
+    )
+    assert await service.precompute_user_recommendations(limit=3, shard=0, shards=2) == 0
+    assert await service.precompute_user_recommendations(limit=3, shard=0, shards=2, resume=False) == 1
+
+    # O modo store serve a lista gravada
+    stored_ids = [str(movie_id) for movie_id in entry["movie_ids"]]
+    response = test_client.get("/movies/recommendations/user?limit=3&mode=store", headers=auth_headers)
+    assert [movie["id"] for movie in response.json()] == stored_ids
+
+    # Entrada defasada cai no cálculo em tempo real
+    await async_mock_db.user_recommendations.update_one(
+        {"_id": "60d21b4967d0d8992e610c85"},
+        {"$set": {"generated_at": datetime(2000, 1, 1), "movie_ids": []}}
+    )
+    movies = await service.get_recommendations_for_user("60d21b4967d0d8992e610c85", limit=3, mode="store")
+    assert len(movies) > 0
+
+    response = test_client.get("/movies/recommendations/user?mode=invalido", headers=auth_headers)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+async def test_candidate_pipeline_generators_and_budgets(async_mock_db, populate_db):
+    """Testa o pipeline de candidatos em duas etapas, incluindo o orçamento de tempo por etapa."""
+    import asyncio
+    from app.utils.candidates import (
+        CandidateContext, CandidateGenerator, CandidatePipeline, CoOccurrenceCandidates, default_candidate_pipeline
+    )
+    from app.utils.recommendation import get_feature_index
+
+    await populate_db
+    # Outro usuário gostou de Shawshank e de Inception
+    await async_mock_db.reviews.insert_many([
+        {"user_id": "60d21b4967d0d8992e610c84", "movie_id": "60d21b4967d0d8992e610c86", "rating": 5.0},
+        {"user_id": "60d21b4967d0d8992e610c84", "movie_id": "60d21b4967d0d8992e610c8a", "rating": 4.5},
+    ])
+
+    user_id = "60d21b4967d0d8992e610c85"  # testuser (Shawshank e Godfather)
+    rated = ["60d21b4967d0d8992e610c86", "60d21b4967d0d8992e610c87"]
+    index = await get_feature_index(async_mock_db).ensure_built(async_mock_db)
+    profile = await MovieRecommender.get_user_profile(async_mock_db, user_id, index)
+    context = CandidateContext(user_id, rated, ["Drama"], profile)
+
+    assert await CoOccurrenceCandidates().generate(async_mock_db, context) == ["60d21b4967d0d8992e610c8a"]
+
+    movie_ids, stages = await default_candidate_pipeline().run(async_mock_db, context, limit=3)
+    assert len(movie_ids) == 3
+    assert not set(movie_ids) & set(rated)
+    assert set(stages) == {"genre", "collaborative", "cooccurrence", "popularity", "ann", "rank"}
+
+    # Um gerador lento é descartado ao estourar o orçamento, sem bloquear os demais
+    class SlowCandidates(CandidateGenerator):
+        name = "slow"
+
+        async def generate(self, db, context):
+            await asyncio.sleep(1)
+            return ["60d21b4967d0d8992e610c88"]
+
+    pipeline = CandidatePipeline([SlowCandidates(budget_ms=10), CoOccurrenceCandidates()])
+    movie_ids, stages = await pipeline.run(async_mock_db, context, limit=3)
+    assert movie_ids == ["60d21b4967d0d8992e610c8a"]
+    assert stages["slow"]["timed_out"] and stages["slow"]["count"] == 0
+
+    # A carga do catálogo (prepare) não conta no orçamento da etapa
+    class SlowLoadCandidates(CandidateGenerator):
+        name = "slow_load"
+
+        async def prepare(self, db):
+            await asyncio.sleep(0.05)
+
+        async def generate(self, db, context):
+            return ["60d21b4967d0d8992e610c88"]
+
+    pipeline = CandidatePipeline([SlowLoadCandidates(budget_ms=10)])
+    movie_ids, stages = await pipeline.run(async_mock_db, context, limit=3)
+    assert movie_ids == ["60d21b4967d0d8992e610c88"] and not stages["slow_load"]["timed_out"]
+
+async def test_scoring_executor_limits_and_metrics(async_mock_db, populate_db, test_client):
+    """Testa o executor de cálculo: execução fora do event loop, fila limitada, timeout e métricas."""
+    import asyncio
+    import time
+    from app.utils.executor import ExecutorSaturatedError, ScoringExecutor, ScoringTimeoutError
+
+    executor = ScoringExecutor(mode="thread", max_workers=1, max_queue=0, timeout=0.05)
+    assert await executor.run("soma", sum, [1, 2, 3]) == 6
+
+    # Uma tarefa lenta ocupa o único worker: a seguinte é rejeitada e a lenta estoura o timeout
+    slow = asyncio.ensure_future(executor.run("lenta", time.sleep, 0.2))
+    await asyncio.sleep(0)
+    with pytest.raises(ExecutorSaturatedError):
+        await executor.run("soma", sum, [1])
+    with pytest.raises(ScoringTimeoutError):
+        await slow
+
+    # Após o timeout a thread continua rodando e ainda ocupa o worker
+    assert executor.in_flight == 1
+    with pytest.raises(ExecutorSaturatedError):
+        await executor.run("soma", sum, [1])
+    await asyncio.sleep(0.3)
+    assert executor.in_flight == 0
+
+    stats = executor.stats()["tasks"]
+    assert stats["soma"]["count"] == 1 and stats["soma"]["rejected"] == 2
+    assert stats["lenta"]["timeouts"] == 1
+    executor.shutdown()
+
+    # O cálculo das recomendações passa pelo executor e aparece nas métricas
+    await populate_db
+    test_client.get("/movies/recommendations/similar/60d21b4967d0d8992e610c86")
+    response = test_client.get("/movies/recommendations/metrics")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["executor"]["tasks"]["similarity_scoring"]["count"] >= 1
+
+async def test_recommendations_return_503_when_executor_is_saturated(async_mock_db, populate_db, test_client, monkeypatch):
+    """Testa que a fila cheia do executor vira 503, e não uma lista vazia de recomendações."""
+    import asyncio
+    import time
+    from app.utils.executor import ScoringExecutor
+
+    await populate_db
+    executor = ScoringExecutor(mode="thread", max_workers=1, max_queue=0, timeout=0.05)
+    monkeypatch.setattr("app.utils.executor._executor", executor)
+
+    # Uma tarefa lenta ocupa o único worker e não há fila
+    slow = asyncio.ensure_future(executor.run("lenta", time.sleep, 0.3, timeout=0))
+    await asyncio.sleep(0)
+    assert executor.in_flight == 1
+
+    response = test_client.get("/movies/60d21b4967d0d8992e610c85/recommendations")
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert "saturado" in response.json()["detail"]
+
+    await slow
+    assert executor.stats()["tasks"]["lenta"]["count"] == 1
+    executor.shutdown()
+
+async def test_streaming_scorer_matches_index_scoring(async_mock_db, populate_db, recommender, monkeypatch):
+    """Testa o top-k acumulado e o modo de pontuação por streaming do cursor."""
+    from app.utils import recommendation
+    from app.utils.recommendation import TopK, get_feature_index
+
+    rng = np.random.default_rng(0)
+    scores = rng.random(1000)
+    top = TopK(10)
+    for start in range(0, 1000, 64):
+        top.push(scores[start:start + 64], range(start, start + 64))
+    assert [i for i, _ in top.items()] == np.argsort(-scores)[:10].tolist()
+
+    await populate_db
+    user_id = "60d21b4967d0d8992e610c85"
+    expected = await recommender.get_recommendations(async_mock_db, user_id, max_recommendations=3)
+
+    # Lotes de 2 filmes: o catálogo inteiro é percorrido e o resultado é o mesmo
+    monkeypatch.setattr(recommendation, "RECOMMENDATION_SCORING_MODE", "stream")
+    monkeypatch.setattr(recommendation, "RECOMMENDATION_STREAM_BATCH_SIZE", 2)
+    index = get_feature_index(async_mock_db)
+    profile = await MovieRecommender.get_user_profile(async_mock_db, user_id, index)
+    streamed = await MovieRecommender.stream_recommendations(async_mock_db, index, profile, 3, batch_size=2)
+    assert streamed == [str(movie["_id"]) for movie in expected]
+
+    recommendations = await recommender.get_recommendations(async_mock_db, user_id, max_recommendations=3)
+    assert [movie["_id"] for movie in recommendations] == [movie["_id"] for movie in expected]
+
+async def test_hashing_featurizer_shares_idf_without_refit(async_mock_db, populate_db, recommender):
+    """Testa o espaço hashing: IDF gravado e reutilizado, filmes novos sem reajuste."""
+    from app.utils.feature_index import MovieFeatureIndex
+
+    await populate_db
+    first = MovieFeatureIndex(recommender.get_movie_features, featurizer="hashing", hashing_features=2**10, hashing_idf=True)
+    await first.build(async_mock_db)
+    assert first.matrix.shape[1] == 2**10
+    assert await async_mock_db.feature_models.find_one({"_id": MovieFeatureIndex.HASHING_IDF_ID})
+
+    # Outro processo carrega o mesmo IDF e produz vetores idênticos
+    second = MovieFeatureIndex(recommender.get_movie_features, featurizer="hashing", hashing_features=2**10, hashing_idf=True)
+    await second.build(async_mock_db)
+    assert second.version == first.version
+    assert (second.matrix != first.matrix).nnz == 0
+
+    for i in range(10):
+        first.add_movie({"_id": f"new{i}", "title": f"Filme {i}", "genres": ["Drama"], "director": "X", "actors": []})
+    assert not first.needs_refit
+    assert first.matrix.shape == (len(first), 2**10)
+
+async def test_model_artifacts_are_memory_mapped(async_mock_db, populate_db, recommender, tmp_path, monkeypatch):
+    """Testa o build de artefatos e a carga mapeada em memória, sem reajuste."""
+    from app.services import recommendation_service
+    from app.services.recommendation_service import RecommendationService
+    from app.utils.artifacts import load_artifacts
+    from app.utils.recommendation import create_feature_index
+
+    await populate_db
+    output = str(tmp_path / "artifacts")
+    service = RecommendationService(async_mock_db)
+    await service.build_model_artifacts(output_dir=output, k=3)
+
+    fitted = create_feature_index(artifacts_dir=None)
+    await fitted.build(async_mock_db)
+    loaded = create_feature_index(artifacts_dir=output)
+    assert loaded.load_artifacts(load_artifacts(output))
+    assert isinstance(loaded.matrix.data, np.memmap)
+    assert loaded.version == fitted.version
+    assert loaded.movie_ids == fitted.movie_ids
+    assert (loaded.matrix != fitted.matrix).nnz == 0
+    new_movie = {"_id": "new", "title": "Drama", "genres": ["Drama"], "director": "X", "actors": []}
+    assert (loaded.transform([new_movie]) != fitted.transform([new_movie])).nnz == 0
+
+    # Vizinhos servidos pelos artefatos, sem consultar movie_neighbors
+    monkeypatch.setattr(recommendation_service, "RECOMMENDATION_ARTIFACTS_DIR", output)
+    movie_id = "60d21b4967d0d8992e610c86"
+    neighbors = await service._get_precomputed_neighbors(movie_id, 2)
+    assert neighbors is not None and len(neighbors) <= 2
+    assert await async_mock_db.movie_neighbors.count_documents({}) == 0
+
+async def test_mmr_diversity_reranking(async_mock_db, populate_db, auth_headers, test_client):
+    """Testa o MMR vetorizado e o parâmetro mmr_lambda das rotas de recomendação."""
+    from app.utils.diversity import mmr_rerank, rank_relevance
+
+    # Dois quase duplicados no topo: com lambda baixo o segundo perde a vez
+    vectors = np.array([[1.0, 0.0], [1.0, 0.0], [0.0, 1.0], [0.6, 0.8]])
+    relevance = rank_relevance(4)
+    assert mmr_rerank(relevance, vectors, 3, 1.0).tolist() == [0, 1, 2]
+    assert mmr_rerank(relevance, vectors, 3, 0.3).tolist()[:2] == [0, 2]
+
+    await populate_db
+    movie_id = "60d21b4967d0d8992e610c86"
+    plain = test_client.get(f"/movies/recommendations/similar/{movie_id}?limit=2")
+    diverse = test_client.get(f"/movies/recommendations/similar/{movie_id}?limit=2&mmr_lambda=1")
+    assert diverse.status_code == status.HTTP_200_OK
+    assert [m["id"] for m in diverse.json()] == [m["id"] for m in plain.json()]
+
+    response = test_client.get("/movies/recommendations/user?limit=2&mmr_lambda=0.5", headers=auth_headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()) <= 2
+    invalid = test_client.get(f"/movies/recommendations/similar/{movie_id}?mmr_lambda=2")
+    assert invalid.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+async def test_blending_engine_signals_and_configs(async_mock_db, populate_db, auth_headers, test_client):
+    """Testa a normalização e a soma ponderada dos sinais e as configurações por requisição."""
+    from app.utils.blending import BlendConfig, BlendingEngine, Signal, get_blend_config, normalize_scores
+
+    assert normalize_scores([2.0, 4.0, 3.0], "minmax").tolist() == [[0.0, 1.0, 0.5]]
+    assert normalize_scores([5.0, 5.0], "minmax").tolist() == [[0.0, 0.0]]
+    assert normalize_scores([10.0, 30.0, 20.0], "rank").tolist() == [[0.0, 1.0, 0.5]]
+
+    class ConstantSignal(Signal):
+        name = "constant"
+
+        async def compute(self, db, context, movie_ids):
+            return np.arange(len(movie_ids), dtype=float)
+
+    engine = BlendingEngine([ConstantSignal()])
+    config = BlendConfig("test", {"constant": 1.0, "sources": 2.0})
+    scores, report = await engine.blend(async_mock_db, None, ["a", "b", "c"], config, provided={"sources": np.array([1.0, 0.0, 0.0])})
+    assert scores.tolist() == [2.0, 0.5, 1.0]
+    assert set(report) == {"constant", "sources"} and report["sources"]["weight"] == 2.0
+    assert engine.stats()["constant"]["count"] == 1
+
+    # Configurações gravadas no banco têm precedência sobre as embutidas
+    await populate_db
+    await async_mock_db.blend_configs.insert_one({"_id": "experiment", "weights": {"rating": 1.0}, "normalization": "rank"})
+    assert (await get_blend_config(async_mock_db, "experiment")).weights == {"rating": 1.0}
+
+    response = test_client.get("/movies/recommendations/user?limit=2&blend=experiment", headers=auth_headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()) <= 2
+    unknown = test_client.get("/movies/recommendations/user?blend=missing", headers=auth_headers)
+    assert unknown.status_code == status.HTTP_400_BAD_REQUEST
+    assert "rating" in test_client.get("/movies/recommendations/metrics").json()["signals"]
+
+async def test_rating_aggregates_incremental_and_repair(async_mock_db, populate_db, auth_headers, test_client):
+    """Testa os agregados de avaliações por filme: backfill, $inc na criação e populares."""
+    from app.utils.rating_aggregates import repair_rating_aggregates
+
+    await populate_db
+    assert await repair_rating_aggregates(async_mock_db) == 2
+    godfather = await async_mock_db.movies.find_one({"_id": ObjectId("60d21b4967d0d8992e610c87")})
+    assert godfather["review_count"] == 1 and godfather["rating_avg"] == 4.5
+    assert godfather["rating_histogram"] == {"4": 1}
+    unrated = await async_mock_db.movies.find_one({"_id": ObjectId("60d21b4967d0d8992e610c89")})
+    assert unrated["review_count"] == 0
+
+    response = test_client.post(
+        "/movies/reviews",
+        json={"movie_id": "60d21b4967d0d8992e610c87", "rating": 3.0, "comment": "Longo"},
+        headers=auth_headers,
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    godfather = await async_mock_db.movies.find_one({"_id": ObjectId("60d21b4967d0d8992e610c87")})
+    assert godfather["review_count"] == 2 and godfather["rating_sum"] == 7.5
+    assert godfather["rating_avg"] == 3.75
+    assert godfather["rating_histogram"] == {"4": 1, "3": 1}
+
+    # Mais avaliado primeiro; empate desfeito pela média
+    response = test_client.get("/movies/recommendations/popular?limit=2")
+    assert [movie["id"] for movie in response.json()] == ["60d21b4967d0d8992e610c87", "60d21b4967d0d8992e610c86"]
+
+    # O índice de populares é criado na inicialização da aplicação
+    indexes = await async_mock_db.movies.index_information()
+    assert [("review_count", -1), ("rating_avg", -1)] in [index["key"] for index in indexes.values()]
+
+    # Filmes novos já nascem com os agregados zerados
+    response = test_client.post(
+        "/movies",
+        json={"title": "Novo", "genres": ["Drama"], "director": "Alguém", "actors": []},
+        headers=auth_headers,
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    movie = await async_mock_db.movies.find_one({"_id": ObjectId(response.json()["id"])})
+    assert movie["review_count"] == 0 and movie["rating_sum"] == 0.0 and movie["rating_avg"] == 0.0
+
+async def test_popular_genres_cached_aggregation(async_mock_db, populate_db, auth_headers, test_client):
+    """Testa o cache TTL das contagens por gênero, a recarga em segundo plano e o incremento na inserção."""
+    import asyncio
+    from app.utils.cache import TTLCache
+    from app.utils.genre_index import get_genre_counts_cache, get_popular_genres, load_genre_counts
+
+    now = [0.0]
+    loads = []
+
+    async def loader():
+        loads.append(now[0])
+        return len(loads)
+
+    cache = TTLCache(10, clock=lambda: now[0])
+    assert await cache.get_or_load("k", loader) == 1
+    now[0] = 11.0
+    assert await cache.get_or_load("k", loader) == 1  # vencido: servido enquanto recarrega
+    await asyncio.sleep(0)
+    assert await cache.get_or_load("k", loader) == 2
+    assert cache.stats()["stale_hits"] == 1 and len(loads) == 2
+
+    await populate_db
+    counts = await load_genre_counts(async_mock_db)
+    assert counts["Drama"] == max(counts.values())
+    assert (await get_popular_genres(async_mock_db, limit=1)) == ["Drama"]
+
+    response = test_client.post(
+        "/movies/",
+        json={"title": "Novo", "genres": ["Documentary", "Drama"], "director": "X", "actors": ["Y"]},
+        headers=auth_headers,
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    cached = get_genre_counts_cache(async_mock_db).get("counts")
+    assert cached["Documentary"] == counts.get("Documentary", 0) + 1
+    assert cached["Drama"] == counts["Drama"] + 1
+    assert cached == await load_genre_counts(async_mock_db)
+
+async def test_review_id_migration_and_dual_read(async_mock_db, populate_db):
+    """Testa a migração de IDs das avaliações para ObjectId, a retomada e o desligamento da leitura dupla."""
+    from app.services.recommendation_service import RecommendationService
+    from app.utils.id_migration import MIGRATION_JOB_ID, dual_read_enabled, migrate_review_ids, review_id_values
+
+    await populate_db
+    user_id = "60d21b4967d0d8992e610c85"
+    service = RecommendationService(async_mock_db)
+    assert await dual_read_enabled(async_mock_db) is True
+    assert len(await service._get_user_reviews(user_id)) == 2  # IDs gravados como string
+
+    counts = await migrate_review_ids(async_mock_db, batch_size=1)
+    assert counts == {"scanned": 2, "converted": 2, "duplicates_removed": 0, "remaining": 0}
+    reviews = await async_mock_db.reviews.find({}).to_list(length=None)
+    assert all(isinstance(r["user_id"], ObjectId) and isinstance(r["movie_id"], ObjectId) for r in reviews)
+
+    # Migração concluída: apenas ObjectId, uma única consulta
+    assert await dual_read_enabled(async_mock_db) is False
+    assert await review_id_values(async_mock_db, [user_id]) == [ObjectId(user_id)]
+    assert len(await service._get_user_reviews(user_id)) == 2
+
+    # Execução interrompida: retoma depois da última avaliação gravada
+    await async_mock_db.reviews.insert_one(
+        {"user_id": user_id, "movie_id": "60d21b4967d0d8992e610c88", "rating": 4.0}
+    )
+    await async_mock_db.recommendation_jobs.update_one(
+        {"_id": MIGRATION_JOB_ID}, {"$set": {"finished_at": None, "completed_at": None}}
+    )
+    counts = await migrate_review_ids(async_mock_db)
+    assert counts["scanned"] == 1 and counts["converted"] == 1
+    job = await async_mock_db.recommendation_jobs.find_one({"_id": MIGRATION_JOB_ID})
+    assert job["scanned"] == 3 and job["completed_at"] is not None
+
+async def test_review_id_migration_reverts_removed_duplicates(async_mock_db, populate_db):
+    """Testa que a duplicata removida pela migração sai dos agregados, das estatísticas e do perfil."""
+    from app.utils.id_migration import migrate_review_ids
+    from app.utils.rating_aggregates import repair_rating_aggregates
+    from app.utils.rating_stats import get_rating_stats
+
+    await populate_db
+    user_id, movie_id = "60d21b4967d0d8992e610c85", "60d21b4967d0d8992e610c86"
+    await async_mock_db.reviews.create_index([("user_id", 1), ("movie_id", 1)], unique=True)
+    # O mesmo par (usuário, filme) também gravado com ObjectId, com outra nota
+    await async_mock_db.reviews.insert_one(
+        {"user_id": ObjectId(user_id), "movie_id": ObjectId(movie_id), "rating": 3.0}
+    )
+    await repair_rating_aggregates(async_mock_db)
+    stats = await get_rating_stats(async_mock_db).ensure_loaded(async_mock_db)
+    assert stats.total_count == 3
+    await async_mock_db.user_profiles.insert_one({"_id": user_id, "feature_version": "v1", "weight": 2.0})
+
+    counts = await migrate_review_ids(async_mock_db)
+    assert counts["duplicates_removed"] == 1 and counts["remaining"] == 0
+    assert await async_mock_db.reviews.count_documents({"movie_id": ObjectId(movie_id)}) == 1
+
+    movie = await async_mock_db.movies.find_one({"_id": ObjectId(movie_id)})
+    assert movie["review_count"] == 1 and movie["rating_sum"] == 3.0 and movie["rating_avg"] == 3.0
+    assert movie["rating_histogram"] == {"3": 1, "5": 0}
+    assert stats.total_count == 2 and stats.total_sum == 7.5
+    profile = await async_mock_db.user_profiles.find_one({"_id": user_id})
+    assert profile["feature_version"] is None
+
+async def test_request_context_absorbs_duplicate_reads(async_mock_db, populate_db, test_client):
+    """Testa o mapa de identidade da requisição: usuário, avaliações e filmes lidos uma única vez."""
+    from app.services.recommendation_service import RecommendationService
+    from app.utils.request_context import RequestContext
+
+    await populate_db
+    user_id = "60d21b4967d0d8992e610c85"
+    context = RequestContext(async_mock_db)
+    service = RecommendationService(async_mock_db, context)
+    assert (await context.get_user(user_id))["username"] == "testuser"
+    assert await service._validate_user(user_id) is not None
+    assert len(await service._get_user_reviews(user_id)) == 2
+    assert len(await context.get_user_reviews(user_id)) == 2
+    ids = [ObjectId("60d21b4967d0d8992e610c86"), ObjectId("60d21b4967d0d8992e610c87")]
+    await service._fetch_movies_in_order(ids[:1])
+    assert [m.id for m in await service._fetch_movies_in_order(ids)] == [str(i) for i in ids]
+    assert context.db_reads == {"users": 1, "reviews": 1, "movies": 2}
+    assert context.duplicate_reads == {"users": 1, "reviews": 1, "movies": 1}
+
+    # Rota e serviço compartilham o mesmo contexto: o usuário é lido uma vez
+    before = test_client.get("/movies/recommendations/metrics").json()["request_context"]
+    response = test_client.get(f"/movies/{user_id}/recommendations")
+    assert response.status_code == status.HTTP_200_OK
+    after = test_client.get("/movies/recommendations/metrics").json()["request_context"]
+    assert after["requests"] == before["requests"] + 1
+    assert after["db_reads"]["users"] == before["db_reads"]["users"] + 1
+    assert after["duplicate_reads_absorbed"]["users"] >= before["duplicate_reads_absorbed"]["users"] + 1
+
+    # Filmes similares: o filme de referência é lido uma vez para a rota e o serviço
+    response = test_client.get("/movies/recommendations/similar/60d21b4967d0d8992e610c87")
+    assert response.status_code == status.HTTP_200_OK
+    similar = test_client.get("/movies/recommendations/metrics").json()["request_context"]
+    assert similar["db_reads"]["movies"] == after["db_reads"]["movies"] + 1
+    assert similar["duplicate_reads_absorbed"]["movies"] == after["duplicate_reads_absorbed"]["movies"] + 1
+    for missing in ("60d21b4967d0d8992e610c00", "invalido"):
+        response = test_client.get(f"/movies/recommendations/similar/{missing}")
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    # Fora de uma requisição (jobs), o serviço não retém nenhuma leitura
+    service = RecommendationService(async_mock_db)
+    assert [m.id for m in await service._fetch_movies_in_order(ids + ids[:1])] == [str(i) for i in ids + ids[:1]]
+    await service._fetch_movies_in_order(ids)
+    assert len(await service._get_user_reviews(user_id)) == 2
+    assert service.context.db_reads == {"users": 0, "reviews": 1, "movies": 2}
+    assert not service.context._movies and not service.context._reviews
+
+async def test_similar_movies_modes_exclude_reference(async_mock_db, populate_db):
+    """Testa que o filme de referência não é retornado e a pipeline de similaridade no servidor."""
+    from app.services.recommendation_service import RecommendationService
+    from app.utils.recommendation import similarity_pipeline
+
+    await populate_db
+    movie_id = "60d21b4967d0d8992e610c86"
+    service = RecommendationService(async_mock_db)
+    movies = await service.get_similar_movies(movie_id, limit=10, similarity_mode="python")
+    assert movies and movie_id not in [movie.id for movie in movies]
+    with pytest.raises(ValueError):
+        await service.get_similar_movies(movie_id, similarity_mode="unknown")
+
+    reference = await async_mock_db.movies.find_one({"_id": ObjectId(movie_id)})
+    pipeline = similarity_pipeline(reference, 3)
+    assert pipeline[0]["$match"]["_id"] == {"$ne": ObjectId(movie_id)}
+    assert pipeline[-2:] == [{"$limit": 3}, {"$project": {"similarity": 0}}]
+    assert similarity_pipeline({"_id": ObjectId()}, 3) == []
+
+async def test_single_flight_coalesces_concurrent_calls(async_mock_db, populate_db, test_client):
+    """Testa a coalescência de chamadas concorrentes, o cache TTL opcional e as métricas."""
+    import asyncio
+    from app.services.recommendation_service import RecommendationService
+    from app.utils.cache import TTLCache
+    from app.utils.coalescing import SingleFlight, get_single_flight
+
+    calls = []
+    release = asyncio.Event()
+
+    async def loader():
+        calls.append(1)
+        await release.wait()
+        return len(calls)
+
+    flight = SingleFlight()
+    pending = [asyncio.ensure_future(flight.do("k", loader)) for _ in range(5)]
+    await asyncio.sleep(0)
+    release.set()
+    assert await asyncio.gather(*pending) == [1] * 5
+    assert (flight.misses, flight.joins, flight.hits) == (1, 4, 0)
+
+    async def failing():
+        raise RuntimeError("falhou")
+
+    with pytest.raises(RuntimeError):
+        await flight.do("erro", failing)
+    assert flight.stats()["errors"] == 1 and flight.stats()["in_flight"] == 0
+
+    now = [0.0]
+    cached = SingleFlight(TTLCache(5, clock=lambda: now[0]))
+    assert await cached.do("k", loader) == 2
+    assert await cached.do("k", loader) == 2
+    now[0] = 6.0
+    assert await cached.do("k", loader) == 3
+    assert (cached.hits, cached.misses) == (1, 2)
+
+    await populate_db
+    services = [RecommendationService(async_mock_db) for _ in range(3)]
+    results = await asyncio.gather(*(s.get_popular_movies(limit=2) for s in services))
+    assert [m.id for m in results[0]] == [m.id for m in results[2]]
+    popular = get_single_flight(async_mock_db, "popular").stats()
+    assert popular["misses"] == 1 and popular["joins"] == 2
+
+    assert test_client.get("/movies/recommendations/similar/60d21b4967d0d8992e610c86").status_code == 200
+    metrics = test_client.get("/movies/recommendations/metrics").json()["coalescing"]
+    assert metrics["popular"]["joins"] == 2 and metrics["similar"]["misses"] >= 1
+
+    # Cada chamador recebe suas próprias instâncias
+    assert results[0][0] is not results[2][0]
+    results[0][0].title = "Alterado"
+    assert results[2][0].title != "Alterado"
+
+    # Com MMR, apenas o pool de candidatos é coalescido (uma única chave)
+    similar = get_single_flight(async_mock_db, "similar")
+    before = (similar.misses, similar.joins)
+    diversified = await asyncio.gather(*(
+        s.get_similar_movies("60d21b4967d0d8992e610c87", limit=2, mmr_lambda=0.5) for s in services[:2]
+    ))
+    assert [m.id for m in diversified[0]] == [m.id for m in diversified[1]]
+    assert (similar.misses - before[0], similar.joins - before[1]) == (1, 1)
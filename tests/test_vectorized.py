@@ -0,0 +1,95 @@
+import numpy as np
+import scipy.sparse as sp
+
+# Testes síncronos das rotinas vetorizadas (NumPy), sem banco nem event loop
+
+
+def test_ann_index_recall_and_insertion():
+    """Testa o recall do índice LSH contra a busca exata e a inserção de novos vetores."""
+    from app.utils.ann import RandomProjectionLSH
+
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((50, 64))
+    vectors = centers[rng.integers(0, 50, 5000)] + 0.3 * rng.standard_normal((5000, 64))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    index = RandomProjectionLSH(64, n_tables=8, n_bits=10, n_probes=2)
+    index.add(vectors)
+
+    # A lista curta deve conter quase todos os 10 vizinhos exatos
+    recalls = []
+    for query in range(50):
+        candidates = set(index.candidates(vectors[query:query + 1]).tolist())
+        exact = np.argsort(-(vectors @ vectors[query]))[:10]
+        recalls.append(len(candidates.intersection(exact.tolist())) / 10)
+        assert len(candidates) < len(vectors) / 4
+    assert np.mean(recalls) > 0.9
+
+    # Vetores inseridos depois da construção também são encontrados
+    new_vector = vectors[:1] * 0.99
+    position = index.add(new_vector)[0]
+    assert position == 5000
+    assert position in index.candidates(new_vector)
+
+
+def test_batch_calculate_similarity_matches_scalar(sample_movies):
+    """Testa se a versão vetorizada de calculate_similarity dá os mesmos resultados da escalar."""
+    from app.utils.recommendation import batch_calculate_similarity, calculate_similarity
+
+    candidates = sample_movies + [
+        {"title": "Sem atributos"},
+        {"title": "Repetidos", "genres": ["Drama", "Drama"], "director": "", "actors": ["Al Pacino", "Al Pacino"]},
+    ]
+
+    for reference in sample_movies:
+        scores = batch_calculate_similarity(reference, candidates)
+        expected = [calculate_similarity(reference, candidate) for candidate in candidates]
+        assert scores.tolist() == expected
+
+
+def test_als_blocks_bounded_by_memory_budget():
+    """Testa o tamanho dos blocos do ALS e a montagem sem produto externo para linhas longas."""
+    from app.utils.matrix_factorization import als_block_ratings, _solve_block
+
+    # Blocos simultâneos (2 x bloco x threads x n_factors² floats) cabem no limite
+    assert 2 * 8 * als_block_ratings(32, 8) * 32 * 32 * 8 <= 256 * 1024 * 1024
+    assert als_block_ratings(256, 64) == 256
+
+    rng = np.random.default_rng(0)
+    ratings = sp.random(300, 200, density=0.1, random_state=0, format="csr")
+    fixed = rng.standard_normal((200, 16))
+    rows = np.arange(300)
+    einsum = _solve_block(ratings, fixed, rows, 0.1, block_ratings=ratings.nnz)
+    accumulated = _solve_block(ratings, fixed, rows, 0.1, block_ratings=1)
+    assert np.allclose(einsum, accumulated)
+
+
+def test_artifact_versions_swap_current_link(tmp_path):
+    """Testa a publicação de artefatos por link `current` e a remoção de versões antigas."""
+    import os
+    from app.utils.artifacts import ArtifactWriter, load_artifacts
+
+    path = str(tmp_path / "artifacts")
+    first = ArtifactWriter(path)
+    first.add_array("values", np.arange(3))
+    first_dir = first.commit()
+    opened = load_artifacts(path)
+    values = opened.array("values")
+
+    # A nova versão é publicada com o link já apontando para ela; a anterior fica em disco
+    second = ArtifactWriter(path)
+    second.add_array("values", np.arange(3) * 2)
+    second_dir = second.commit()
+    assert os.path.islink(os.path.join(path, "current"))
+    assert os.path.isdir(first_dir)
+    assert values.tolist() == [0, 1, 2]
+    reopened = load_artifacts(path)
+    assert reopened is not opened and reopened.path == second_dir
+    assert reopened.array("values").tolist() == [0, 2, 4]
+
+    # Depois da retenção, só a versão atual permanece
+    third = ArtifactWriter(path, retention_seconds=0)
+    third.add_array("values", np.arange(3) * 3)
+    third_dir = third.commit()
+    assert os.listdir(os.path.join(path, "versions")) == [os.path.basename(third_dir)]
+    assert load_artifacts(path).array("values").tolist() == [0, 3, 6]